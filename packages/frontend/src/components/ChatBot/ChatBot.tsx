@@ -187,6 +187,10 @@ export const Chat = () => {
                 // replaceLastMessage({author: "bot", body: body.response.replace(/%.*%/, "")});
                 if (!body.messages[0].content) throw Error("Empty message")
                 replaceLastMessage({ author: "bot", body: body.messages[0].content })
+                // long answers arrive split into several messages
+                body.messages.slice(1).forEach((message: {content?: string}) => {
+                    if (message.content) addMessage({ author: "bot", body: message.content })
+                })
             }
 
         } catch (error) {
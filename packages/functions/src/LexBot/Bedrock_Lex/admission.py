@@ -0,0 +1,155 @@
+import json
+import os
+import threading
+import time
+
+from Bedrock_Lex.metrics import put_metric
+from Bedrock_Lex.stores import get_store
+
+# Admission control in front of the agent.
+# Every intent has a priority (0 is the highest), a concurrency limit and a
+# budget for how long it may wait for a slot. Lower priority work waits while
+# higher priority work is queued, and is shed once its budget runs out.
+# Each session also gets a quota of agent calls per time window, kept in the
+# session attributes so it follows the session across containers.
+#
+# The running calls are counted in the shared state store (DynamoDB when
+# STATE_TABLE_NAME is set), so the limits hold across Lambda containers and
+# not only inside one process. There is one atomic counter per scope (the
+# session, the intent, all calls) that only counts up while it is below its
+# limit, and the waiting requests of each priority are counted the same way.
+# The TTL clears a count that a crashed container never gave back.
+# ADMISSION_RESERVED of the overall limit is kept for priority 0 work, so
+# free-text questions can't take all of it.
+DEFAULT_LIMITS = {
+    'AnalyzingIntent': {'priority': 0, 'max_concurrent': 8, 'max_queue_ms': 5000},
+    'ComparingIntent': {'priority': 0, 'max_concurrent': 8, 'max_queue_ms': 5000},
+    'OtherIntent': {'priority': 1, 'max_concurrent': 4, 'max_queue_ms': 1000},
+}
+FALLBACK_LIMIT = {'priority': 1, 'max_concurrent': 4, 'max_queue_ms': 1000}
+
+SHED_MESSAGE = "I'm getting a lot of questions right now and couldn't answer this one. Please try again in a minute."
+QUOTA_MESSAGE = "You've asked a lot of questions in a short time. Please wait a minute before asking the next one."
+
+KEY_PREFIX = "admission:"
+
+def _load_limits():
+    limits = dict(DEFAULT_LIMITS)
+    # ADMISSION_LIMITS='{"OtherIntent": {"priority": 2, "max_concurrent": 2, "max_queue_ms": 500}}'
+    limits.update(json.loads(os.getenv("ADMISSION_LIMITS", "{}")))
+    return limits
+
+
+class AdmissionController:
+    def __init__(self, limits=None, max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT", "10")),
+                 reserved=int(os.getenv("ADMISSION_RESERVED", "2")),
+                 session_quota=int(os.getenv("SESSION_QUOTA", "10")),
+                 session_window_seconds=int(os.getenv("SESSION_QUOTA_WINDOW_SECONDS", "60")),
+                 slot_ttl_seconds=int(os.getenv("ADMISSION_SLOT_TTL_SECONDS", "120")),
+                 poll_ms=int(os.getenv("ADMISSION_POLL_MS", "100")),
+                 store=None):
+        self.limits = limits if limits is not None else _load_limits()
+        self.max_concurrent = max_concurrent
+        self.reserved = reserved
+        self.session_quota = session_quota
+        self.session_window_seconds = session_window_seconds
+        self.slot_ttl_seconds = slot_ttl_seconds
+        self.poll_seconds = poll_ms / 1000
+        # None uses the shared state store
+        self.store = store
+
+        self.lock = threading.Lock()
+        # the slot keys held by the calls of this process, by (intent, session)
+        self.held = {}
+
+    def _limit(self, intent_name):
+        return self.limits.get(intent_name, FALLBACK_LIMIT)
+
+    def _store(self):
+        return self.store if self.store is not None else get_store()
+
+    def _priorities(self):
+        return {limit['priority'] for limit in self.limits.values()} | {FALLBACK_LIMIT['priority']}
+
+    def _try_acquire(self, store, intent_name, session_id, limit):
+        # the counters taken, or None when the request can't run yet
+        # don't jump ahead of higher priority work that is waiting in any container
+        if any(store.get_count(f"{KEY_PREFIX}waiting:{priority}") > 0 for priority in self._priorities() if priority < limit['priority']):
+            return None
+        # the reserved part of the overall limit is only for priority 0 work
+        overall = self.max_concurrent if limit['priority'] == 0 else max(0, self.max_concurrent - self.reserved)
+        scopes = (
+            # one agent call at a time per session
+            (f"{KEY_PREFIX}session:{session_id}", 1),
+            (f"{KEY_PREFIX}intent:{intent_name}", limit['max_concurrent']),
+            (f"{KEY_PREFIX}all", overall),
+        )
+        taken = []
+        for key, scope_limit in scopes:
+            if store.increment(key, limit=scope_limit, ttl=self.slot_ttl_seconds) is None:
+                for counter in taken:
+                    store.decrement(counter, ttl=self.slot_ttl_seconds)
+                return None
+            taken.append(key)
+        return taken
+
+    def check_session_quota(self, session_attributes, count=1):
+        # returns False when the session has no room for count calls, otherwise counts them
+        now = int(time.time())
+        calls = [int(t) for t in session_attributes.get('agentCalls', '').split(',') if t]
+        calls = [t for t in calls if now - t < self.session_window_seconds]
+        if len(calls) + count > self.session_quota:
+            return False
+        calls.extend([now] * count)
+        session_attributes['agentCalls'] = ','.join(str(t) for t in calls)
+        return True
+
+    def refund_session_quota(self, session_attributes, count=1):
+        # a shed request never reached the agent, it doesn't count against the quota
+        calls = [t for t in session_attributes.get('agentCalls', '').split(',') if t]
+        del calls[max(0, len(calls) - count):]
+        session_attributes['agentCalls'] = ','.join(calls)
+
+    def acquire(self, intent_name, session_id):
+        # returns True once the request may call the agent, False if it is shed
+        limit = self._limit(intent_name)
+        store = self._store()
+        start = time.monotonic()
+        deadline = start + limit['max_queue_ms'] / 1000
+        waiting_key = f"{KEY_PREFIX}waiting:{limit['priority']}"
+        # lower priority work in every container holds back while this counter is above 0
+        counts_as_waiting = any(priority > limit['priority'] for priority in self._priorities())
+        waiting = False
+        delay = self.poll_seconds
+        try:
+            while True:
+                keys = self._try_acquire(store, intent_name, session_id, limit)
+                remaining = deadline - time.monotonic()
+                if keys is not None or remaining <= 0:
+                    break
+                if counts_as_waiting and not waiting:
+                    store.increment(waiting_key, ttl=self.slot_ttl_seconds)
+                    waiting = True
+                # backs off, every attempt is a round trip to the store
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, 1.0)
+        finally:
+            if waiting:
+                store.decrement(waiting_key, ttl=self.slot_ttl_seconds)
+        if keys is None:
+            put_metric('AdmissionShed', 1, 'Count', dimensions={'Intent': intent_name})
+            return False
+        with self.lock:
+            self.held[(intent_name, session_id)] = keys
+        put_metric('AdmissionQueueTime', (time.monotonic() - start) * 1000, 'Milliseconds', dimensions={'Intent': intent_name})
+        return True
+
+    def release(self, intent_name, session_id):
+        with self.lock:
+            keys = self.held.pop((intent_name, session_id), [])
+        store = self._store()
+        for key in keys:
+            store.decrement(key, ttl=self.slot_ttl_seconds)
+
+
+admission_controller = AdmissionController()
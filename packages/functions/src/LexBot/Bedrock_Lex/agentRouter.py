@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+import time
+
+from Bedrock_Lex.metrics import put_metric
+
+# Routes agent calls across several (agent, alias, region) targets.
+# Targets are picked with smooth weighted round-robin. Latency and error rate
+# are tracked per target as an exponentially weighted moving average (EWMA),
+# and unhealthy targets are ejected for a while. A Lex session sticks to its
+# target so the agent keeps its conversation memory.
+#
+# AGENT_TARGETS='[{"agentId": "...", "agentAliasId": "...", "region": "us-east-1", "weight": 2, "tier": "fast"}]'
+# falls back to the agentId/agentAliasId environment variables when unset.
+
+class AgentTarget:
+    def __init__(self, agent_id, agent_alias_id, region="us-east-1", weight=1, tier="standard"):
+        self.agent_id = agent_id
+        self.agent_alias_id = agent_alias_id
+        self.region = region
+        self.weight = weight
+        # model tier of the alias, see modelTiering.py
+        self.tier = tier
+        self.key = f"{region}/{agent_id}/{agent_alias_id}"
+
+        self.current_weight = 0
+        self.latency_ewma = None
+        self.error_ewma = 0.0
+        self.ejected_until = 0
+
+    def __repr__(self) -> str:
+        return f"{self.key} (weight {self.weight}, tier {self.tier})"
+
+
+class AgentRouter:
+    def __init__(self, targets, alpha=0.2, max_error_rate=0.5, max_latency_ms=30000, eject_seconds=30):
+        assert len(targets) > 0
+        self.targets = targets
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.max_latency_ms = max_latency_ms
+        self.eject_seconds = eject_seconds
+        self.lock = threading.Lock()
+
+    def get_target(self, key):
+        for target in self.targets:
+            if target.key == key:
+                return target
+        return None
+
+    def has_tier(self, tier):
+        return any(t.tier == tier for t in self.targets)
+
+    def _healthy_targets(self, tier=None):
+        # only the targets of the tier, when there are any
+        targets = [t for t in self.targets if t.tier == tier] if tier else []
+        if not targets:
+            targets = self.targets
+        now = time.monotonic()
+        healthy = [t for t in targets if t.ejected_until <= now]
+        # never eject everything, a degraded target is better than none
+        return healthy if healthy else targets
+
+    def pick(self, sticky_key=None, tier=None):
+        with self.lock:
+            healthy = self._healthy_targets(tier)
+            sticky = self.get_target(sticky_key) if sticky_key else None
+            if sticky is not None and sticky in healthy:
+                return sticky
+            # smooth weighted round-robin (same scheme as nginx)
+            total = sum(t.weight for t in healthy)
+            for target in healthy:
+                target.current_weight += target.weight
+            best = max(healthy, key=lambda t: t.current_weight)
+            best.current_weight -= total
+            return best
+
+    def pick_alternate(self, target):
+        # another healthy target for hedged requests, or None if there is none
+        # (a second request in the same agent session would share its memory)
+        with self.lock:
+            others = [t for t in self._healthy_targets(target.tier) if t is not target]
+        if not others:
+            return None
+        return min(others, key=lambda t: t.latency_ewma if t.latency_ewma is not None else 0)
+
+    def record(self, target, success, latency_ms):
+        with self.lock:
+            alpha = self.alpha
+            target.error_ewma = alpha * (0.0 if success else 1.0) + (1 - alpha) * target.error_ewma
+            if target.latency_ewma is None:
+                target.latency_ewma = latency_ms
+            else:
+                target.latency_ewma = alpha * latency_ms + (1 - alpha) * target.latency_ewma
+            unhealthy = target.error_ewma > self.max_error_rate or target.latency_ewma > self.max_latency_ms
+            if unhealthy and target.ejected_until <= time.monotonic():
+                print(f"Ejecting agent target {target.key}: error rate {target.error_ewma:.2f}, latency {target.latency_ewma:.0f} ms")
+                target.ejected_until = time.monotonic() + self.eject_seconds
+                # start from a clean slate when the target comes back
+                target.error_ewma = 0.0
+                target.latency_ewma = None
+                put_metric('AgentTargetEjected', 1, 'Count', dimensions={'Target': target.key})
+        put_metric('AgentTargetLatency', latency_ms, 'Milliseconds', dimensions={'Target': target.key})
+
+
+def load_targets():
+    targets = json.loads(os.getenv("AGENT_TARGETS", "[]"))
+    if targets:
+        return [
+            AgentTarget(t['agentId'], t['agentAliasId'], t.get('region', 'us-east-1'), t.get('weight', 1), t.get('tier', 'standard'))
+            for t in targets
+        ]
+    return [AgentTarget(os.getenv("agentId"), os.getenv("agentAliasId"), os.getenv("AGENT_REGION", "us-east-1"))]
+
+agent_router = AgentRouter(
+    load_targets(),
+    max_error_rate=float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5")),
+    max_latency_ms=int(os.getenv("ROUTER_MAX_LATENCY_MS", "30000")),
+    eject_seconds=int(os.getenv("ROUTER_EJECT_SECONDS", "30")),
+)
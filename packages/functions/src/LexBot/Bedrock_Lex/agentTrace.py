@@ -0,0 +1,116 @@
+import os
+import random
+import time
+
+from Bedrock_Lex.metrics import put_metric
+from Bedrock_Lex.rateBudget import MinuteBudget
+
+# Opt-in agent traces for a latency and token breakdown of agent calls.
+# A sampled call is made with enableTrace, the trace events in its stream are
+# parsed into time spent in pre-processing, orchestration and post-processing
+# model invocations, knowledge base retrieval and other tool calls, plus the
+# token usage, and emitted as metrics.
+# AGENT_TRACE_SAMPLE_RATE picks the share of calls (0 is off) and
+# AGENT_TRACE_MAX_PER_MINUTE caps them, trace events make the stream larger.
+# Durations come from the trace metadata when the agent sends it, otherwise
+# from the arrival times of the matching input/output events.
+PHASES = {
+    'preProcessingTrace': 'preProcessing',
+    'orchestrationTrace': 'orchestration',
+    'postProcessingTrace': 'postProcessing',
+}
+
+class TraceSampler:
+    def __init__(self, sample_rate=0.0, max_per_minute=30):
+        self.sample_rate = sample_rate
+        self.budget = MinuteBudget(max_per_minute)
+
+    def should_trace(self):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return False
+        return self.budget.take()
+
+
+class TraceBreakdown:
+    # collects the trace events of one agent call
+    def __init__(self, start):
+        self.start = start
+        self.times = {'preProcessing': 0.0, 'orchestration': 0.0, 'postProcessing': 0.0, 'retrieval': 0.0, 'tools': 0.0}
+        self.model_calls = 0
+        self.retrievals = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.failures = 0
+        self.trace_events = 0
+        # open spans: trace id -> arrival in ms
+        self.model_started = {}
+        self.invocation_started = {}
+
+    def _elapsed_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def add(self, event):
+        trace = (event.get('trace') or {}).get('trace') or {}
+        now = self._elapsed_ms()
+        self.trace_events += 1
+        if 'failureTrace' in trace:
+            self.failures += 1
+        for key, phase in PHASES.items():
+            if key in trace:
+                self._add_step(phase, trace[key], now)
+
+    def _add_step(self, phase, step, now):
+        model_input = step.get('modelInvocationInput')
+        if model_input is not None:
+            self.model_started[model_input.get('traceId')] = now
+        model_output = step.get('modelInvocationOutput')
+        if model_output is not None:
+            self.model_calls += 1
+            metadata = model_output.get('metadata') or {}
+            usage = metadata.get('usage') or {}
+            self.input_tokens += usage.get('inputTokens') or 0
+            self.output_tokens += usage.get('outputTokens') or 0
+            started = self.model_started.pop(model_output.get('traceId'), None)
+            self.times[phase] += self._duration(metadata, started, now)
+        invocation = step.get('invocationInput')
+        if invocation is not None:
+            self.invocation_started[invocation.get('traceId')] = (invocation.get('invocationType'), now)
+        observation = step.get('observation')
+        if observation is not None and observation.get('type') not in (None, 'FINISH', 'ASK_USER', 'REPROMPT'):
+            invocation_type, started = self.invocation_started.pop(observation.get('traceId'), (None, None))
+            duration = self._duration(observation.get('metadata') or {}, started, now)
+            if observation.get('type') == 'KNOWLEDGE_BASE' or invocation_type == 'KNOWLEDGE_BASE':
+                self.retrievals += 1
+                self.times['retrieval'] += duration
+            else:
+                self.times['tools'] += duration
+
+    def _duration(self, metadata, started, now):
+        if metadata.get('totalTimeMs') is not None:
+            return float(metadata['totalTimeMs'])
+        return now - started if started is not None else 0.0
+
+    def emit(self, total_ms):
+        accounted = sum(self.times.values())
+        for component, ms in self.times.items():
+            put_metric('AgentTraceTime', ms, 'Milliseconds', dimensions={'Component': component})
+        # streaming, network and whatever the trace does not cover
+        put_metric('AgentTraceTime', max(0.0, total_ms - accounted), 'Milliseconds', dimensions={'Component': 'other'})
+        put_metric('AgentTraceTokens', self.input_tokens, 'Count', dimensions={'Direction': 'input'})
+        put_metric('AgentTraceTokens', self.output_tokens, 'Count', dimensions={'Direction': 'output'})
+        print("Agent trace breakdown: ", {
+            'totalMs': round(total_ms, 1),
+            **{f"{component}Ms": round(ms, 1) for component, ms in self.times.items()},
+            'modelCalls': self.model_calls,
+            'retrievals': self.retrievals,
+            'inputTokens': self.input_tokens,
+            'outputTokens': self.output_tokens,
+            'failures': self.failures,
+            'traceEvents': self.trace_events,
+        })
+
+
+trace_sampler = TraceSampler(
+    sample_rate=float(os.getenv("AGENT_TRACE_SAMPLE_RATE", "0")),
+    max_per_minute=int(os.getenv("AGENT_TRACE_MAX_PER_MINUTE", "30")),
+)
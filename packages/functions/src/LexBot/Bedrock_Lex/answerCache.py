@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+import time
+
+from Bedrock_Lex import recorder
+from Bedrock_Lex.stores import get_store
+
+# Cache of agent answers keyed on the rendered prompt.
+# Entries are kept for ANSWER_CACHE_STALE_SECONDS so that an old answer can
+# still be served when the agent is unavailable.
+# Within ANSWER_CACHE_GRACE_SECONDS past the TTL an answer is still served
+# while it is refreshed in the background (stale-while-revalidate).
+ANSWER_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+GRACE_SECONDS = int(os.getenv("ANSWER_CACHE_GRACE_SECONDS", "900"))
+STALE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_STALE_SECONDS", "86400"))
+# optional JSON file of {cache key: answer} computed ahead of time
+PRECOMPUTED_ANSWERS_PATH = os.getenv("PRECOMPUTED_ANSWERS_PATH", "")
+
+_precomputed = None
+
+def cache_key(prompt):
+    normalized = " ".join(prompt.split()).lower()
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+def put_answer(prompt, answer):
+    get_store().put(f"answer:{cache_key(prompt)}", {'answer': answer, 'storedAt': time.time()}, ttl=STALE_TTL_SECONDS)
+
+def get_entry(prompt):
+    # returns {'answer': ..., 'storedAt': ...} or None
+    entry = get_store().get(f"answer:{cache_key(prompt)}")
+    if entry is not None:
+        recorder.record_cached_answer(prompt, entry)
+    return entry
+
+def get_answer(prompt, max_age=ANSWER_TTL_SECONDS):
+    entry = get_entry(prompt)
+    if entry is None or time.time() - entry['storedAt'] > max_age:
+        return None
+    return entry['answer']
+
+def lookup(prompt):
+    # returns (answer, state, age in seconds), state is 'fresh', 'stale'
+    # (within the grace window) or 'miss'
+    entry = get_entry(prompt)
+    if entry is None:
+        return None, 'miss', None
+    age = time.time() - entry['storedAt']
+    if age <= ANSWER_TTL_SECONDS:
+        return entry['answer'], 'fresh', age
+    if age <= ANSWER_TTL_SECONDS + GRACE_SECONDS:
+        return entry['answer'], 'stale', age
+    return None, 'miss', age
+
+def load_precomputed_answers():
+    global _precomputed
+    if _precomputed is None:
+        _precomputed = {}
+        if PRECOMPUTED_ANSWERS_PATH and os.path.exists(PRECOMPUTED_ANSWERS_PATH):
+            with open(PRECOMPUTED_ANSWERS_PATH) as f:
+                _precomputed = json.load(f)
+            print(f"Loaded {len(_precomputed)} precomputed answers")
+    return _precomputed
+
+def get_fallback_answer(prompt):
+    # returns (answer, source) where source is 'cache' or 'precomputed', or (None, None)
+    entry = get_entry(prompt)
+    if entry is not None:
+        return entry['answer'], 'cache'
+    answer = load_precomputed_answers().get(cache_key(prompt))
+    if answer is not None:
+        return answer, 'precomputed'
+    return None, None
@@ -0,0 +1,99 @@
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from Bedrock_Lex.agentRouter import agent_router
+from Bedrock_Lex.answerCache import put_answer
+from Bedrock_Lex.invokeBedrockAgent import call_target
+from Bedrock_Lex.stores import get_store
+
+# Asynchronous fulfillment: the prompt is put on a job queue and the answer
+# is written to the state store, where the next Lex turn picks it up.
+# With JOB_QUEUE_URL set, jobs go to SQS and are run by the worker Lambda,
+# otherwise they run on a thread pool in this process (local runs and tests).
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+CHECK_UTTERANCES = ('check', 'status', 'is it ready')
+
+def is_async_enabled():
+    return os.getenv("ASYNC_FULFILLMENT", "false") == "true"
+
+def _job_key(job_id):
+    return f"job:{job_id}"
+
+def run_job(job):
+    store = get_store()
+    try:
+        # the worker may run with another target list, so fall back to routing anew
+        target = agent_router.get_target(job['target']) or agent_router.pick()
+        result = call_target(target, job['sessionId'], job['prompt'], hedgeable=job.get('hedgeable', False))
+        if not result.success:
+            print("Async job failed: ", job['jobId'], result.error)
+            store.put(_job_key(job['jobId']), {'status': 'failed', 'error': result.error}, ttl=JOB_TTL_SECONDS)
+            return
+        # cached like a synchronous answer, keyed on the question rather than the agent prompt
+        if job.get('cachePrompt') is not None and not result.truncated:
+            put_answer(job['cachePrompt'], result.completion)
+        store.put(_job_key(job['jobId']), {'status': 'done', 'answer': result.completion, 'agentMs': result.agent_ms, 'target': result.answered_by.key}, ttl=JOB_TTL_SECONDS)
+    except Exception as e:
+        print("Async job failed: ", job['jobId'], e)
+        store.put(_job_key(job['jobId']), {'status': 'failed', 'error': str(e)}, ttl=JOB_TTL_SECONDS)
+
+
+class InProcessJobQueue:
+    def __init__(self, max_workers=4, runner=run_job):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.runner = runner
+
+    def enqueue(self, job):
+        self.executor.submit(self.runner, job)
+
+
+class SQSJobQueue:
+    def __init__(self, queue_url):
+        import boto3
+        self.queue_url = queue_url
+        self.client = boto3.client("sqs")
+
+    def enqueue(self, job):
+        self.client.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(job))
+
+
+_queue = None
+
+def get_job_queue():
+    global _queue
+    if _queue is None:
+        queue_url = os.getenv("JOB_QUEUE_URL")
+        _queue = SQSJobQueue(queue_url) if queue_url else InProcessJobQueue()
+    return _queue
+
+def set_job_queue(queue):
+    global _queue
+    _queue = queue
+
+def submit_job(target_key, session_id, prompt, cache_prompt=None, hedgeable=False):
+    job = {
+        'jobId': str(uuid.uuid4()),
+        'target': target_key,
+        'sessionId': session_id,
+        'prompt': prompt,
+        'cachePrompt': cache_prompt,
+        'hedgeable': hedgeable,
+        'submittedAt': time.time(),
+    }
+    # mark the job as pending first so a fast worker can't be overwritten
+    get_store().put(_job_key(job['jobId']), {'status': 'pending'}, ttl=JOB_TTL_SECONDS)
+    get_job_queue().enqueue(job)
+    return job['jobId']
+
+def get_job_result(job_id):
+    # returns {'status': 'pending' | 'done' | 'failed', ...} or None if unknown
+    return get_store().get(_job_key(job_id))
+
+def delete_job_result(job_id):
+    get_store().delete(_job_key(job_id))
+
+def is_check_request(text):
+    return text is not None and text.strip().lower().rstrip('.!?') in CHECK_UTTERANCES
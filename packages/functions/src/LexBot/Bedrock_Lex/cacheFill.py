@@ -0,0 +1,93 @@
+import os
+import time
+import uuid
+
+from Bedrock_Lex.agentRouter import agent_router
+from Bedrock_Lex.answerCache import cache_key, get_answer, put_answer
+from Bedrock_Lex.asyncJobs import InProcessJobQueue, SQSJobQueue
+from Bedrock_Lex.invokeBedrockAgent import AgentUnavailableError, call_target
+from Bedrock_Lex.metrics import put_metric
+from Bedrock_Lex.stores import get_store
+
+# Background calls that fill the answer cache: speculative prefetches and
+# refreshes of stale answers. They share one queue (PREFETCH_QUEUE_URL, or a
+# small thread pool locally) whose concurrency caps the extra agent load, and
+# an in-flight marker in the state store so a prompt is fetched once at a time.
+FILL_MAX_CONCURRENT = int(os.getenv("CACHE_FILL_MAX_CONCURRENT", "2"))
+IN_FLIGHT_TTL_SECONDS = 120
+# how long a turn waits on a running fill of its prompt before calling the agent itself
+FILL_WAIT_SECONDS = float(os.getenv("CACHE_FILL_WAIT_SECONDS", "5"))
+FILL_POLL_SECONDS = 0.2
+
+def _in_flight_key(prompt):
+    return f"fill:{cache_key(prompt)}"
+
+def run_cache_fill(job):
+    # job['kind'] is 'prefetch' or 'refresh'
+    prompt = job['prompt']
+    outcome = 'error'
+    try:
+        if get_answer(prompt) is not None:
+            outcome = 'cached'
+            return
+        target = agent_router.get_target(job['target']) or agent_router.pick()
+        result = call_target(target, job['sessionId'], prompt, hedgeable=True)
+        if result.success and not result.truncated:
+            put_answer(prompt, result.completion)
+            outcome = 'stored'
+        elif result.truncated:
+            outcome = 'truncated'
+    except AgentUnavailableError:
+        outcome = 'unavailable'
+    except Exception as e:
+        print("Cache fill failed: ", e)
+    finally:
+        get_store().delete(_in_flight_key(prompt))
+        put_metric('CacheFillCompleted', 1, 'Count', dimensions={'Kind': job['kind'], 'Outcome': outcome})
+
+
+_queue = None
+
+def get_fill_queue():
+    global _queue
+    if _queue is None:
+        queue_url = os.getenv("PREFETCH_QUEUE_URL")
+        _queue = SQSJobQueue(queue_url) if queue_url else InProcessJobQueue(FILL_MAX_CONCURRENT, runner=run_cache_fill)
+    return _queue
+
+def set_fill_queue(queue):
+    global _queue
+    _queue = queue
+
+def is_in_flight(prompt):
+    return get_store().get(_in_flight_key(prompt)) is not None
+
+def wait_for_fill(prompt, timeout=FILL_WAIT_SECONDS):
+    # returns the filled answer, or None when the fill failed or is still running at the timeout
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(FILL_POLL_SECONDS)
+        if not is_in_flight(prompt):
+            return get_answer(prompt)
+    return get_answer(prompt)
+
+def start_fill(kind, prompt):
+    # returns False when a fill of the prompt is already running
+    store = get_store()
+    in_flight_key = _in_flight_key(prompt)
+    # claimed atomically, concurrent turns in other containers may ask for the same prompt
+    if not store.add(in_flight_key, {'kind': kind, 'startedAt': time.time()}, ttl=IN_FLIGHT_TTL_SECONDS):
+        return False
+    try:
+        get_fill_queue().enqueue({
+            'kind': kind,
+            'target': agent_router.pick().key,
+            # a fresh agent session, no user's agent memory is touched
+            'sessionId': f"{kind}-{uuid.uuid4()}",
+            'prompt': prompt,
+        })
+    except Exception:
+        # nothing will run the fill, don't keep others from starting it
+        store.delete(in_flight_key)
+        raise
+    return True
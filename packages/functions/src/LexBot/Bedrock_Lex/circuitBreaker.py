@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import deque
+
+from Bedrock_Lex.metrics import put_metric
+
+# Circuit breaker with closed, open and half-open states.
+# The breaker opens when the error rate or the rate of slow calls over the
+# last window_size calls goes over the threshold. After open_seconds it lets
+# a few probe calls through (half-open) and closes again if they succeed.
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitBreaker:
+    def __init__(self, name, window_size=20, min_calls=5, error_rate=0.5,
+                 slow_call_ms=20000, slow_call_rate=0.5, open_seconds=30, half_open_calls=1):
+        self.name = name
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_ms = slow_call_ms
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+
+        self.state = CLOSED
+        self.opened_at = 0
+        self.probes_in_flight = 0
+        # each call is recorded as (failed, slow)
+        self.calls = deque(maxlen=window_size)
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        with self.lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    return False
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self.probes_in_flight >= self.half_open_calls:
+                    return False
+                self.probes_in_flight += 1
+            return True
+
+    def record(self, success, latency_ms):
+        slow = latency_ms >= self.slow_call_ms
+        with self.lock:
+            if self.state == HALF_OPEN:
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+                if success and not slow:
+                    self._transition(CLOSED)
+                else:
+                    self._transition(OPEN)
+                return
+            self.calls.append((not success, slow))
+            if self.state == CLOSED and len(self.calls) >= self.min_calls:
+                failures = sum(1 for failed, _ in self.calls if failed)
+                slow_calls = sum(1 for _, was_slow in self.calls if was_slow)
+                if failures / len(self.calls) >= self.error_rate or slow_calls / len(self.calls) >= self.slow_call_rate:
+                    self._transition(OPEN)
+
+    def _transition(self, state):
+        # must be called with the lock held
+        print(f"Circuit breaker {self.name}: {self.state} -> {state}")
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        elif state == HALF_OPEN:
+            self.probes_in_flight = 0
+        elif state == CLOSED:
+            self.calls.clear()
+        put_metric('CircuitBreakerTransition', 1, 'Count', dimensions={'Breaker': self.name, 'State': state})
+        put_metric('CircuitBreakerOpen', 1 if state == OPEN else 0, 'Count', dimensions={'Breaker': self.name})
@@ -0,0 +1,147 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from Bedrock_Lex.invokeBedrockAgent import get_client
+from Bedrock_Lex.knowledgeBase import PROGRAMME_NAME, SCHOOL_NAME, UNIVERSITY_NAME, VOCATIONAL_NAME
+from Bedrock_Lex.metrics import put_metric
+
+# Offline digests of the review reports (built by tools/buildDigests.py).
+# A digest holds the key judgement, strengths and recommendations of one
+# institution for one standard. Analyze questions about a single institution
+# can then be answered by a plain model call with the digest in the prompt,
+# no agent orchestration and no knowledge base retrieval.
+# Steps opt in with a standard_slot, DIGEST_FULFILLMENT turns the backend on
+# and DIGEST_DB_PATH is the SQLite file shipped with the function.
+DIGEST_FULFILLMENT = os.getenv("DIGEST_FULFILLMENT", "false") == "true"
+DIGEST_DB_PATH = os.getenv("DIGEST_DB_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'digests.db')
+DIGEST_MODEL_ID = os.getenv("DIGEST_MODEL_ID", "anthropic.claude-3-haiku-20240307-v1:0")
+DIGEST_REGION = os.getenv("DIGEST_REGION", "us-east-1")
+DIGEST_MAX_TOKENS = int(os.getenv("DIGEST_MAX_TOKENS", "1500"))
+
+# the report metadata keys that identify an institution
+NAME_KEYS = (SCHOOL_NAME, UNIVERSITY_NAME, PROGRAMME_NAME, VOCATIONAL_NAME)
+NOT_NAME_CHARS = re.compile(r"[^a-z0-9]+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS digests (
+    institution TEXT NOT NULL,
+    standard TEXT NOT NULL,
+    name TEXT NOT NULL,
+    judgement TEXT,
+    text TEXT NOT NULL,
+    sources TEXT NOT NULL,
+    PRIMARY KEY (institution, standard)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID;
+"""
+
+def normalize(text):
+    return NOT_NAME_CHARS.sub(" ", text.lower()).strip()
+
+def institution_key(metadata):
+    # the same key for the report metadata and for the slots of a question
+    return "|".join(f"{key}={normalize(metadata[key])}" for key in NAME_KEYS if metadata.get(key))
+
+class DigestQuery:
+    # metadata: {metadata key: name}, one institution; standard: the slot value
+    def __init__(self, metadata, standard):
+        self.metadata = metadata
+        self.standard = standard
+
+
+class DigestStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self.meta = dict(self.connection.execute("SELECT key, value FROM meta").fetchall())
+        self.version = self.meta.get('version')
+
+    def get(self, metadata, standard):
+        # returns (name, text) or None
+        with self.lock:
+            return self.connection.execute(
+                "SELECT name, text FROM digests WHERE institution = ? AND standard = ?",
+                (institution_key(metadata), normalize(standard)),
+            ).fetchone()
+
+
+_store = None
+_store_loaded = False
+
+def get_digest_store():
+    # None when there is no digest file
+    global _store, _store_loaded
+    if not _store_loaded:
+        _store_loaded = True
+        if os.path.exists(DIGEST_DB_PATH):
+            _store = DigestStore(DIGEST_DB_PATH)
+            print(f"Loaded digests {_store.version} from {DIGEST_DB_PATH}")
+        else:
+            print("No digest file at ", DIGEST_DB_PATH)
+    return _store
+
+def is_enabled():
+    return DIGEST_FULFILLMENT and get_digest_store() is not None
+
+# Replaces invoke_model for offline runs (DIGEST_STUB=true), a transport takes
+# the model id and the request body and returns the response body.
+_transport = None
+
+def set_transport(transport):
+    global _transport
+    _transport = transport
+
+if os.getenv("DIGEST_STUB") == "true":
+    from Bedrock_Lex.stubAgent import StubModel
+    set_transport(StubModel.from_env())
+
+def build_prompt(name, standard, digest, prompt, version):
+    return (
+        f"Review digest of {name} for {standard} (digest {version}), "
+        f"extracted from the BQA review reports:\n{digest}\n\n"
+        f"Answer only from the digest above.\n\n{prompt}"
+    )
+
+def invoke_model(prompt):
+    body = {
+        'anthropic_version': 'bedrock-2023-05-31',
+        'max_tokens': DIGEST_MAX_TOKENS,
+        'messages': [{'role': 'user', 'content': [{'type': 'text', 'text': prompt}]}],
+    }
+    if _transport is not None:
+        return _transport(DIGEST_MODEL_ID, body)
+    response = get_client(DIGEST_REGION, "bedrock-runtime").invoke_model(
+        modelId=DIGEST_MODEL_ID,
+        contentType='application/json',
+        accept='application/json',
+        body=json.dumps(body),
+    )
+    return json.loads(response['body'].read())
+
+def answer_from_digest(query, prompt):
+    # returns the answer, or None when the agent should answer instead
+    store = get_digest_store()
+    row = store.get(query.metadata, query.standard)
+    put_metric('DigestLookup', 1, 'Count', dimensions={'Outcome': 'hit' if row is not None else 'missing'})
+    if row is None:
+        return None
+    name, digest = row
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        response = invoke_model(build_prompt(name, query.standard, digest, prompt, store.version))
+        outcome = 'success'
+        return "".join(part['text'] for part in response['content'] if part.get('type') == 'text')
+    except ClientError as e:
+        print("Error when invoking the digest model: ", e)
+        return None
+    finally:
+        put_metric('DigestAnswerLatency', (time.perf_counter() - start) * 1000, 'Milliseconds',
+                   dimensions={'Outcome': outcome}, properties={'digestVersion': store.version, 'digestChars': len(digest)})
@@ -0,0 +1,89 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Bedrock_Lex import recorder
+from Bedrock_Lex.admission import admission_controller
+from Bedrock_Lex.agentRouter import agent_router
+from Bedrock_Lex.answerCache import get_fallback_answer, lookup, put_answer
+from Bedrock_Lex.cacheFill import start_fill
+from Bedrock_Lex.invokeBedrockAgent import AgentUnavailableError, call_target
+from Bedrock_Lex.metrics import put_metric
+from Bedrock_Lex.slotValues import FULL_REPORT
+
+# One-shot full report of an institution.
+# The prompts of the aspects/standards run concurrently, at most
+# FULL_REPORT_MAX_CONCURRENT at a time, sections that are in the answer cache
+# are reused, and the answers are put together as one report. The wall-clock
+# time is close to the slowest sections instead of the sum of all of them.
+# Every section that calls the agent takes its own admission slot and counts
+# against the session quota.
+MAX_CONCURRENT = max(1, int(os.getenv("FULL_REPORT_MAX_CONCURRENT", "3")))
+SECTION_FAILED = "This section could not be generated right now, please ask for it again later."
+
+class FullReport:
+    # aspect_slot: the slot that picks one aspect, its options are the sections
+    # name_slot: the slot with the institution's name, used in the title
+    def __init__(self, aspect_slot, aspects, name_slot):
+        self.aspect_slot = aspect_slot
+        self.aspects = aspects
+        self.name_slot = name_slot
+
+    def is_requested(self, slots):
+        # also when the step does not ask for the aspect at all
+        return slots.get(self.aspect_slot, FULL_REPORT) == FULL_REPORT
+
+def fetch_section(intent_name, session_id, index, prompt):
+    # returns (answer, source, milliseconds)
+    start = time.perf_counter()
+    answer, state, _ = lookup(prompt)
+    if state == 'stale':
+        start_fill('refresh', prompt)
+    if answer is not None:
+        return answer, 'cache', (time.perf_counter() - start) * 1000
+    # one agent session per section, an agent session takes one call at a time
+    section_session_id = f"{session_id}-report-{index}"
+    if not admission_controller.acquire(intent_name, section_session_id):
+        return SECTION_FAILED, 'shed', (time.perf_counter() - start) * 1000
+    try:
+        # a section prompt stands on its own, another target can answer it
+        result = call_target(agent_router.pick(), section_session_id, prompt, hedgeable=True)
+        if result.success and not result.truncated:
+            put_answer(prompt, result.completion)
+        answer, source = (result.completion, 'agent') if result.success else (SECTION_FAILED, 'failed')
+    except AgentUnavailableError:
+        answer, source = get_fallback_answer(prompt)
+        if answer is None:
+            answer, source = SECTION_FAILED, 'failed'
+    except Exception as e:
+        print("Full report section failed: ", e)
+        answer, source = SECTION_FAILED, 'failed'
+    finally:
+        admission_controller.release(intent_name, section_session_id)
+    return answer, source, (time.perf_counter() - start) * 1000
+
+def build_report(intent_name, session_id, title, sections):
+    # sections: [(heading, prompt)], returns the assembled report and the
+    # number of sections that did not reach the agent (cached or shed)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_CONCURRENT, len(sections)))) as executor:
+        # the sections of a recorded turn go into its cassette
+        fetch = recorder.in_current_cassette(fetch_section)
+        futures = [executor.submit(fetch, intent_name, session_id, i, prompt) for i, (_, prompt) in enumerate(sections)]
+        results = [future.result() for future in futures]
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    parts = [f"{title}:"]
+    for (heading, _), (answer, _, _) in zip(sections, results):
+        parts.append(f"{heading.strip()}:\n{answer.strip()}")
+    sources = [source for _, source, _ in results]
+    put_metric('FullReportTime', wall_ms, 'Milliseconds', properties={
+        'sections': len(sections),
+        'cachedSections': sources.count('cache'),
+        'failedSections': sources.count('failed'),
+        'shedSections': sources.count('shed'),
+        # the parallel speed-up is sumSectionMs / FullReportTime
+        'slowestSectionMs': max(ms for _, _, ms in results),
+        'sumSectionMs': sum(ms for _, _, ms in results),
+    })
+    return "\n\n".join(parts), sources.count('cache') + sources.count('shed')
@@ -0,0 +1,143 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from Bedrock_Lex.metrics import put_metric
+from Bedrock_Lex.rateBudget import MinuteBudget
+
+# Hedged agent requests.
+# When the first attempt has not produced a chunk within a percentile of the
+# recent time-to-first-chunk, a second attempt is started on another target.
+# With a single target nothing is hedged, and neither is a turn that relies on
+# the agent's memory of its session (see call_target). The first stream to
+# produce a chunk is used and the other one is closed. A per-minute budget caps
+# the extra load.
+
+class _Attempt:
+    def __init__(self, index, open_stream, ready):
+        self.index = index
+        self.open_stream = open_stream
+        self.ready = ready
+        self.stream = None
+        self.iterator = None
+        # the events up to and including the first chunk
+        self.head = []
+        self.cancelled = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        try:
+            stream = self.open_stream()
+            with self.lock:
+                self.stream = stream
+            self.iterator = iter(stream)
+            # trace events come before the answer, only a chunk wins the race
+            for event in self.iterator:
+                self.head.append(event)
+                if "chunk" in event or self.cancelled:
+                    break
+        except Exception as e:
+            self.ready.put((self, e))
+            return
+        with self.lock:
+            if self.cancelled:
+                self._close()
+                return
+        self.ready.put((self, None))
+
+    def _close(self):
+        if self.stream is not None and hasattr(self.stream, 'close'):
+            try:
+                self.stream.close()
+            except ValueError:
+                # a generator (the stub agent) still waiting for its first event
+                # can't be closed from here, _run closes it once it returns
+                pass
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            self._close()
+
+    def events(self):
+        try:
+            yield from self.head
+            yield from self.iterator
+        finally:
+            # also when the reader stops early
+            self._close()
+
+
+class Hedger:
+    def __init__(self, enabled=False, percentile=95, min_samples=20, window_size=200, budget_per_minute=10):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.samples = deque(maxlen=window_size)
+        self.budget = MinuteBudget(budget_per_minute)
+        self.lock = threading.Lock()
+
+    def record_time_to_first_chunk(self, ms):
+        with self.lock:
+            self.samples.append(ms)
+        put_metric('AgentTimeToFirstChunk', ms, 'Milliseconds')
+
+    def hedge_delay(self):
+        # seconds to wait before hedging, None until there are enough samples
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return ordered[index] / 1000
+
+    def stream(self, open_primary, open_secondary):
+        # returns (index, events) of whichever attempt produces a chunk first,
+        # index is 0 for the primary and 1 for the hedge
+        delay = self.hedge_delay()
+        if delay is None:
+            return 0, open_primary()
+        ready = queue.Queue()
+        attempts = [_Attempt(0, open_primary, ready)]
+        attempts[0].start()
+        try:
+            reported = ready.get(timeout=delay)
+        except queue.Empty:
+            reported = None
+            if self.budget.take():
+                put_metric('HedgeSent', 1, 'Count')
+                attempts.append(_Attempt(1, open_secondary, ready))
+                attempts[1].start()
+
+        pending = len(attempts)
+        while True:
+            if reported is None:
+                reported = ready.get()
+            attempt, error = reported
+            if error is None:
+                winner = attempt
+                break
+            # one attempt failed, wait for the other one if there is one
+            pending -= 1
+            if pending == 0:
+                raise error
+            reported = None
+
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.cancel()
+        if len(attempts) > 1:
+            put_metric('HedgeWon', 1 if winner.index == 1 else 0, 'Count')
+        return winner.index, winner.events()
+
+
+hedger = Hedger(
+    enabled=os.getenv("HEDGING_ENABLED", "false") == "true",
+    percentile=float(os.getenv("HEDGE_PERCENTILE", "95")),
+    budget_per_minute=int(os.getenv("HEDGE_BUDGET_PER_MINUTE", "10")),
+)
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import time
+
+from Bedrock_Lex.metrics import put_metric
+from Bedrock_Lex.stores import get_store
+
+# Idempotent turns: when Lex or a client retries a slow turn, the retry must
+# not call the agent a second time.
+# Every turn is keyed on the session, the turn number and the resolved slots.
+# The first invocation claims the key, a retry that arrives while it is still
+# running waits for its response, a retry after it finished gets the stored
+# response. The turn number is a session attribute that each response bumps,
+# so asking the same question again on a later turn is a new turn.
+# Off by default: it costs a conditional write and a put of the response on
+# every turn (IDEMPOTENCY_ENABLED=true turns it on).
+ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "false") == "true"
+# how long a claim holds when its invocation dies, the Lambda timeout
+IN_FLIGHT_SECONDS = int(os.getenv("IDEMPOTENCY_IN_FLIGHT_SECONDS", "60"))
+RESULT_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_RESULT_TTL_SECONDS", "300"))
+# Lex waits this long for the fulfillment Lambda
+LEX_TIMEOUT_SECONDS = 30
+# a waiting retry answers "still working" well before Lex gives up on it
+WAIT_SECONDS = min(float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "8")), LEX_TIMEOUT_SECONDS / 2)
+POLL_SECONDS = float(os.getenv("IDEMPOTENCY_POLL_MS", "200")) / 1000
+TURN_ATTRIBUTE = 'turn'
+
+_store = None
+
+def is_enabled():
+    return ENABLED
+
+def get_result_store():
+    # the shared state store unless a tool or test swapped in its own
+    return _store if _store is not None else get_store()
+
+def set_result_store(store):
+    global _store
+    _store = store
+
+def request_key(request, turn):
+    slots = {name: request.get_slot(name) for name in sorted(request.slots)}
+    identity = [request.session_id, turn, request.intent_name, request.input_transcript, slots]
+    return "turn:" + hashlib.sha256(json.dumps(identity).encode()).hexdigest()
+
+def wait_for_result(store, key):
+    # returns (entry, outcome), entry is None when there is nothing to reuse
+    entry = store.get(key)
+    if entry is not None and entry['status'] == 'done':
+        return entry, 'stored'
+    deadline = time.time() + WAIT_SECONDS
+    while entry is not None and time.time() < deadline:
+        time.sleep(POLL_SECONDS)
+        entry = store.get(key)
+        if entry is not None and entry['status'] == 'done':
+            return entry, 'waited'
+    # the first invocation failed (the claim is gone, the retry runs the turn)
+    # or is taking too long
+    return None, 'failed' if entry is None else 'timeout'
+
+def run_once(request, handler, still_working):
+    # still_working(request) is the response of a retry whose first invocation
+    # is still running when the wait is over
+    store = get_result_store()
+    turn = int(request.session_attributes.get(TURN_ATTRIBUTE) or 0)
+    key = request_key(request, turn)
+
+    if not store.add(key, {'status': 'pending', 'startedAt': time.time()}, ttl=IN_FLIGHT_SECONDS):
+        start = time.perf_counter()
+        entry, outcome = wait_for_result(store, key)
+        put_metric('IdempotentRetry', 1, 'Count', dimensions={'Outcome': outcome},
+                   properties={'waitMs': (time.perf_counter() - start) * 1000})
+        if entry is not None:
+            print("Retried turn served from the stored response: ", request.session_id, turn)
+            return entry['response']
+        if outcome == 'timeout':
+            return still_working(request)
+
+    try:
+        response = handler(request)
+        # some responses (the "didn't understand" prompt) carry no session attributes
+        response['sessionState'].setdefault('sessionAttributes', {})[TURN_ATTRIBUTE] = str(turn + 1)
+        store.put(key, {'status': 'done', 'response': response}, ttl=RESULT_TTL_SECONDS)
+    except Exception:
+        # let a retry run the turn again
+        store.delete(key)
+        raise
+    return response
@@ -1,29 +1,217 @@
+import os
+import time
+
 from botocore.exceptions import ClientError
 import boto3
+
+from Bedrock_Lex.agentRouter import agent_router
+from Bedrock_Lex.agentTrace import TraceBreakdown, trace_sampler
+from Bedrock_Lex.circuitBreaker import CircuitBreaker
+from Bedrock_Lex.hedging import hedger
+from Bedrock_Lex import recorder
+from Bedrock_Lex.streamLimits import DeadlineStream, stream_limits
+
+# Breaker shared by every call in this container, so a degraded agent fails fast
+agent_breaker = CircuitBreaker(
+    'agent',
+    window_size=int(os.getenv("BREAKER_WINDOW", "20")),
+    error_rate=float(os.getenv("BREAKER_ERROR_RATE", "0.5")),
+    slow_call_ms=int(os.getenv("BREAKER_SLOW_CALL_MS", "20000")),
+    open_seconds=int(os.getenv("BREAKER_OPEN_SECONDS", "30")),
+)
+
+class AgentUnavailableError(Exception):
+    pass
+
+# Outcome of one agent call, success is False for errors and throttling,
+# truncated is True when the stream was stopped at a limit, error is the error code,
+# hedge_won is True when the hedged request to the alternate target answered,
+# agent_ms is the agent's time without the time the streaming client took to read,
+# answered_by is the target that answered (set by call_target)
+class AgentResult:
+    def __init__(self, completion, success, truncated=False, error=None, hedge_won=False, agent_ms=None, answered_by=None):
+        self.completion = completion
+        self.success = success
+        self.truncated = truncated
+        self.error = error
+        self.hedge_won = hedge_won
+        self.agent_ms = agent_ms
+        self.answered_by = answered_by
+
+# clients are created once per service and region and reused by warm invocations
+_clients = {}
+
+def get_client(region="us-east-1", service="bedrock-agent-runtime"):
+    if (service, region) not in _clients:
+        _clients[(service, region)] = boto3.client(service, region_name=region)
+    return _clients[(service, region)]
+
 # Function to invoke agent for lex
-def invoke_agent(agent_id, agent_alias_id, session_id, prompt):
-    # initalize the client
-    client = boto3.client("bedrock-agent-runtime", region_name="us-east-1")
-    completion = ""
+def invoke_agent(agent_id, agent_alias_id, session_id, prompt, region="us-east-1"):
+    return call_agent(agent_id, agent_alias_id, session_id, prompt, region).completion
+
+# Calls the agent target picked by the router and reports its health back.
+# Only a hedgeable call may be hedged: one whose prompt does not rely on the
+# agent's memory of the session, which the alternate target does not have.
+def call_target(target, session_id, prompt, on_chunk=None, hedgeable=False):
+    start = time.perf_counter()
+    success = False
+    # the target whose stream was read, the stats go to the one that answered
+    answered_by = target
+    latency_ms = None
+    try:
+        hedge_target = agent_router.pick_alternate(target) if hedger.enabled and hedgeable else None
+        result = call_agent(target.agent_id, target.agent_alias_id, session_id, prompt, target.region, hedge_target, on_chunk)
+        success = result.success
+        latency_ms = result.agent_ms
+        if result.hedge_won:
+            answered_by = hedge_target
+        result.answered_by = answered_by
+        return result
+    except AgentUnavailableError:
+        # the breaker did not call the target, so there is nothing to record
+        success = None
+        raise
+    finally:
+        if success is not None:
+            if latency_ms is None:
+                latency_ms = (time.perf_counter() - start) * 1000
+            agent_router.record(answered_by, success, latency_ms)
+
+# Replaces the Bedrock call for offline runs (replayed cassettes, stubbed agent).
+# A transport takes the same arguments as open_completion and returns an
+# iterable of completion events.
+_transport = None
+
+def set_transport(transport):
+    global _transport
+    _transport = transport
+
+if os.getenv("AGENT_STUB") == "true":
+    from Bedrock_Lex.stubAgent import StubAgent
+    set_transport(StubAgent.from_env())
+
+def open_completion(agent_id, agent_alias_id, session_id, prompt, region="us-east-1", enable_trace=False):
+    if _transport is not None:
+        if enable_trace:
+            return _transport(agent_id, agent_alias_id, session_id, prompt, region, enable_trace=True)
+        return _transport(agent_id, agent_alias_id, session_id, prompt, region)
     # sending the request
+    response = get_client(region).invoke_agent(
+        agentId=agent_id,
+        agentAliasId=agent_alias_id,
+        sessionId=session_id,
+        inputText=prompt,
+        enableTrace=enable_trace,
+        # the answer arrives in chunks as it is generated, not as one chunk at the end
+        streamingConfigurations={'streamFinalResponse': True},
+        )
+    return response.get("completion")
+
+def close_stream(events):
+    # the botocore event stream and the hedger's generator both close the connection
+    close = getattr(events, 'close', None)
+    if close is not None:
+        close()
+
+# on_chunk(text) is called with every chunk as it arrives, returning False
+# stops the stream (the streaming HTTP client went away)
+def call_agent(agent_id, agent_alias_id, session_id, prompt, region="us-east-1", hedge_target=None, on_chunk=None):
+    # fail fast while the breaker is open
+    if not agent_breaker.allow_request():
+        raise AgentUnavailableError("Circuit breaker is open, agent is not called")
+    completion = ""
+    success = False
+    truncated = False
+    error = None
+    hedge_won = False
+    # time spent in on_chunk, a slow streaming client is not a slow agent
+    client_seconds = 0.0
+    start = time.perf_counter()
+    # a sample of the calls also asks for the agent's trace
+    trace = TraceBreakdown(start) if trace_sampler.should_trace() else None
+    enable_trace = trace is not None
+    def open_events():
+        nonlocal hedge_won
+        open_primary = lambda: open_completion(agent_id, agent_alias_id, session_id, prompt, region, enable_trace)
+        if hedge_target is None:
+            return open_primary()
+        # a second request is sent if the first one is slow to start
+        winner, events = hedger.stream(
+            open_primary,
+            lambda: open_completion(hedge_target.agent_id, hedge_target.agent_alias_id, session_id, prompt, hedge_target.region, enable_trace),
+        )
+        hedge_won = winner == 1
+        return events
+
     try:
-        response = client.invoke_agent(
-            agentId=agent_id,
-            agentAliasId=agent_alias_id,
-            sessionId=session_id,
-            inputText=prompt,
-            )
+        if stream_limits.max_ms:
+            # the time limit also holds while the agent sends nothing
+            events = DeadlineStream(open_events, start + stream_limits.max_ms / 1000)
+        else:
+            events = open_events()
+        first_chunk = True
+        chunks = 0
+        stop_reason = None
+        recorded_chunks = [] if recorder.is_recording() else None
     # decoding the request
-        for event in response.get("completion"):
+        for event in events:
+            if "chunk" not in event:
+                # trace events, and any other event type the answer does not need
+                if trace is not None and "trace" in event:
+                    trace.add(event)
+                continue
+            if first_chunk:
+                hedger.record_time_to_first_chunk((time.perf_counter() - start) * 1000)
+                first_chunk = False
             chunk = event["chunk"]
-            completion = completion + chunk["bytes"].decode()
+            text = chunk["bytes"].decode()
+            completion = completion + text
+            chunks += 1
+            if recorded_chunks is not None:
+                recorded_chunks.append(((time.perf_counter() - start) * 1000, text))
+            if on_chunk is not None:
+                handed_at = time.perf_counter()
+                keep_reading = on_chunk(text)
+                client_seconds += time.perf_counter() - handed_at
+                if not keep_reading:
+                    stop_reason = 'client'
+                    break
+            # stop reading once the answer is long enough or the time is nearly up
+            stop_reason = stream_limits.exceeded(len(completion), chunks, (time.perf_counter() - start) * 1000)
+            if stop_reason is not None:
+                break
+        if stop_reason is None and getattr(events, 'timed_out', False):
+            stop_reason = 'time'
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if stop_reason is not None:
+            close_stream(events)
+            truncated = True
+            stream_limits.record_stop(stop_reason, len(completion), elapsed_ms)
+        else:
+            stream_limits.record_complete(len(completion), elapsed_ms)
+        if trace is not None:
+            trace.emit(elapsed_ms)
+        if stop_reason == 'time' and not completion:
+            # nothing arrived before the deadline, the call failed
+            error = 'streamTimeout'
+            completion = "This is taking longer than expected. Please try again in a moment."
+        else:
+            success = True
+        if recorded_chunks is not None:
+            recorder.record_agent_call(prompt, recorded_chunks)
     # catching errors, especially throttling request error because of the limit
     except ClientError as e:
         print("Error when invoking bedrock: ", e)
         print("Error response: ", e.response)
         print("Error code: ", e.response['Error']['Code'])
+        error = e.response['Error']['Code']
         if e.response['Error']['Code'] == 'throttlingException':
             print("caught error ")
             completion = "Too many requests. Try again in a few minutes."
+    finally:
+        # errors, throttles and slow streams all count against the breaker
+        agent_ms = (time.perf_counter() - start - client_seconds) * 1000
+        agent_breaker.record(success, agent_ms)
 
-    return completion
+    return AgentResult(completion, success, truncated, error, hedge_won, agent_ms)
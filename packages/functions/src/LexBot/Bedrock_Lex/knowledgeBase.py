@@ -0,0 +1,119 @@
+import os
+import re
+import time
+
+from botocore.exceptions import ClientError
+
+from Bedrock_Lex.invokeBedrockAgent import get_client
+from Bedrock_Lex.metrics import put_metric
+
+# Direct knowledge base backend (retrieve and generate).
+# Analyze/Compare questions already know the institution from the slots, so
+# they can skip the agent's orchestration: the knowledge base is searched with
+# a metadata filter built from the slots and the model answers from the
+# results with the same prompt the agent would get.
+# Steps opt in with a kb_query, and KB_FULFILLMENT turns the backend on.
+KB_FULFILLMENT = os.getenv("KB_FULFILLMENT", "false") == "true"
+KNOWLEDGE_BASE_ID = os.getenv("KNOWLEDGEBASE_ID", "")
+KB_MODEL_ARN = os.getenv("KB_MODEL_ARN", "arn:aws:bedrock:us-east-1::foundation-model/anthropic.claude-3-sonnet-20240229-v1:0")
+KB_REGION = os.getenv("KB_REGION", "us-east-1")
+KB_NUMBER_OF_RESULTS = int(os.getenv("KB_NUMBER_OF_RESULTS", "8"))
+
+# the metadata keys written next to the reports (see lambda/fillingJson.ts)
+SCHOOL_NAME = 'institueName'
+UNIVERSITY_NAME = 'universityName'
+PROGRAMME_NAME = 'programmeName'
+VOCATIONAL_NAME = 'vocationalCenterName'
+
+NAME_SEPARATOR = re.compile(r"\s*,\s*|\s+and\s+")
+
+class KnowledgeBaseQuery:
+    # question: the short question used for retrieval
+    # metadata: {metadata key: name or list of names}
+    def __init__(self, question, metadata):
+        self.question = question
+        self.metadata = metadata
+
+def split_names(text):
+    # "A, B and C" -> ["A", "B", "C"]
+    return [name for name in NAME_SEPARATOR.split(text.strip()) if name]
+
+def build_filter(metadata):
+    conditions = []
+    for key, value in metadata.items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        if len(values) == 1:
+            conditions.append({'equals': {'key': key, 'value': values[0]}})
+        elif values:
+            conditions.append({'in': {'key': key, 'value': list(values)}})
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {'andAll': conditions}
+
+# Replaces the Bedrock call for offline runs, takes the retrieve_and_generate
+# request and returns its response
+_transport = None
+
+def set_transport(transport):
+    global _transport
+    _transport = transport
+
+if os.getenv("KB_STUB") == "true":
+    from Bedrock_Lex.stubAgent import StubKnowledgeBase
+    set_transport(StubKnowledgeBase.from_env())
+
+def is_enabled():
+    return KB_FULFILLMENT and (bool(KNOWLEDGE_BASE_ID) or _transport is not None)
+
+def build_request(query, prompt):
+    retrieval = {'numberOfResults': KB_NUMBER_OF_RESULTS}
+    metadata_filter = build_filter(query.metadata)
+    if metadata_filter is not None:
+        retrieval['filter'] = metadata_filter
+    return {
+        'input': {'text': query.question},
+        'retrieveAndGenerateConfiguration': {
+            'type': 'KNOWLEDGE_BASE',
+            'knowledgeBaseConfiguration': {
+                'knowledgeBaseId': KNOWLEDGE_BASE_ID,
+                'modelArn': KB_MODEL_ARN,
+                'retrievalConfiguration': {'vectorSearchConfiguration': retrieval},
+                # the step's prompt with the search results in front of it
+                'generationConfiguration': {
+                    'promptTemplate': {
+                        'textPromptTemplate': f"Search results from the BQA reports:\n$search_results$\n\n{prompt}",
+                    },
+                },
+            },
+        },
+    }
+
+def retrieve_and_generate(query, prompt):
+    # returns the answer, or None when the agent should answer instead
+    request = build_request(query, prompt)
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        if _transport is not None:
+            response = _transport(request)
+        else:
+            response = get_client(KB_REGION).retrieve_and_generate(**request)
+        references = [
+            reference
+            for citation in response.get('citations', [])
+            for reference in citation.get('retrievedReferences', [])
+        ]
+        # nothing matched the filter, e.g. the name differs from the metadata
+        if not references:
+            outcome = 'empty'
+            return None
+        outcome = 'success'
+        return response['output']['text']
+    except ClientError as e:
+        print("Error when calling the knowledge base: ", e)
+        return None
+    finally:
+        put_metric('KnowledgeBaseLatency', (time.perf_counter() - start) * 1000, 'Milliseconds',
+                   dimensions={'Outcome': outcome}, properties={'filterKeys': sorted(query.metadata)})
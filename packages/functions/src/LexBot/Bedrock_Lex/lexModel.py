@@ -0,0 +1,110 @@
+# Lex V2 fulfillment request and response model.
+# LexRequest reads the event once: the nested dicts are walked a single time,
+# slot values are resolved on first use and cached, and the slots and session
+# attributes are copies, so the incoming event is never changed.
+# create_message and the build_* functions return new dicts on every call,
+# nothing is shared between turns or warm invocations.
+
+class LexRequest:
+    __slots__ = (
+        'session_id',
+        'input_transcript',
+        'intent_name',
+        'slots',
+        'session_attributes',
+        'request_attributes',
+        'originating_request_id',
+        'turn_metrics',
+        'on_chunk',
+        '_resolved',
+    )
+
+    def __init__(self, event):
+        session_state = event.get('sessionState') or {}
+        intent = session_state.get('intent') or {}
+        self.session_id = event['sessionId']
+        self.input_transcript = event.get('inputTranscript')
+        self.intent_name = intent.get('name')
+        self.slots = dict(intent.get('slots') or {})
+        self.session_attributes = dict(session_state.get('sessionAttributes') or {})
+        self.request_attributes = event.get('requestAttributes')
+        self.originating_request_id = session_state.get('originatingRequestId')
+        # what the turn did, logged with its latency (see handle_event)
+        self.turn_metrics = {}
+        # set by the streaming HTTP handler, gets the agent's chunks as they arrive
+        self.on_chunk = None
+        self._resolved = {}
+
+    def get_slot(self, slot_name):
+        # the first resolved value, or what the user typed, None if the slot is empty
+        if slot_name in self._resolved:
+            return self._resolved[slot_name]
+        slot = self.slots.get(slot_name)
+        value = None
+        if slot is not None:
+            resolved_values = slot['value']['resolvedValues']
+            value = resolved_values[0] if resolved_values else slot['value']['originalValue']
+        self._resolved[slot_name] = value
+        return value
+
+    def set_slots(self, slots):
+        self.slots = slots
+        self._resolved = {}
+
+    def set_slot(self, slot_name, value):
+        # filled by the handler, in the shape Lex sends slots
+        self.slots[slot_name] = {'shape': 'Scalar', 'value': {'originalValue': value, 'interpretedValue': value, 'resolvedValues': [value]}}
+        self._resolved[slot_name] = value
+
+    def pop_slot(self, slot_name):
+        self.slots.pop(slot_name, None)
+        self._resolved.pop(slot_name, None)
+
+
+def create_message(content):
+    return {
+        'contentType': 'PlainText',
+        'content': content,
+    }
+
+def build_elicit_slot(request, slot_to_elicit, intent_name, slots=None, messages=None):
+    response = {
+        'sessionState': {
+            'dialogAction': {
+                'type': 'ElicitSlot',
+                'slotToElicit': slot_to_elicit,
+            },
+            'intent': {
+                'name': intent_name,
+                'slots': {} if slots is None else slots,
+                'state': 'InProgress',
+            },
+            'sessionAttributes': request.session_attributes,
+            'originatingRequestId': 'REQUESTID',
+        },
+        'sessionId': request.session_id,
+        'requestAttributes': request.request_attributes,
+    }
+    if messages:
+        response['messages'] = messages
+    return response
+
+def build_close(request, fulfillment_state, messages):
+    return {
+        'sessionState': {
+            'sessionAttributes': request.session_attributes,
+            'dialogAction': {
+                'type': 'Close'
+            },
+            'intent': {
+                'name': request.intent_name,
+                'slots': request.slots,
+                'state': fulfillment_state,
+                'confirmationState': 'None',
+            },
+            'originatingRequestId': request.originating_request_id,
+        },
+        'messages': messages,
+        'sessionId': request.session_id,
+        'requestAttributes': request.request_attributes,
+    }
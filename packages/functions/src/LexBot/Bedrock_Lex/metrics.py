@@ -0,0 +1,29 @@
+import json
+import os
+import time
+
+# Metrics are printed in CloudWatch embedded metric format (EMF), so they
+# show up in CloudWatch from the Lambda logs without extra API calls.
+NAMESPACE = os.getenv("METRICS_NAMESPACE", "BQA/LexFulfillment")
+ENABLED = os.getenv("METRICS_ENABLED", "true") == "true"
+
+def put_metric(name, value, unit="None", dimensions=None, properties=None):
+    if not ENABLED:
+        return
+    dimensions = dimensions or {}
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": NAMESPACE,
+                "Dimensions": [list(dimensions.keys())],
+                "Metrics": [{"Name": name, "Unit": unit}],
+            }],
+        },
+        name: value,
+    }
+    record.update(dimensions)
+    # properties are searchable in the logs but are not metric dimensions
+    if properties:
+        record.update(properties)
+    print(json.dumps(record))
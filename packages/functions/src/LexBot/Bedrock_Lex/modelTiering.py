@@ -0,0 +1,75 @@
+import os
+
+from Bedrock_Lex.metrics import put_metric
+
+# Picks the model tier of an agent call.
+# Simple questions (one institution, a short prompt) go to the agent targets
+# with tier "fast" (a smaller model or alias, see AGENT_TARGETS), while
+# comparisons and long prompts stay on the "standard" targets.
+# Follow-up questions keep the session's target, since they rely on the
+# conversation memory of that agent.
+# Every decision is logged with its inputs and outcome (latency, success and
+# answer size), so the thresholds can be tuned.
+FAST_TIER = 'fast'
+STANDARD_TIER = 'standard'
+
+TIERING_ENABLED = os.getenv("TIERING_ENABLED", "true") == "true"
+FAST_INTENTS = tuple(i.strip() for i in os.getenv("TIER_FAST_INTENTS", "AnalyzingIntent").split(',') if i.strip())
+FAST_MAX_INSTITUTIONS = int(os.getenv("TIER_FAST_MAX_INSTITUTIONS", "1"))
+FAST_MAX_PROMPT_CHARS = int(os.getenv("TIER_FAST_MAX_PROMPT_CHARS", "6000"))
+# step paths that always stay on the standard tier, e.g. "Analyze/University/Institutional Review"
+STANDARD_PATHS = tuple(p.strip() for p in os.getenv("TIER_STANDARD_PATHS", "").split(',') if p.strip())
+
+class TierDecision:
+    def __init__(self, tier, reason, intent_name, step_path, institutions, prompt_chars):
+        self.tier = tier
+        self.reason = reason
+        self.intent_name = intent_name
+        self.step_path = step_path
+        self.institutions = institutions
+        self.prompt_chars = prompt_chars
+
+def count_institutions(kb_query):
+    # the largest name list in the query's metadata, None when unknown
+    if kb_query is None or not kb_query.metadata:
+        return None
+    return max(len(v) if isinstance(v, (list, tuple)) else 1 for v in kb_query.metadata.values())
+
+def choose_tier(intent_name, step_path, institutions, prompt, has_fast_targets, has_agent_target=False):
+    # returns a TierDecision, tier None means the router ignores tiers
+    def decide(tier, reason):
+        return TierDecision(tier, reason, intent_name, step_path, institutions, len(prompt))
+
+    if not TIERING_ENABLED or not has_fast_targets:
+        return decide(None, 'disabled')
+    # the tier is chosen on the session's first agent question, later ones stay
+    # on its target, where the agent has the session's memory
+    if has_agent_target:
+        return decide(None, 'sticky')
+    if intent_name == 'OtherIntent':
+        return decide(None, 'followup')
+    if intent_name not in FAST_INTENTS:
+        return decide(STANDARD_TIER, 'intent')
+    if step_path in STANDARD_PATHS:
+        return decide(STANDARD_TIER, 'path')
+    if institutions is None or institutions > FAST_MAX_INSTITUTIONS:
+        return decide(STANDARD_TIER, 'institutions')
+    if len(prompt) > FAST_MAX_PROMPT_CHARS:
+        return decide(STANDARD_TIER, 'prompt_size')
+    return decide(FAST_TIER, 'simple')
+
+def record_outcome(decision, target, success, latency_ms, answer_chars):
+    # the tier that answered, the router falls back to any target when a tier has none
+    tier = target.tier
+    print(f"Tier decision: {tier} ({decision.reason}) for {decision.step_path}, "
+          f"{decision.institutions} institutions, {decision.prompt_chars} prompt chars, "
+          f"{'ok' if success else 'failed'} in {latency_ms:.0f} ms")
+    put_metric('TieredAgentLatency', latency_ms, 'Milliseconds', dimensions={'Tier': tier}, properties={
+        'reason': decision.reason,
+        'intent': decision.intent_name,
+        'stepPath': decision.step_path,
+        'institutions': decision.institutions,
+        'promptChars': decision.prompt_chars,
+        'answerChars': answer_chars,
+        'success': success,
+    })
@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+from collections import Counter
+
+from Bedrock_Lex.answerCache import get_answer
+from Bedrock_Lex.cacheFill import is_in_flight, start_fill
+from Bedrock_Lex.metrics import put_metric
+from Bedrock_Lex.rateBudget import MinuteBudget
+from Bedrock_Lex.slotValues import FULL_REPORT, SLOT_OPTIONS
+
+# Speculative prefetch of likely answers.
+# When a step elicits its last missing slot and that slot is answered with a
+# button (e.g. SchoolAspectSlot once the school is known), the prompts of the
+# most popular options are sent to the agent in the background and the
+# answers go to the answer cache, so the next turn is usually a cache hit.
+# The calls run on the cache fill queue, which caps the concurrency, and a
+# per-minute budget per container caps the cost.
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "false") == "true"
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", "2"))
+PREFETCH_BUDGET_PER_MINUTE = int(os.getenv("PREFETCH_BUDGET_PER_MINUTE", "20"))
+
+class Prefetcher:
+    def __init__(self, enabled=False, top_n=2, budget_per_minute=20):
+        self.enabled = enabled
+        self.top_n = top_n
+        # how often each option was chosen in this container
+        self.popularity = {}
+        self.budget = MinuteBudget(budget_per_minute)
+        self.lock = threading.Lock()
+
+    def record_choices(self, slots):
+        with self.lock:
+            for slot_name, value in slots.items():
+                if slot_name in SLOT_OPTIONS:
+                    self.popularity.setdefault(slot_name, Counter())[value] += 1
+
+    def likely_values(self, slot_name):
+        # most chosen first, ties keep the order of the buttons
+        # (a full report is a fan-out of its own, it is not prefetched)
+        options = tuple(option for option in SLOT_OPTIONS[slot_name] if option != FULL_REPORT)
+        with self.lock:
+            counts = self.popularity.get(slot_name, Counter())
+            ranked = sorted(options, key=lambda option: (-counts[option], options.index(option)))
+        return ranked[:self.top_n]
+
+    def prefetch(self, slot_name, prompts, session_attributes):
+        # prompts: {option: prompt}, started options are kept in the session
+        # so the next turn can tell a hit from a wasted call
+        started = []
+        for value, prompt in prompts.items():
+            if get_answer(prompt) is not None:
+                continue
+            if is_in_flight(prompt):
+                started.append(value)
+                continue
+            if not self.budget.take():
+                put_metric('PrefetchSkipped', 1, 'Count', dimensions={'Reason': 'budget'})
+                break
+            start_fill('prefetch', prompt)
+            started.append(value)
+        put_metric('PrefetchStarted', len(started), 'Count', dimensions={'Slot': slot_name})
+        if started:
+            session_attributes['prefetched'] = json.dumps({'slot': slot_name, 'values': started})
+
+    def record_outcome(self, session_attributes, slots, prompt):
+        # called when the step is fulfilled, a hit is a prefetched option that was chosen and is cached
+        prefetched = session_attributes.pop('prefetched', None)
+        if prefetched is None:
+            return
+        prefetched = json.loads(prefetched)
+        chosen = slots.get(prefetched['slot'])
+        # a prefetch still running is a hit too, the turn waits for it (see wait_for_fill)
+        in_flight = False
+        if chosen in prefetched['values'] and get_answer(prompt) is None:
+            in_flight = is_in_flight(prompt)
+            hit = in_flight
+        else:
+            hit = chosen in prefetched['values']
+        put_metric('PrefetchHit', 1 if hit else 0, 'Count', dimensions={'Slot': prefetched['slot']}, properties={'inFlight': in_flight})
+        put_metric('PrefetchWasted', len(prefetched['values']) - (1 if hit else 0), 'Count', dimensions={'Slot': prefetched['slot']})
+
+
+prefetcher = Prefetcher(
+    enabled=PREFETCH_ENABLED,
+    top_n=PREFETCH_TOP_N,
+    budget_per_minute=PREFETCH_BUDGET_PER_MINUTE,
+)
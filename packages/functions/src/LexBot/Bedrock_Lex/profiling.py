@@ -0,0 +1,69 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import time
+import tracemalloc
+
+# Opt-in profiling of handler invocations.
+# PROFILE_MODE is "cpu", "memory" or "cpu,memory"; PROFILE_SAMPLE_RATE picks
+# the share of invocations that are profiled. Summaries are printed to the
+# logs and the full cProfile stats are written to PROFILE_DIR.
+# When PROFILE_MODE is unset, profiled() returns the handler unchanged, so
+# there is no overhead at all.
+PROFILE_MODE = os.getenv("PROFILE_MODE", "")
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "1.0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/profiles")
+TOP_N = int(os.getenv("PROFILE_TOP_N", "15"))
+
+def profiled(handler):
+    modes = {mode.strip() for mode in PROFILE_MODE.split(',') if mode.strip()}
+    if not modes:
+        return handler
+    print("Profiling enabled: ", sorted(modes))
+
+    def profiled_handler(event, context):
+        if random.random() >= SAMPLE_RATE:
+            return handler(event, context)
+        profiler = cProfile.Profile() if 'cpu' in modes else None
+        if 'memory' in modes:
+            tracemalloc.start()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            return handler(event, context)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            # take the snapshot before the reports allocate anything
+            if 'memory' in modes:
+                snapshot = tracemalloc.take_snapshot().filter_traces((
+                    tracemalloc.Filter(False, cProfile.__file__),
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                ))
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                _report_memory(snapshot, peak)
+            if profiler is not None:
+                _report_cpu(profiler, context)
+
+    return profiled_handler
+
+def _report_cpu(profiler, context):
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(TOP_N)
+    print("Top functions by cumulative time:\n", stream.getvalue())
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        request_id = getattr(context, 'aws_request_id', None) or str(int(time.time() * 1000))
+        stats.dump_stats(os.path.join(PROFILE_DIR, f"{request_id}.prof"))
+    except OSError as e:
+        print("Could not write profile: ", e)
+
+def _report_memory(snapshot, peak):
+    lines = [f"Peak traced memory: {peak / 1024:.1f} KiB", "Top allocation sites:"]
+    for stat in snapshot.statistics('lineno')[:TOP_N]:
+        lines.append(f"  {stat.traceback[0]}: {stat.size / 1024:.1f} KiB in {stat.count} blocks")
+    print("\n".join(lines))
@@ -0,0 +1,219 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import string
+import threading
+import time
+
+from Bedrock_Lex.metrics import put_metric
+
+# Prompt templates that can be changed without a redeploy.
+# PROMPT_CATALOG_URI points at a JSON catalog, s3://bucket/key (a versioned
+# bucket) or a local path. The catalog is
+#   {"version": "...", "templates": {"create_school_analyze_prompt": "... {school} ..."}}
+# with str.format fields named after the prompt function's arguments.
+# It is fetched again at most every PROMPT_CATALOG_REFRESH_SECONDS, and only
+# downloaded when its ETag changed. Templates are compiled once per version
+# and the last catalog is kept in /tmp, so a new process starts from it and
+# only revalidates. A prompt that is not in the catalog, or whose template
+# does not compile, comes from the bundled prompts.py. Until a catalog is
+# published (the object does not exist), every prompt is the bundled one.
+CATALOG_URI = os.getenv("PROMPT_CATALOG_URI", "")
+REFRESH_SECONDS = int(os.getenv("PROMPT_CATALOG_REFRESH_SECONDS", "300"))
+CACHE_PATH = os.getenv("PROMPT_CATALOG_CACHE_PATH", "/tmp/prompt-catalog.json")
+
+
+class CatalogNotFound(Exception):
+    # nothing has been published at PROMPT_CATALOG_URI
+    pass
+
+
+class S3CatalogSource:
+    def __init__(self, bucket, key):
+        import boto3
+        self.bucket = bucket
+        self.key = key
+        self.client = boto3.client("s3")
+
+    def fetch(self, etag=None):
+        # returns (body, etag), body is None when the object did not change
+        from botocore.exceptions import ClientError
+        request = {'Bucket': self.bucket, 'Key': self.key}
+        if etag:
+            request['IfNoneMatch'] = etag
+        try:
+            response = self.client.get_object(**request)
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code in ('304', 'NotModified'):
+                return None, etag
+            # without s3:ListBucket a missing object is reported as AccessDenied
+            if code in ('NoSuchKey', '404', 'AccessDenied', '403'):
+                raise CatalogNotFound(self.key)
+            raise
+        return response['Body'].read(), response['ETag']
+
+
+class LocalCatalogSource:
+    # a file in a local directory, the ETag is a hash of its content
+    def __init__(self, path):
+        self.path = path
+
+    def fetch(self, etag=None):
+        try:
+            with open(self.path, 'rb') as f:
+                body = f.read()
+        except FileNotFoundError:
+            raise CatalogNotFound(self.path)
+        body_etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if body_etag == etag:
+            return None, etag
+        return body, body_etag
+
+
+def source_from_uri(uri):
+    if uri.startswith("s3://"):
+        bucket, _, key = uri[len("s3://"):].partition("/")
+        return S3CatalogSource(bucket, key)
+    return LocalCatalogSource(uri[len("file://"):] if uri.startswith("file://") else uri)
+
+
+class CompiledTemplate:
+    def __init__(self, text, fields):
+        # parsed once, rendering is a join of literals and values
+        self.parts = []
+        for literal, field, format_spec, conversion in string.Formatter().parse(text):
+            if field is not None and (field not in fields or format_spec or conversion):
+                raise ValueError(f"unknown or formatted field {{{field}}}")
+            self.parts.append((literal, field))
+
+    def render(self, values):
+        return "".join(literal + (str(values[field]) if field is not None else "") for literal, field in self.parts)
+
+
+class PromptCatalog:
+    def __init__(self, source=None, refresh_seconds=300, cache_path=None):
+        self.source = source
+        self.refresh_seconds = refresh_seconds
+        self.cache_path = cache_path
+        # prompt name -> the fields its template may use
+        self.fields = {}
+        self.templates = {}
+        self.version = None
+        self.etag = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+    def register(self, name, fields):
+        self.fields[name] = fields
+
+    def load(self):
+        # fetches the catalog when it is due, also called by the warmup
+        if self.source is None:
+            return
+        if self.checked_at is None or time.monotonic() - self.checked_at >= self.refresh_seconds:
+            self.refresh()
+
+    def get(self, name):
+        # returns the CompiledTemplate or None for the bundled prompt
+        self.load()
+        return self.templates.get(name)
+
+    def refresh(self):
+        # one thread fetches, the others keep using the current templates
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            if self.checked_at is None:
+                self._load_cache()
+            self.checked_at = time.monotonic()
+            body, etag = self.source.fetch(self.etag)
+            if body is None:
+                put_metric('PromptCatalogRefresh', 1, 'Count', dimensions={'Outcome': 'not_modified'})
+                return
+            self._install(json.loads(body), etag)
+            put_metric('PromptCatalogRefresh', 1, 'Count', dimensions={'Outcome': 'updated'},
+                       properties={'version': self.version, 'templates': len(self.templates)})
+            self._save_cache(body, etag)
+        except CatalogNotFound:
+            # no catalog published, the bundled prompts are used
+            if self.templates:
+                print("Prompt catalog was removed, using the bundled prompts")
+            self.templates = {}
+            self.version = None
+            self.etag = None
+            put_metric('PromptCatalogRefresh', 1, 'Count', dimensions={'Outcome': 'absent'})
+        except Exception as e:
+            # the templates in use (or the bundled prompts) stay in place
+            print("Could not refresh the prompt catalog: ", e)
+            put_metric('PromptCatalogRefresh', 1, 'Count', dimensions={'Outcome': 'error'})
+        finally:
+            self.lock.release()
+
+    def _install(self, catalog, etag):
+        templates = {}
+        for name, text in catalog.get('templates', {}).items():
+            if name not in self.fields:
+                print("Prompt catalog has an unknown prompt: ", name)
+                continue
+            try:
+                templates[name] = CompiledTemplate(text, self.fields[name])
+            except ValueError as e:
+                print(f"Prompt {name} from the catalog is not used: ", e)
+        self.templates = templates
+        self.version = catalog.get('version')
+        self.etag = etag
+        print(f"Prompt catalog {self.version} loaded with {len(templates)} templates")
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path) as f:
+                cached = json.load(f)
+            self._install(json.loads(cached['body']), cached['etag'])
+        except (OSError, ValueError, KeyError) as e:
+            print("Could not read the cached prompt catalog: ", e)
+
+    def _save_cache(self, body, etag):
+        if not self.cache_path:
+            return
+        try:
+            with open(self.cache_path, 'w') as f:
+                json.dump({'etag': etag, 'body': body.decode()}, f)
+        except OSError as e:
+            print("Could not cache the prompt catalog: ", e)
+
+
+prompt_catalog = PromptCatalog(
+    source_from_uri(CATALOG_URI) if CATALOG_URI else None,
+    refresh_seconds=REFRESH_SECONDS,
+    cache_path=CACHE_PATH,
+)
+
+def catalog_prompt(**derived):
+    # the decorated prompt function is replaced by the catalog's template when
+    # there is one; derived: extra template fields computed from the arguments
+    def decorate(create_prompt):
+        signature = inspect.signature(create_prompt)
+        name = create_prompt.__name__
+        prompt_catalog.register(name, set(signature.parameters) | set(derived))
+
+        @functools.wraps(create_prompt)
+        def render(*args, **kwargs):
+            template = prompt_catalog.get(name)
+            if template is None:
+                return create_prompt(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            values = dict(bound.arguments)
+            for field, derive in derived.items():
+                values[field] = derive(**bound.arguments)
+            return template.render(values)
+
+        render.bundled = create_prompt
+        render.derived = derived
+        return render
+    return decorate
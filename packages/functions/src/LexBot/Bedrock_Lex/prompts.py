@@ -1,5 +1,8 @@
+from Bedrock_Lex.promptCatalog import catalog_prompt
+
 # all prompts are here
-def create_compare_schools_prompt(institute_names, aspect, governorate=False, all_government=False, all_private=False):
+# these are the bundled templates, PROMPT_CATALOG_URI can override them without a redeploy
+def compare_schools_question(institute_names, aspect, governorate=False, all_government=False, all_private=False):
     question = f"How did {institute_names} do in terms of {aspect}?"
     
     if governorate:
@@ -8,6 +11,11 @@ def create_compare_schools_prompt(institute_names, aspect, governorate=False, al
         question = f"How did all government schools across bahrain do in terms of {aspect}?"
     elif all_private:
         question = f"How did all private schools across bahrain do in terms of {aspect}?"
+    return question
+
+@catalog_prompt(question=compare_schools_question)
+def create_compare_schools_prompt(institute_names, aspect, governorate=False, all_government=False, all_private=False):
+    question = compare_schools_question(institute_names, aspect, governorate, all_government, all_private)
     prompt = f'''
         
 Goal: To evaluate and categorize trends in Bahrain's educational sector across government and private schools, focusing on areas such as students' academic achievement, personal development and well-being, teaching and learning quality, and leadership and governance. The aim is to derive actionable insights into performance, enrollment, and other relevant trends.
@@ -125,6 +133,7 @@ Goal: To evaluate and categorize trends in Bahrain's educational sector across g
     return prompt
 
 
+@catalog_prompt()
 def create_school_analyze_prompt(school, schoolaspect):
     prompt = f"""
         Your goal is to analyze the provided school report and provide insights on the school’s overall performance based on its achievements, challenges, and areas for improvement.
@@ -209,6 +218,7 @@ def create_school_analyze_prompt(school, schoolaspect):
     return prompt
 
 
+@catalog_prompt()
 def create_uni_analyze_prompt(standard, university_name):
     prompt = f"""
         Your goal is to analyze the provided educational institute report and provide insights on the University overall performance based on the different standards and judgment.
@@ -346,6 +356,7 @@ def create_uni_analyze_prompt(standard, university_name):
     return prompt
 
 
+@catalog_prompt()
 def create_compare_uni_prompt(university_names, standard):
     prompt = f"""
            Your goal is to compare between the provided educational institutes reports and provide insights on the Universities' overall performance based on the different standards and judgments.
@@ -468,6 +479,7 @@ def create_compare_uni_prompt(university_names, standard):
     return prompt
 
 
+@catalog_prompt()
 def create_program_uni_analyze_prompt(standard, programme_name, institute_name):
     prompt = f"""
         Your goal is to analyze the provided Programmes-within-College review report overall performance based on the different standards or indicators and judgment as well as the overview of the Bachelor Degree.
@@ -554,6 +566,7 @@ def create_program_uni_analyze_prompt(standard, programme_name, institute_name):
     return prompt
 
 
+@catalog_prompt()
 def create_compare_programme(standard, programme_name, institutes):
     prompt = f"""
               Your goal is to compare between the provided Programmes-within-College review reports and provide insights on the programmes'overall performance based on the different standards or indicators and judgment as well as the overview of the Bachelor Degree.
@@ -703,6 +716,7 @@ def create_compare_programme(standard, programme_name, institutes):
     return prompt
 
 
+@catalog_prompt()
 def create_analyze_vocational_training_centre(instituite_name, aspect):
     prompt = f'''
         
@@ -791,6 +805,7 @@ Goal: To evaluate and categorize trends in Bahrain's educational sector across g
     return prompt
 
 
+@catalog_prompt()
 def create_compare_vocational_training_centres(instituites, aspect):
     prompt = f"""
         Goal: To evaluate and categorize trends in Bahrain's educational sector across government and private schools, focusing on areas such as students' academic achievement, personal development and well-being, teaching and learning quality, and leadership and governance. The aim is to derive actionable insights into performance, enrollment, and other relevant trends.
@@ -0,0 +1,25 @@
+import threading
+import time
+
+# A budget of extra calls per minute, per container.
+# Hedged requests, sampled traces and prefetches each take from one so the
+# extra load they add to the agent stays bounded.
+
+class MinuteBudget:
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.window_start = time.monotonic()
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def take(self):
+        # True when the call fits in this minute's budget, and counts it
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 60:
+                self.window_start = now
+                self.used = 0
+            if self.used >= self.per_minute:
+                return False
+            self.used += 1
+            return True
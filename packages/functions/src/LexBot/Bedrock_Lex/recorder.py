@@ -0,0 +1,173 @@
+import copy
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+
+# Records scrubbed Lex events, the handler responses, the agent completion
+# streams (with chunk timing) and the answers read from the answer cache into
+# cassette files that tools/replay.py can drive the handler from offline.
+# Enable with RECORD_CASSETTES_URI, s3://bucket/prefix on Lambda (its /tmp is
+# gone with the container) or a local directory, RECORD_SAMPLE_RATE picks a
+# share of turns.
+CASSETTES_URI = os.getenv("RECORD_CASSETTES_URI", "")
+SAMPLE_RATE = float(os.getenv("RECORD_SAMPLE_RATE", "1.0"))
+
+EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+# phone numbers, CPR numbers and other long digit runs
+DIGITS = re.compile(r"\+?\d[\d \-]{6,}\d")
+
+_current = threading.local()
+
+
+class S3CassetteSink:
+    def __init__(self, bucket, prefix):
+        import boto3
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.client = boto3.client("s3")
+
+    def write(self, name, body):
+        key = f"{self.prefix}/{name}" if self.prefix else name
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=body.encode(), ContentType='application/json')
+
+
+class LocalCassetteSink:
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, name, body):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, name), 'w') as f:
+            f.write(body)
+
+
+def sink_from_uri(uri):
+    if uri.startswith("s3://"):
+        bucket, _, prefix = uri[len("s3://"):].partition("/")
+        return S3CassetteSink(bucket, prefix)
+    return LocalCassetteSink(uri[len("file://"):] if uri.startswith("file://") else uri)
+
+_sink = None
+
+def get_sink():
+    global _sink
+    if _sink is None:
+        _sink = sink_from_uri(CASSETTES_URI)
+    return _sink
+
+def set_sink(sink):
+    global _sink
+    _sink = sink
+
+def is_enabled():
+    return CASSETTES_URI != "" or _sink is not None
+
+def scrub_text(text):
+    if not isinstance(text, str):
+        return text
+    return DIGITS.sub("<number>", EMAIL.sub("<email>", text))
+
+def scrub_session_id(session_id):
+    # hashed, so the turns of one conversation still share a session id
+    return "rec-" + hashlib.sha256(session_id.encode()).hexdigest()[:16]
+
+def _scrub_slots(slots):
+    for slot in (slots or {}).values():
+        if not slot or 'value' not in slot:
+            continue
+        value = slot['value']
+        for field in ('originalValue', 'interpretedValue'):
+            if field in value:
+                value[field] = scrub_text(value[field])
+        value['resolvedValues'] = [scrub_text(v) for v in value.get('resolvedValues', [])]
+
+def scrub_chunks(chunks):
+    # chunks are scrubbed one by one to keep their timing, unless a match
+    # spans chunks, then the call is kept as one chunk at its last offset
+    scrubbed = [(offset, scrub_text(text)) for offset, text in chunks]
+    whole = scrub_text("".join(text for _, text in chunks))
+    if chunks and "".join(text for _, text in scrubbed) != whole:
+        return [(chunks[-1][0], whole)]
+    return scrubbed
+
+def scrub_event(event):
+    # scrubs user typed text and the answers in a response or in the carried
+    # context summary, everything else is kept as is for replay
+    scrubbed = copy.deepcopy(event)
+    scrubbed.pop('requestAttributes', None)
+    scrubbed.pop('transcriptions', None)
+    if 'sessionId' in scrubbed:
+        scrubbed['sessionId'] = scrub_session_id(event['sessionId'])
+    if 'inputTranscript' in scrubbed:
+        scrubbed['inputTranscript'] = scrub_text(scrubbed['inputTranscript'])
+    for interpretation in scrubbed.get('interpretations', []):
+        _scrub_slots(interpretation.get('intent', {}).get('slots'))
+    session_state = scrubbed.get('sessionState', {})
+    _scrub_slots(session_state.get('intent', {}).get('slots'))
+    session_attributes = session_state.get('sessionAttributes') or {}
+    if 'slots' in session_attributes:
+        slots = json.loads(session_attributes['slots'])
+        _scrub_slots(slots)
+        session_attributes['slots'] = json.dumps(slots)
+    if 'contextSummary' in session_attributes:
+        session_attributes['contextSummary'] = scrub_text(session_attributes['contextSummary'])
+    for message in scrubbed.get('messages') or []:
+        if 'content' in message:
+            message['content'] = scrub_text(message['content'])
+    return scrubbed
+
+def record_invocation(handler, event):
+    if random.random() >= SAMPLE_RATE:
+        return handler(event)
+    # scrubbed before dispatch, the cassette holds what the handler was given
+    cassette = {'event': scrub_event(event), 'agentCalls': [], 'cachedAnswers': [], 'recordedAt': time.time()}
+    _current.cassette = cassette
+    start = time.perf_counter()
+    try:
+        response = handler(event)
+        cassette['response'] = scrub_event(response)
+        return response
+    finally:
+        _current.cassette = None
+        cassette['durationMs'] = (time.perf_counter() - start) * 1000
+        _write(cassette)
+
+def record_agent_call(prompt, chunks):
+    # chunks is a list of (offset in ms from the call start, text)
+    cassette = getattr(_current, 'cassette', None)
+    if cassette is not None:
+        cassette['agentCalls'].append({'prompt': scrub_text(prompt), 'chunks': scrub_chunks(chunks)})
+
+def record_cached_answer(prompt, entry):
+    # entry is the answer cache entry the turn read, replay puts it back in the cache
+    cassette = getattr(_current, 'cassette', None)
+    if cassette is not None:
+        cassette['cachedAnswers'].append({'prompt': scrub_text(prompt), 'answer': scrub_text(entry['answer']), 'ageSeconds': time.time() - entry['storedAt']})
+
+def is_recording():
+    return getattr(_current, 'cassette', None) is not None
+
+def in_current_cassette(function):
+    # wraps function so the calls it makes from a worker thread are recorded
+    # into the cassette of the calling thread
+    cassette = getattr(_current, 'cassette', None)
+    def run(*args, **kwargs):
+        _current.cassette = cassette
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current.cassette = None
+    return run
+
+def _write(cassette):
+    try:
+        name = f"{int(cassette['recordedAt'] * 1000)}-{uuid.uuid4().hex[:8]}.json"
+        get_sink().write(name, json.dumps(cassette))
+    except Exception as e:
+        # recording must never break a user turn
+        print("Could not write cassette: ", e)
@@ -0,0 +1,100 @@
+import os
+import re
+import textwrap
+
+from Bedrock_Lex.stores import get_store
+
+# Splits long agent answers into a bounded number of Lex messages.
+# Messages are cut at section headings ("Key Strengths:", "Area 1:", ...)
+# and never in the middle of a line unless the line itself is too long.
+# Whatever does not fit is kept in the state store and served by "more".
+MAX_MESSAGES = int(os.getenv("MAX_RESPONSE_MESSAGES", "4"))
+# Lex V2 rejects message content longer than 1000 characters
+MAX_MESSAGE_CHARS = int(os.getenv("MAX_MESSAGE_CHARS", "1000"))
+MORE_TTL_SECONDS = int(os.getenv("MORE_TTL_SECONDS", "900"))
+MORE_HINT = "(Type 'more' to see the rest of the answer.)"
+MORE_UTTERANCES = ('more', 'show more', 'continue')
+# added to an answer whose agent stream was stopped at a limit
+TRUNCATED_HINT = "(This answer was shortened. Ask a follow-up question to go into more detail.)"
+
+# a heading is a short line ending with a colon that is not a list item
+HEADING = re.compile(r"^\s*[^\s\-*•\d][^:]{0,80}:\s*$")
+# major sections always start a new message
+MAJOR_HEADING = re.compile(r"^\s*(key [\w ]+|comparative insights|recommendations|summary)\s*:\s*$", re.IGNORECASE)
+
+def split_sections(text):
+    sections = []
+    current = []
+    for line in text.splitlines():
+        if HEADING.match(line) and any(l.strip() for l in current):
+            sections.append("\n".join(current).strip("\n"))
+            current = []
+        current.append(line)
+    if any(l.strip() for l in current):
+        sections.append("\n".join(current).strip("\n"))
+    return sections
+
+def split_long_section(section, max_chars):
+    parts = []
+    current = ""
+    for line in section.splitlines():
+        # a single line that is too long is wrapped at word boundaries
+        for piece in textwrap.wrap(line, max_chars) if len(line) > max_chars else [line]:
+            if current and len(current) + 1 + len(piece) > max_chars:
+                parts.append(current)
+                current = piece
+            else:
+                current = piece if not current else current + "\n" + piece
+    if current.strip():
+        parts.append(current)
+    return parts
+
+def pack_sections(text, max_chars):
+    pages = []
+    current = ""
+    for section in split_sections(text):
+        major = MAJOR_HEADING.match(section.splitlines()[0]) is not None
+        parts = split_long_section(section, max_chars) if len(section) > max_chars else [section]
+        for part in parts:
+            if current and (major or len(current) + 2 + len(part) > max_chars):
+                pages.append(current)
+                current = ""
+            current = part if not current else current + "\n\n" + part
+            major = False
+    if current:
+        pages.append(current)
+    return pages
+
+def build_messages(text, max_messages=MAX_MESSAGES, max_chars=MAX_MESSAGE_CHARS):
+    # returns the message texts to send now and the remaining text (or None)
+    if len(text) <= max_chars:
+        return [text], None
+    pages = pack_sections(text, max_chars)
+    if len(pages) <= max_messages:
+        return pages, None
+    # leave room for the hint on the last page we send
+    pages = pack_sections(text, max_chars - len(MORE_HINT) - 2)
+    visible = pages[:max_messages]
+    visible[-1] = visible[-1] + "\n\n" + MORE_HINT
+    return visible, "\n\n".join(pages[max_messages:])
+
+def _more_key(session_id):
+    return f"more:{session_id}"
+
+def paginate(session_id, text):
+    messages, remainder = build_messages(text)
+    if remainder is not None:
+        get_store().put(_more_key(session_id), remainder, ttl=MORE_TTL_SECONDS)
+    return messages, remainder is not None
+
+def next_page(session_id):
+    # returns (messages, has_more) or (None, False) when nothing is stored
+    store = get_store()
+    remainder = store.get(_more_key(session_id))
+    if remainder is None:
+        return None, False
+    store.delete(_more_key(session_id))
+    return paginate(session_id, remainder)
+
+def is_more_request(text):
+    return text is not None and text.strip().lower().rstrip('.!') in MORE_UTTERANCES
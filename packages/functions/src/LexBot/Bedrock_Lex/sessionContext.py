@@ -0,0 +1,84 @@
+import os
+import re
+
+from Bedrock_Lex.metrics import put_metric
+
+# Keeps the agent conversation history bounded.
+# The agent keeps the history of its session, so late turns of a long chat get
+# slower and more expensive. Turns and prompt size are counted per agent
+# session in the session attributes, and past the thresholds the next call
+# goes to a fresh agent session, optionally with a short summary of the
+# previous answer in front of the prompt.
+MAX_TURNS = int(os.getenv("AGENT_SESSION_MAX_TURNS", "8"))
+MAX_PROMPT_CHARS = int(os.getenv("AGENT_SESSION_MAX_PROMPT_CHARS", "60000"))
+CARRY_SUMMARY = os.getenv("AGENT_SESSION_CARRY_SUMMARY", "true") == "true"
+SUMMARY_MAX_CHARS = int(os.getenv("AGENT_SESSION_SUMMARY_CHARS", "400"))
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+def _turn_bucket(turn):
+    if turn <= 1:
+        return '1'
+    if turn <= 3:
+        return '2-3'
+    if turn <= 7:
+        return '4-7'
+    return '8+'
+
+def rotate_agent_session(session_attributes, reason):
+    # the next agent call goes to a fresh agent session, an agent session
+    # that never had a turn is kept
+    turns = int(session_attributes.get('agentTurns', '0'))
+    if turns == 0:
+        return
+    prompt_chars = int(session_attributes.get('agentPromptChars', '0'))
+    print(f"Rotating agent session ({reason}) after {turns} turns and {prompt_chars} prompt characters")
+    put_metric('AgentSessionRotated', 1, 'Count', properties={'reason': reason})
+    generation = int(session_attributes.get('agentSessionGeneration', '0'))
+    session_attributes['agentSessionGeneration'] = str(generation + 1)
+    session_attributes['agentTurns'] = '0'
+    session_attributes['agentPromptChars'] = '0'
+
+def prepare_agent_session(session_attributes, lex_session_id, prompt):
+    # returns (agent session id, prompt to send) and counts the turn
+    turns = int(session_attributes.get('agentTurns', '0'))
+    prompt_chars = int(session_attributes.get('agentPromptChars', '0'))
+    if turns >= MAX_TURNS or (turns > 0 and prompt_chars + len(prompt) > MAX_PROMPT_CHARS):
+        rotate_agent_session(session_attributes, 'size')
+
+    generation = int(session_attributes.get('agentSessionGeneration', '0'))
+    turns = int(session_attributes.get('agentTurns', '0'))
+    prompt_chars = int(session_attributes.get('agentPromptChars', '0'))
+    # the first prompt of a rotated session carries what came before
+    summary = session_attributes.get('contextSummary')
+    if turns == 0 and generation > 0 and CARRY_SUMMARY and summary:
+        prompt = f"Context from earlier in this conversation: {summary}\n\n{prompt}"
+
+    session_attributes['agentSessionGeneration'] = str(generation)
+    session_attributes['agentTurns'] = str(turns + 1)
+    session_attributes['agentPromptChars'] = str(prompt_chars + len(prompt))
+    # the first generation keeps the Lex session id so existing sessions are unaffected
+    agent_session_id = lex_session_id if generation == 0 else f"{lex_session_id}-{generation}"
+    return agent_session_id, prompt
+
+def is_first_agent_turn(session_attributes):
+    # after prepare_agent_session, True when the agent session has no earlier turns
+    return session_attributes.get('agentTurns') == '1'
+
+def summarize(answer):
+    # a cheap local summary: the first sentences of the last answer, which
+    # name the institutions and the aspect that were discussed
+    summary = ""
+    for sentence in SENTENCE_END.split(" ".join(answer.split())):
+        if summary and len(summary) + len(sentence) > SUMMARY_MAX_CHARS:
+            break
+        summary += sentence + " "
+    return summary.strip()[:SUMMARY_MAX_CHARS]
+
+def remember_turn(session_attributes, answer, latency_ms):
+    if CARRY_SUMMARY and answer:
+        session_attributes['contextSummary'] = summarize(answer)
+    turn = int(session_attributes.get('agentTurns', '1'))
+    # latency against the turn number within the agent session
+    put_metric('AgentLatency', latency_ms, 'Milliseconds',
+               dimensions={'TurnBucket': _turn_bucket(turn)}, properties={'turn': turn})
@@ -0,0 +1,235 @@
+import re
+
+from Bedrock_Lex.slotValues import FULL_REPORT, GOVERNORATES, SLOT_OPTIONS, UNIVERSITY_STANDARDS
+
+# Fills the slots of a Step tree from a typed first question.
+# "compare Bahrain Polytechnic and AOU on quality of teaching" answers
+# InstituteCompareTypeSlot, CompareUniversitySlot, CompareUniversityUniSlot
+# and CompareUniStandardSlot at once, so only what is still missing is asked.
+# Local rules over the button values of slotValues.py, no model call. A slot
+# is only filled when the rules are sure of it, otherwise it is asked as before.
+# An institution name is only taken when it is a known abbreviation or is
+# written as a proper name of one institution ("Ibn Khuldoon National
+# School", "University of Bahrain"). "how did ..." questions without such a
+# name are not Analyze questions ("How does BQA review schools?").
+INTENT_CUES = (
+    ('Compare', re.compile(r"^(?:please\s+)?(?:compare|contrast)\b|\b(?:vs\.?|versus|compared? (?:to|with)|difference between)\b", re.IGNORECASE)),
+    ('Analyze', re.compile(r"^(?:please\s+)?(?:analy[sz]e|review|assess|evaluate)\b", re.IGNORECASE)),
+)
+LEADING_WORDS = re.compile(
+    r"^(?:please\s+)?(?:compare|contrast|analy[sz]e|review|assess|evaluate|how (?:did|does|do|is|was|has|have)|tell me about|what about"
+    r"|(?:what is|what's) the difference between|(?:give me |show me )?(?:the )?(?:full|whole|complete) report (?:for|of|on))\s+(?:the\s+)?",
+    re.IGNORECASE,
+)
+TRAILING_WORDS = re.compile(r"\s+(?:do|does|did|doing|perform|performed|performing|fare|fared|compare|score|scored)$", re.IGNORECASE)
+TOPIC_SEPARATOR = re.compile(r"\s+(?:on|in terms of|regarding|with respect to|about|when it comes to)\s+", re.IGNORECASE)
+NAME_SEPARATOR = re.compile(r"\s*,\s*(?:and\s+)?|\s+(?:and|vs\.?|versus|with)\s+", re.IGNORECASE)
+PROGRAMME_CUE = re.compile(r"\b(?:bachelor|master|diploma|associate|programmes?|programs?|degree|b\.?sc|m\.?sc|mba|bba)\b", re.IGNORECASE)
+PROGRAMME_AT = re.compile(r"\s+(?:at|from)\s+", re.IGNORECASE)
+
+TYPE_CUES = (
+    ('School', re.compile(r"\bschools?\b", re.IGNORECASE)),
+    ('Vocational Training Center', re.compile(r"\b(?:vocational|institutes?|training|academy|cent(?:er|re)s?)\b", re.IGNORECASE)),
+    ('University', re.compile(r"\b(?:universit(?:y|ies)|polytechnic|colleges?)\b", re.IGNORECASE)),
+)
+# the word that makes a proper name the name of one institution
+INSTITUTION_WORD = re.compile(r"\b(?:school|university|polytechnic|college|institute|academy|cent(?:er|re))\b", re.IGNORECASE)
+# words of a proper name that are not capitalized
+NAME_CONNECTORS = {'of', 'and', 'for', 'the', 'al', 'bin', 'ibn', 'in'}
+# "universities", "vocational training centres": the type, not a name
+GENERIC_NAME = re.compile(r"^(?:all\s+)?(?:schools?|universit(?:y|ies)|colleges?|institutes?|(?:vocational\s+)?(?:training\s+)?cent(?:er|re)s?)$", re.IGNORECASE)
+# abbreviations users type instead of the names in the review reports
+ALIASES = {
+    'aou': ('Arab Open University', 'University'),
+    'uob': ('University of Bahrain', 'University'),
+    'asu': ('Applied Science University', 'University'),
+    'ruw': ('Royal University for Women', 'University'),
+    'ama': ('AMA International University', 'University'),
+    'polytechnic': ('Bahrain Polytechnic', 'University'),
+    'bibf': ('Bahrain Institute of Banking and Finance', 'Vocational Training Center'),
+    'bti': ('Bahrain Training Institute', 'Vocational Training Center'),
+}
+GOVERNMENT_SCHOOLS = re.compile(r"\b(?:government|public) schools\b", re.IGNORECASE)
+PRIVATE_SCHOOLS = re.compile(r"\bprivate schools\b", re.IGNORECASE)
+# "all private schools", "schools in the Capital governorate": a group, no names
+SCHOOL_GROUP = re.compile(r"\b(?:government|public|private) schools\b|\bgovernorate\b", re.IGNORECASE)
+INSTITUTIONAL_CUE = re.compile(r"\binstitution(?:al)?\b", re.IGNORECASE)
+FULL_REPORT_CUE = re.compile(r"\b(?:full|whole|complete) report\b|\beverything\b", re.IGNORECASE)
+WORDS = re.compile(r"[a-z]+")
+STOP_WORDS = {'the', 'of', 'and', 'in', 'on', 'their', 'its', 'students', 'student', 'how', 'what', 'is', 'are', 'for', 'terms'}
+
+# slots answered with the institution names or programmes of the question
+NAME_SLOTS = ('AnalyzeSchoolSlot', 'AnalyzeVocationalSlot', 'AnalyzeUniversityNameSlot', 'UniNameSlot')
+NAMES_SLOTS = ('CompareUniversityUniSlot', 'CompareSpecificInstitutesSlot', 'CompareVocationalSlot', 'CompareUniversityWprogUniversityNameSlot')
+PROGRAMME_SLOTS = ('ProgramNameSlot',)
+PROGRAMMES_SLOTS = ('CompareUniversityWprogSlot',)
+
+def topic_words(text):
+    return set(WORDS.findall(text.lower())) - STOP_WORDS
+
+def best_option(options, topic):
+    # the option sharing the most of the topic's words, None when it is a guess
+    words = topic_words(topic)
+    best, best_score = None, (0.0, 0.0)
+    for option in options:
+        wanted = topic_words(option)
+        matched = len(words & wanted)
+        if not matched:
+            continue
+        score = (matched / len(words), matched / len(wanted))
+        if score > best_score:
+            best, best_score = option, score
+    return best if best_score[0] >= 0.5 else None
+
+def expand_name(name):
+    # returns (name, institute type or None)
+    alias = ALIASES.get(name.lower())
+    if alias is not None:
+        return alias
+    for institute_type, cue in TYPE_CUES:
+        if cue.search(name):
+            return name, institute_type
+    return name, None
+
+def is_institution_name(name):
+    # a known abbreviation, or a proper name with an institution word in it
+    if name.lower() in ALIASES:
+        return True
+    if not INSTITUTION_WORD.search(name):
+        return False
+    return all(word[0].isupper() or word[0].isdigit() or word.lower() in NAME_CONNECTORS for word in name.split())
+
+def is_programme_name(name):
+    return PROGRAMME_CUE.search(name) is not None
+
+def split_names(text, is_name):
+    # "Bahrain Institute of Banking and Finance" is one name, "University of
+    # Bahrain and Bahrain Polytechnic" two: a part after "and" that is no
+    # name of its own belongs to the "... of ..." name before it
+    names = []
+    for part in NAME_SEPARATOR.split(text):
+        part = re.sub(r"^the\s+", "", part.strip(), flags=re.IGNORECASE)
+        if not part:
+            continue
+        if names and not is_name(part) and re.search(r"\bof\b", names[-1], re.IGNORECASE):
+            names[-1] = f"{names[-1]} and {part}"
+        else:
+            names.append(part)
+    return names
+
+
+class Utterance:
+    def __init__(self, text):
+        self.text = text.strip().rstrip("?.! ")
+        self.intent = None
+        self.institute_type = None
+        self.names = []
+        self.programmes = []
+        self.topic = ""
+        # the slots filled from it, for the metrics
+        self.filled = []
+
+    def parse(self):
+        for intent, cue in INTENT_CUES:
+            if cue.search(self.text):
+                self.intent = intent
+                break
+        subject = LEADING_WORDS.sub("", self.text)
+        parts = TOPIC_SEPARATOR.split(subject, maxsplit=1)
+        subject = TRAILING_WORDS.sub("", parts[0].strip())
+        self.topic = parts[1] if len(parts) > 1 else ""
+
+        types = set()
+        if PROGRAMME_CUE.search(subject):
+            # "Bachelor of Law and Bachelor of Accounting at UoB and ASU"
+            match = PROGRAMME_AT.search(subject)
+            programmes, subject = (subject[:match.start()], subject[match.end():]) if match else (subject, "")
+            self.programmes = split_names(programmes, is_programme_name)
+            types.add('University')
+        if SCHOOL_GROUP.search(subject):
+            types.add('School')
+            subject = ""
+        unsure = False
+        for name in split_names(subject, is_institution_name):
+            if GENERIC_NAME.match(name):
+                # "compare universities on ...": the type only
+                types.add(expand_name(name)[1])
+            elif is_institution_name(name):
+                name, institute_type = expand_name(name)
+                types.add(institute_type)
+                self.names.append(name)
+            else:
+                unsure = True
+        if unsure:
+            # one part is not a name we know, the names are asked for instead
+            self.names = []
+        types.discard(None)
+        if len(types) == 1:
+            self.institute_type = types.pop()
+        if self.intent is None and (self.names or self.programmes):
+            # "Bahrain Polytechnic and AOU on teaching", "how is University of Bahrain on student support"
+            self.intent = 'Compare' if len(self.names) > 1 or len(self.programmes) > 1 else 'Analyze'
+        return self
+
+    def slot_value(self, slot_name):
+        # the value of the slot, None to ask for it
+        options = SLOT_OPTIONS.get(slot_name)
+        if slot_name in ('InstituteTypeSlot', 'InstituteCompareTypeSlot'):
+            return self.institute_type
+        if slot_name == 'AnalyzeUniversitySlot':
+            if FULL_REPORT_CUE.search(self.text):
+                return FULL_REPORT
+            if self.programmes:
+                return 'Program Review'
+            return 'Institutional Review' if self._institutional() else None
+        if slot_name == 'CompareUniversitySlot':
+            if self.programmes:
+                return 'Programs'
+            return 'Institutes' if self._institutional() else None
+        if slot_name == 'CompareSchoolSlot':
+            if GOVERNMENT_SCHOOLS.search(self.text):
+                return 'All Government Schools'
+            if PRIVATE_SCHOOLS.search(self.text):
+                return 'All Private Schools'
+            if self.slot_value('GovernorateSlot') is not None:
+                return 'Governorate'
+            return 'Specific Institutes' if len(self.names) > 1 else None
+        if slot_name == 'GovernorateSlot':
+            for governorate in GOVERNORATES:
+                if re.search(r"\b" + governorate.split()[0] + r"\b", self.text, re.IGNORECASE):
+                    return governorate
+            return None
+        if slot_name in NAME_SLOTS:
+            return self.names[0] if len(self.names) == 1 else None
+        if slot_name in NAMES_SLOTS:
+            return ", ".join(self.names) if len(self.names) > 1 else None
+        if slot_name in PROGRAMME_SLOTS:
+            return self.programmes[0] if len(self.programmes) == 1 else None
+        if slot_name in PROGRAMMES_SLOTS:
+            return ", ".join(self.programmes) if len(self.programmes) > 1 else None
+        if options is not None:
+            if FULL_REPORT in options and FULL_REPORT_CUE.search(self.text):
+                return FULL_REPORT
+            return best_option([option for option in options if option != FULL_REPORT], self.topic) if self.topic else None
+        return None
+
+    def _institutional(self):
+        # an institution-level question: "institutional" or one of the institutional standards
+        return INSTITUTIONAL_CUE.search(self.text) is not None or (
+            bool(self.topic) and best_option(UNIVERSITY_STANDARDS, self.topic) is not None)
+
+
+def parse_utterance(text):
+    # an Utterance, or None when the text is not an Analyze/Compare question
+    if not text or text.strip() in SLOT_OPTIONS['BQASlot']:
+        return None
+    utterance = Utterance(text).parse()
+    return utterance if utterance.intent is not None else None
+
+def fill_slot(intent_request, slot_name, utterance):
+    # the value put in the slot, None when it is still missing
+    value = utterance.slot_value(slot_name)
+    if value:
+        intent_request.set_slot(slot_name, value)
+        utterance.filled.append(slot_name)
+    return value
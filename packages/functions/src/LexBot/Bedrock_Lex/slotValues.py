@@ -0,0 +1,59 @@
+# Button values of the Lex slots, keep in sync with stacks/Lexstacks/BotStack.ts
+INSTITUTE_TYPES = ('University', 'School', 'Vocational Training Center')
+
+SCHOOL_ASPECTS = (
+    'Students Academic Achievement',
+    'Students Personal Development and Well-being',
+    'Teaching, Learning and Assessment',
+    'Leadership, Management and Governance',
+)
+
+VOCATIONAL_ASPECTS = (
+    'Assessment and Learners',
+    'Learners Engagement',
+    'Leadership and Management',
+)
+
+UNIVERSITY_STANDARDS = (
+    'Mission, Governance and Management',
+    'Quality Assurance and Enhancement',
+    'Learning Resources, ICT and Infrastructuret',
+    'The Quality of Teaching and Learning',
+    'Student Support Services',
+)
+
+PROGRAMME_STANDARDS = (
+    'The Learning Programme',
+    'Efficiency of the Programme ',
+    'Academic Standards of Students and Graduates',
+    'Effectiveness of Quality Management and Assurance',
+)
+
+GOVERNORATES = (
+    'Capital Governorate',
+    'Muharraq Governorate',
+    'Northern Governorate',
+    'Southern Governorate',
+)
+
+# the aspect/option that asks for every section at once (see fullReport.py)
+FULL_REPORT = 'Full Report'
+
+# slots that are answered with a button
+SLOT_OPTIONS = {
+    'BQASlot': ('Analyze', 'Compare', 'Other'),
+    'InstituteTypeSlot': INSTITUTE_TYPES,
+    'InstituteCompareTypeSlot': INSTITUTE_TYPES,
+    'AnalyzeUniversitySlot': ('Institutional Review', 'Program Review', FULL_REPORT),
+    'CompareUniversitySlot': ('Institutes', 'Programs'),
+    'CompareSchoolSlot': ('Governorate', 'Specific Institutes', 'All Government Schools', 'All Private Schools'),
+    'SchoolAspectSlot': SCHOOL_ASPECTS + (FULL_REPORT,),
+    'CompareSchoolAspectlSlot': SCHOOL_ASPECTS,
+    'VocationalAspectSlot': VOCATIONAL_ASPECTS + (FULL_REPORT,),
+    'CompareVocationalaspectSlot': VOCATIONAL_ASPECTS,
+    'StandardSlot': UNIVERSITY_STANDARDS,
+    'CompareUniStandardSlot': UNIVERSITY_STANDARDS,
+    'StandardProgSlot': PROGRAMME_STANDARDS,
+    'CompareUniversityWProgramsSlot': PROGRAMME_STANDARDS,
+    'GovernorateSlot': GOVERNORATES,
+}
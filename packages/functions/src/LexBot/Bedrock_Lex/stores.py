@@ -0,0 +1,286 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Key/value stores for state that has to outlive a single Lex turn.
+# Values must be JSON serializable, ttl is in seconds.
+# add() only writes when the key is missing (or expired) and tells whether it
+# did, so it can be used to claim a key between concurrent invocations.
+# increment()/decrement() keep an atomic counter under a key: increment only
+# counts up while the counter is below limit and returns the new count, or
+# None when it is full. Every change pushes the counter's expiry out by ttl,
+# so an expired counter was left alone for ttl and starts again from 0 (a
+# count that a crashed invocation never gave back does not stay forever).
+# DynamoDB is used when STATE_TABLE_NAME is set, otherwise a SQLite file
+# under /tmp is used, which works locally and inside one warm container.
+
+class MemoryStore:
+    def __init__(self):
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.time():
+                self.items.pop(key)
+                return None
+            return value
+
+    def put(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self.lock:
+            self.items[key] = (value, expires_at)
+
+    def add(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None and (item[1] is None or item[1] >= time.time()):
+                return False
+            self.items[key] = (value, expires_at)
+            return True
+
+    def delete(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+    def _count(self, key):
+        item = self.items.get(key)
+        if item is None or (item[1] is not None and item[1] < time.time()):
+            return 0
+        return item[0]
+
+    def increment(self, key, limit=None, ttl=None):
+        with self.lock:
+            count = self._count(key)
+            if limit is not None and count >= limit:
+                return None
+            self.items[key] = (count + 1, time.time() + ttl if ttl else None)
+            return count + 1
+
+    def decrement(self, key, ttl=None):
+        with self.lock:
+            count = self._count(key)
+            self.items[key] = (max(0, count - 1), time.time() + ttl if ttl else None)
+
+    def get_count(self, key):
+        with self.lock:
+            return self._count(key)
+
+
+class SQLiteStore:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+        )
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value, expires_at FROM kv WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] < time.time():
+                self.connection.execute("DELETE FROM kv WHERE key = ?", (key,))
+                return None
+            return json.loads(row[0])
+
+    def put(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+
+    def add(self, key, value, ttl=None):
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM kv WHERE key = ? AND expires_at IS NOT NULL AND expires_at < ?", (key, now)
+            )
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            return cursor.rowcount == 1
+
+    def delete(self, key):
+        with self.lock:
+            self.connection.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def _count(self, key):
+        row = self.connection.execute(
+            "SELECT value, expires_at FROM kv WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return 0
+        return json.loads(row[0])
+
+    def _set_count(self, key, count, ttl):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(count), time.time() + ttl if ttl else None),
+        )
+
+    def increment(self, key, limit=None, ttl=None):
+        # the lock serializes the connection, one process owns the file
+        with self.lock:
+            count = self._count(key)
+            if limit is not None and count >= limit:
+                return None
+            self._set_count(key, count + 1, ttl)
+            return count + 1
+
+    def decrement(self, key, ttl=None):
+        with self.lock:
+            self._set_count(key, max(0, self._count(key) - 1), ttl)
+
+    def get_count(self, key):
+        with self.lock:
+            return self._count(key)
+
+
+class DynamoStore:
+    # table layout: partition key "pk", TTL attribute "expiresAt"
+    def __init__(self, table_name):
+        import boto3
+        self.table = boto3.resource("dynamodb").Table(table_name)
+
+    def get(self, key):
+        item = self.table.get_item(Key={"pk": key}).get("Item")
+        if item is None:
+            return None
+        # DynamoDB deletes expired items lazily, so check the expiry here too
+        if "expiresAt" in item and int(item["expiresAt"]) < time.time():
+            return None
+        return json.loads(item["value"])
+
+    def put(self, key, value, ttl=None):
+        item = {"pk": key, "value": json.dumps(value)}
+        if ttl:
+            item["expiresAt"] = int(time.time() + ttl)
+        self.table.put_item(Item=item)
+
+    def add(self, key, value, ttl=None):
+        from botocore.exceptions import ClientError
+        now = int(time.time())
+        item = {"pk": key, "value": json.dumps(value)}
+        if ttl:
+            item["expiresAt"] = int(now + ttl)
+        try:
+            self.table.put_item(
+                Item=item,
+                ConditionExpression="attribute_not_exists(pk) OR expiresAt < :now",
+                ExpressionAttributeValues={":now": now},
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+        return True
+
+    def delete(self, key):
+        self.table.delete_item(Key={"pk": key})
+
+    def increment(self, key, limit=None, ttl=None):
+        # one conditional update, the count lives in the "count" attribute
+        from botocore.exceptions import ClientError
+        now = int(time.time())
+        update = "ADD #count :one"
+        condition = "(attribute_not_exists(expiresAt) OR expiresAt >= :now)"
+        values = {":one": 1, ":now": now}
+        item = {"pk": key, "count": 1}
+        if ttl:
+            update += " SET expiresAt = :expires"
+            values[":expires"] = item["expiresAt"] = int(now + ttl)
+        if limit is not None:
+            condition += " AND (attribute_not_exists(#count) OR #count < :limit)"
+            values[":limit"] = limit
+        try:
+            response = self.table.update_item(
+                Key={"pk": key},
+                UpdateExpression=update,
+                ConditionExpression=condition,
+                ExpressionAttributeNames={"#count": "count"},
+                ExpressionAttributeValues=values,
+                ReturnValues="UPDATED_NEW",
+                ReturnValuesOnConditionCheckFailure="ALL_OLD",
+            )
+            return int(response["Attributes"]["count"])
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            # the item as it was, in the low-level format
+            expires = e.response.get("Item", {}).get("expiresAt", {}).get("N")
+        if expires is None or int(expires) >= now or (limit is not None and limit < 1):
+            # full
+            return None
+        # expired: the counter starts again from 1
+        try:
+            self.table.put_item(
+                Item=item,
+                ConditionExpression="attribute_not_exists(pk) OR expiresAt < :now",
+                ExpressionAttributeValues={":now": now},
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return None
+            raise
+        return 1
+
+    def decrement(self, key, ttl=None):
+        from botocore.exceptions import ClientError
+        update = "ADD #count :minus"
+        values = {":minus": -1, ":zero": 0}
+        if ttl:
+            update += " SET expiresAt = :expires"
+            values[":expires"] = int(time.time() + ttl)
+        try:
+            self.table.update_item(
+                Key={"pk": key},
+                UpdateExpression=update,
+                ConditionExpression="#count > :zero",
+                ExpressionAttributeNames={"#count": "count"},
+                ExpressionAttributeValues=values,
+            )
+        except ClientError as e:
+            # already 0, or expired and gone
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+    def get_count(self, key):
+        item = self.table.get_item(Key={"pk": key}).get("Item")
+        if item is None or "count" not in item:
+            return 0
+        if item.get("expiresAt") and int(item["expiresAt"]) < time.time():
+            return 0
+        return int(item["count"])
+
+
+_store = None
+
+def get_store():
+    global _store
+    if _store is None:
+        table_name = os.getenv("STATE_TABLE_NAME")
+        if table_name:
+            _store = DynamoStore(table_name)
+        else:
+            _store = SQLiteStore(os.getenv("STATE_DB_PATH", "/tmp/fulfillment-state.db"))
+    return _store
+
+def set_store(store):
+    # lets local tools swap in a MemoryStore or a SQLite file of their own
+    global _store
+    _store = store
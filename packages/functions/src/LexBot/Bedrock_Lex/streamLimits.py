@@ -0,0 +1,130 @@
+import os
+import queue
+import threading
+import time
+
+from Bedrock_Lex.metrics import put_metric
+
+# Limits on how much of an agent's completion stream is consumed.
+# When the answer is already longer than we can show or the time budget is
+# nearly gone, the stream is closed early and the answer is marked truncated.
+# A limit of 0 is off. The time limit is a deadline on the read itself: the
+# stream is read by a worker thread (DeadlineStream) and the caller stops
+# waiting at the deadline, also when the agent sends nothing at all.
+# The saving is estimated from the average complete stream in this container.
+
+class StreamLimits:
+    def __init__(self, max_chars=0, max_chunks=0, max_ms=0, alpha=0.1):
+        self.max_chars = max_chars
+        self.max_chunks = max_chunks
+        self.max_ms = max_ms
+        self.alpha = alpha
+        self.full_chars = None
+        self.full_ms = None
+        self.lock = threading.Lock()
+
+    def exceeded(self, chars, chunks, elapsed_ms):
+        # returns the name of the limit that was reached, or None
+        if self.max_chars and chars >= self.max_chars:
+            return 'chars'
+        if self.max_chunks and chunks >= self.max_chunks:
+            return 'chunks'
+        if self.max_ms and elapsed_ms >= self.max_ms:
+            return 'time'
+        return None
+
+    def record_complete(self, chars, elapsed_ms):
+        with self.lock:
+            if self.full_chars is None:
+                self.full_chars, self.full_ms = chars, elapsed_ms
+            else:
+                self.full_chars = self.alpha * chars + (1 - self.alpha) * self.full_chars
+                self.full_ms = self.alpha * elapsed_ms + (1 - self.alpha) * self.full_ms
+
+    def record_stop(self, reason, chars, elapsed_ms):
+        print(f"Agent stream stopped early ({reason}) after {chars} characters and {elapsed_ms:.0f} ms")
+        with self.lock:
+            saved_chars = max(0, self.full_chars - chars) if self.full_chars is not None else None
+            saved_ms = max(0, self.full_ms - elapsed_ms) if self.full_ms is not None else None
+        put_metric('AgentStreamStopped', 1, 'Count', dimensions={'Reason': reason},
+                   properties={'chars': chars, 'elapsedMs': elapsed_ms})
+        # estimates, unknown until a complete stream has been seen
+        if saved_chars is not None:
+            put_metric('AgentStreamSavedBytes', saved_chars, 'Bytes', dimensions={'Reason': reason})
+            put_metric('AgentStreamSavedTime', saved_ms, 'Milliseconds', dimensions={'Reason': reason})
+
+
+class DeadlineStream:
+    # the events of open_events(), opened and read on a worker thread; iteration
+    # ends at the deadline (a time.perf_counter() value) and timed_out is set
+    def __init__(self, open_events, deadline):
+        self.open_events = open_events
+        self.deadline = deadline
+        self.events = None
+        self.timed_out = False
+        self.stopped = False
+        # one event ahead, the stream is read no faster than the caller reads it
+        self.queue = queue.Queue(maxsize=1)
+        self.lock = threading.Lock()
+
+    def __iter__(self):
+        threading.Thread(target=self._read, daemon=True).start()
+        while True:
+            try:
+                kind, value = self.queue.get(timeout=max(0, self.deadline - time.perf_counter()))
+            except queue.Empty:
+                self.timed_out = True
+                self.close()
+                return
+            if kind == 'error':
+                raise value
+            if kind == 'end':
+                return
+            yield value
+
+    def _read(self):
+        try:
+            events = self.open_events()
+            with self.lock:
+                self.events = events
+            for event in events:
+                if not self._put(('event', event)):
+                    break
+            self._put(('end', None))
+        except Exception as e:
+            self._put(('error', e))
+        finally:
+            if self.stopped:
+                self._close_events()
+
+    def _put(self, item):
+        # False once the caller stopped reading
+        while not self.stopped:
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _close_events(self):
+        with self.lock:
+            events = self.events
+        close = getattr(events, 'close', None)
+        if close is not None:
+            try:
+                close()
+            except ValueError:
+                # a generator that is still running, _read closes it once it returns
+                pass
+
+    def close(self):
+        self.stopped = True
+        self._close_events()
+
+
+stream_limits = StreamLimits(
+    max_chars=int(os.getenv("AGENT_STREAM_MAX_CHARS", "0")),
+    max_chunks=int(os.getenv("AGENT_STREAM_MAX_CHUNKS", "0")),
+    max_ms=int(os.getenv("AGENT_STREAM_MAX_MS", "0")),
+)
@@ -0,0 +1,117 @@
+import os
+import random
+import threading
+import time
+
+# Stand-in for the Bedrock agent for local runs and tools (AGENT_STUB=true).
+# It streams an answer shaped like the prompts' output template, with a
+# configurable time to first chunk and gap between chunks.
+
+class StubAgent:
+    def __init__(self, time_to_first_chunk_ms=800, chunk_interval_ms=40, chunks=12, jitter=0.3, per_turn_ms=0):
+        self.time_to_first_chunk_ms = time_to_first_chunk_ms
+        self.chunk_interval_ms = chunk_interval_ms
+        self.chunks = chunks
+        self.jitter = jitter
+        # extra time to first chunk for every earlier turn in the agent session
+        self.per_turn_ms = per_turn_ms
+        self.turns = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            time_to_first_chunk_ms=float(os.getenv("STUB_TTFC_MS", "800")),
+            chunk_interval_ms=float(os.getenv("STUB_CHUNK_INTERVAL_MS", "40")),
+            chunks=int(os.getenv("STUB_CHUNKS", "12")),
+            per_turn_ms=float(os.getenv("STUB_PER_TURN_MS", "0")),
+        )
+
+    def _sleep(self, ms):
+        if ms > 0:
+            time.sleep(ms * random.uniform(1 - self.jitter, 1 + self.jitter) / 1000)
+
+    def answer(self, prompt):
+        lines = ["Here is what the review reports say:", "", "Key Strengths:"]
+        half = self.chunks // 2
+        for i in range(half):
+            lines.append(f"- Strength {i + 1}: consistent practice that is reflected in the review judgements.")
+        lines += ["", "Key Challenges:"]
+        for i in range(self.chunks - half):
+            lines.append(f"{i + 1}. Area for improvement highlighted by the reviewers.")
+        return lines
+
+    def __call__(self, agent_id, agent_alias_id, session_id, prompt, region, enable_trace=False):
+        with self.lock:
+            earlier_turns = self.turns.get(session_id, 0)
+            self.turns[session_id] = earlier_turns + 1
+        return self.events(prompt, earlier_turns, enable_trace)
+
+    def trace_events(self, wait_ms, prompt):
+        # the time to first chunk split like a real agent call: pre-processing,
+        # a knowledge base lookup and the orchestration model call
+        def model_call(phase, trace_id, ms, input_tokens, output_tokens):
+            yield {'trace': {'trace': {phase: {'modelInvocationInput': {'traceId': trace_id}}}}}
+            self._sleep(ms)
+            usage = {'inputTokens': input_tokens, 'outputTokens': output_tokens}
+            yield {'trace': {'trace': {phase: {'modelInvocationOutput': {'traceId': trace_id, 'metadata': {'usage': usage}}}}}}
+        yield from model_call('preProcessingTrace', 'stub-pre', wait_ms * 0.15, len(prompt) // 4, 40)
+        yield {'trace': {'trace': {'orchestrationTrace': {'invocationInput': {'traceId': 'stub-kb', 'invocationType': 'KNOWLEDGE_BASE'}}}}}
+        self._sleep(wait_ms * 0.25)
+        yield {'trace': {'trace': {'orchestrationTrace': {'observation': {'traceId': 'stub-kb', 'type': 'KNOWLEDGE_BASE'}}}}}
+        yield from model_call('orchestrationTrace', 'stub-orch', wait_ms * 0.6, len(prompt) // 4 + 1500, 30 * self.chunks)
+
+    def events(self, prompt, earlier_turns=0, enable_trace=False):
+        wait_ms = self.time_to_first_chunk_ms + self.per_turn_ms * earlier_turns
+        if enable_trace:
+            yield from self.trace_events(wait_ms, prompt)
+        else:
+            self._sleep(wait_ms)
+        lines = self.answer(prompt)
+        per_chunk = max(1, len(lines) // self.chunks)
+        for i in range(0, len(lines), per_chunk):
+            if i > 0:
+                self._sleep(self.chunk_interval_ms)
+            yield {'chunk': {'bytes': ("\n".join(lines[i:i + per_chunk]) + "\n").encode()}}
+
+
+# Stand-in for retrieve_and_generate (KB_STUB=true), it answers after a single
+# delay and cites one reference carrying the request's metadata filter.
+class StubKnowledgeBase:
+    def __init__(self, latency_ms=500, jitter=0.3):
+        self.latency_ms = latency_ms
+        self.agent = StubAgent(jitter=jitter)
+
+    @classmethod
+    def from_env(cls):
+        return cls(latency_ms=float(os.getenv("STUB_KB_LATENCY_MS", "500")))
+
+    def __call__(self, request):
+        self.agent._sleep(self.latency_ms)
+        retrieval = request['retrieveAndGenerateConfiguration']['knowledgeBaseConfiguration']['retrievalConfiguration']
+        metadata_filter = retrieval['vectorSearchConfiguration'].get('filter')
+        return {
+            'output': {'text': "\n".join(self.agent.answer(request['input']['text']))},
+            'citations': [{'retrievedReferences': [{'content': {'text': 'stub report'}, 'metadata': metadata_filter}]}],
+        }
+
+
+# Stand-in for invoke_model (DIGEST_STUB=true), it answers after a single
+# delay in the Anthropic messages response format.
+class StubModel:
+    def __init__(self, latency_ms=300, jitter=0.3):
+        self.latency_ms = latency_ms
+        self.agent = StubAgent(jitter=jitter)
+
+    @classmethod
+    def from_env(cls):
+        return cls(latency_ms=float(os.getenv("STUB_MODEL_LATENCY_MS", "300")))
+
+    def __call__(self, model_id, body):
+        self.agent._sleep(self.latency_ms)
+        prompt = body['messages'][-1]['content'][0]['text']
+        text = "\n".join(self.agent.answer(prompt)) + "\n"
+        return {
+            'content': [{'type': 'text', 'text': text}],
+            'usage': {'input_tokens': len(prompt) // 4, 'output_tokens': len(text) // 4},
+        }
@@ -0,0 +1,36 @@
+import time
+
+from Bedrock_Lex.metrics import put_metric
+
+# Scheduled warmup pings, {"warmup": true} sent by an EventBridge rule.
+# A warmup event never reaches dispatch or the agent: it runs the one-time
+# initialization steps (clients, stores, Step trees, answer tables) so that
+# the next user turn on this container does not pay for them, and reports
+# how long each of them took. Steps that are already done take ~0 ms.
+_container_started = time.time()
+_warmups = 0
+
+def is_warmup_event(event):
+    return isinstance(event, dict) and event.get('warmup') is True
+
+def run_warmup(steps):
+    # steps: [(name, function)], a failing step is reported and skipped
+    global _warmups
+    _warmups += 1
+    timings = {}
+    failed = []
+    start = time.perf_counter()
+    for name, step in steps:
+        step_start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print("Warmup step failed: ", name, e)
+            failed.append(name)
+        timings[name] = round((time.perf_counter() - step_start) * 1000, 3)
+    total_ms = (time.perf_counter() - start) * 1000
+    cold = _warmups == 1
+    print(f"Warmup ({'first' if cold else 'repeat'}) took {total_ms:.1f} ms: ", timings)
+    put_metric('WarmupTime', total_ms, 'Milliseconds', dimensions={'Container': 'first' if cold else 'repeat'},
+               properties={'steps': timings, 'failed': failed, 'containerAgeSeconds': time.time() - _container_started})
+    return {'warmup': True, 'firstWarmup': cold, 'totalMs': round(total_ms, 3), 'timingsMs': timings, 'failed': failed}
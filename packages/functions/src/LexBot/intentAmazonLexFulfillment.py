@@ -1,32 +1,37 @@
 # --- Helpers that build all of the responses ---
 
 import json
-import os
-
-from Bedrock_Lex.invokeBedrockAgent import invoke_agent
+import time
+
+from Bedrock_Lex.agentRouter import agent_router
+from Bedrock_Lex.admission import QUOTA_MESSAGE, SHED_MESSAGE, admission_controller
+from Bedrock_Lex.answerCache import ANSWER_TTL_SECONDS, get_fallback_answer, load_precomputed_answers, lookup, put_answer
+from Bedrock_Lex.asyncJobs import delete_job_result, get_job_result, is_async_enabled, is_check_request, run_job, submit_job
+from Bedrock_Lex.invokeBedrockAgent import AgentResult, AgentUnavailableError, call_target, get_client
+from Bedrock_Lex.knowledgeBase import (
+    PROGRAMME_NAME, SCHOOL_NAME, UNIVERSITY_NAME, VOCATIONAL_NAME,
+    KnowledgeBaseQuery, retrieve_and_generate, split_names,
+)
+from Bedrock_Lex import knowledgeBase
+from Bedrock_Lex.lexModel import LexRequest, build_close, build_elicit_slot, create_message
+from Bedrock_Lex.metrics import put_metric
+from Bedrock_Lex.modelTiering import FAST_TIER, choose_tier, count_institutions, record_outcome
+from Bedrock_Lex.cacheFill import is_in_flight, run_cache_fill, start_fill, wait_for_fill
+from Bedrock_Lex import digests
+from Bedrock_Lex.digests import DigestQuery, answer_from_digest, get_digest_store
+from Bedrock_Lex.fullReport import FullReport, build_report
+from Bedrock_Lex import idempotency
+from Bedrock_Lex.prefetch import prefetcher
+from Bedrock_Lex.profiling import profiled
+from Bedrock_Lex.promptCatalog import prompt_catalog
 from Bedrock_Lex.prompts import *
-
-def create_message(message):
-    return {
-        'contentType': 'PlainText',
-        'content': message,
-    }
-def get_slots(intent_request):
-    return intent_request['sessionState']['intent']['slots']
-
-def get_session_attributes(intent_request):
-    sessionState = intent_request['sessionState']
-    if 'sessionAttributes' not in sessionState:
-        return {}
-    return sessionState['sessionAttributes']
-
-def get_slot(intent_request, slotName):
-    slots = get_slots(intent_request)
-    if slots is None or slotName not in slots or slots[slotName] is None:
-        return None
-    if len(slots[slotName]['value']['resolvedValues']) == 0:
-        return slots[slotName]['value']['originalValue']
-    return slots[slotName]['value']['resolvedValues'][0]
+from Bedrock_Lex import recorder
+from Bedrock_Lex.sessionContext import is_first_agent_turn, prepare_agent_session, remember_turn, rotate_agent_session
+from Bedrock_Lex.responsePipeline import TRUNCATED_HINT, is_more_request, next_page, paginate
+from Bedrock_Lex.slotExtractor import fill_slot, parse_utterance
+from Bedrock_Lex.slotValues import SCHOOL_ASPECTS, SLOT_OPTIONS, UNIVERSITY_STANDARDS, VOCATIONAL_ASPECTS
+from Bedrock_Lex.stores import get_store
+from Bedrock_Lex.warmup import is_warmup_event, run_warmup
 
 def get_slot_history(session_attributes):
     slot_string = session_attributes.get('slotHistory')
@@ -72,7 +77,7 @@ def update_slot_history(session_attributes, slot_to_elicit, intent_name):
     set_slot_history(slot_list, session_attributes)
 
 def retry_last_slot(intent_request):
-    session_attributes = get_session_attributes(intent_request)
+    session_attributes = intent_request.session_attributes
     slot_list = get_slot_history(session_attributes)
     session_attributes['retry'] = 'false'
 
@@ -89,10 +94,10 @@ def retry_last_slot(intent_request):
     # get slots from session_attributes if they exist
     WAS_FOLLOWUP = 'slots' in session_attributes and 'OtherQuestionsSlot' in last_slot
     if WAS_FOLLOWUP:
-        intent_request['sessionState']['intent']['slots'] = json.loads(session_attributes['slots'])
+        intent_request.set_slots(json.loads(session_attributes['slots']))
         session_attributes.pop('slots')
     else:
-        intent_request['sessionState']['intent']['slots'].pop(last_slot[1])
+        intent_request.pop_slot(last_slot[1])
     current_intent = last_slot[0]
     # get last slot, this will be reset
     last_slot = slot_list[-1]
@@ -106,56 +111,32 @@ def retry_last_slot(intent_request):
             last_slot[0],
         )
         if WAS_FOLLOWUP:
-            response['sessionState']['intent']['slots'] = get_slots(intent_request)
+            response['sessionState']['intent']['slots'] = intent_request.slots
     else:
         response = elicit_slot(
             intent_request,
             last_slot[1],
-            slots=get_slots(intent_request),
+            slots=intent_request.slots,
         )
     print("Response after retry: ", response)
 
     return response
 
-def elicit_slot(intent_request, slot_to_elicit, message = None, slots = {}, session_attributes = {}):
-    if session_attributes == {}:
-        session_attributes = get_session_attributes(intent_request)
-
-    intent_name = intent_request['sessionState']['intent']['name']
-    update_slot_history(session_attributes, slot_to_elicit, intent_name)
-
-    result = {
-        'sessionState':
-            {'dialogAction':
-                {'type': 'ElicitSlot',
-                    'slotToElicit': slot_to_elicit,
-                },
-                'intent':
-                    {
-                        'name': intent_request['sessionState']['intent']['name'],
-                        'slots': slots,
-                        'state': 'InProgress',
-                    },
-                'sessionAttributes': session_attributes,
-                'originatingRequestId': 'REQUESTID'
-            },
-        'sessionId': intent_request['sessionId'],
-        'requestAttributes': intent_request['requestAttributes']
-        if 'requestAttributes' in intent_request else None
-    }
+def elicit_slot(intent_request, slot_to_elicit, message=None, slots=None):
+    update_slot_history(intent_request.session_attributes, slot_to_elicit, intent_request.intent_name)
+    # a list of messages is sent as is, e.g. a long answer split in parts
+    messages = None
     if message is not None:
-        result['messages'] = [message]
-    return result
+        messages = message if isinstance(message, list) else [message]
+    return build_elicit_slot(intent_request, slot_to_elicit, intent_request.intent_name, slots, messages)
 
 
-def elicit_intent(intent_request, slot_to_elicit, intent_to_elicit, message=None, slots = {}, session_attributes = {}):
-    intent_request['sessionState']['intent']['confirmationState'] = 'None'
-    intent_request['sessionState']['intent']['name'] = intent_to_elicit
+def elicit_intent(intent_request, slot_to_elicit, intent_to_elicit, message=None, slots=None):
+    intent_request.intent_name = intent_to_elicit
     response = elicit_slot(
         intent_request,
         slot_to_elicit,
         slots=slots,
-        session_attributes=session_attributes,
         message=message,
     )
     return response
@@ -167,43 +148,188 @@ def followup(intent_request, message):
         'OtherIntent',
         message=message,
     )
-    slots = get_slots(intent_request)
-    if 'OtherQuestionsSlot' not in slots:
-        intent_request['sessionState']['sessionAttributes']['slots'] = json.dumps(slots)
+    if 'OtherQuestionsSlot' not in intent_request.slots:
+        intent_request.session_attributes['slots'] = json.dumps(intent_request.slots)
     return response
 
-def close(intent_request, fulfillment_state, message, session_attributes = {}):
-    if session_attributes == {}:
-        session_attributes = get_session_attributes(intent_request)
-    intent_request['sessionState']['intent']['state'] = fulfillment_state
-    return {
-        'sessionState': {
-            'sessionAttributes': session_attributes,
-            'dialogAction': {
-                'type': 'Close'
-            },
-            'intent': intent_request['sessionState']['intent'],
-            'originatingRequestId': intent_request['sessionState']['originatingRequestId']
-            # 'originatingRequestId': 'xxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx'
-        },
-        'messages': [ message ],
-        'sessionId': intent_request['sessionId'],
-        'requestAttributes': intent_request['requestAttributes'] if 'requestAttributes' in intent_request else None
-    }
-
-def invoke_bedrock(intent_request, prompt):
+def close(intent_request, fulfillment_state, message):
+    return build_close(intent_request, fulfillment_state, [message])
+
+def invoke_bedrock(intent_request, prompt, cacheable=True, kb_query=None, step_path=None, digest_query=None):
     print("Invoking bedrock with prompt: ", prompt)
-    # Get Bedrock ageant id and alias id
-    agent_id = os.getenv("agentId")
-    agent_alias_id = os.getenv("agentAliasId")
-    session_id = intent_request['sessionId']
+    session_id = intent_request.session_id
+    session_attributes = intent_request.session_attributes
+    intent_name = intent_request.intent_name
+    turn_metrics = intent_request.turn_metrics
+    turn_metrics['promptChars'] = len(prompt)
+    # a recent answer to the same prompt, e.g. a prefetched one
+    if cacheable:
+        cached, state, age = lookup(prompt)
+        turn_metrics['cache'] = state
+        put_metric('AnswerCacheLookup', 1, 'Count', dimensions={'Intent': intent_name, 'State': state})
+        if state == 'stale':
+            # served as is, the next user gets a refreshed answer
+            put_metric('AnswerCacheStaleness', age - ANSWER_TTL_SECONDS, 'Seconds')
+            refreshing = start_fill('refresh', prompt)
+            put_metric('AnswerCacheRefresh', 1, 'Count', dimensions={'Outcome': 'started' if refreshing else 'in_flight'})
+        if cached is None and is_in_flight(prompt):
+            # a prefetch of this prompt is running, its answer beats a second agent call
+            cached = wait_for_fill(prompt)
+            turn_metrics['cache'] = 'in_flight' if cached is not None else state
+            put_metric('AnswerCacheFillWait', 1, 'Count', dimensions={'Outcome': 'answered' if cached is not None else 'agent'})
+        if cached is not None:
+            turn_metrics['backend'] = 'cache'
+            return send_answer(intent_request, cached)
+    sticky_key = session_attributes.get('agentTarget')
+    # simple questions go to a faster model tier
+    tier_decision = choose_tier(intent_name, step_path, count_institutions(kb_query), prompt, agent_router.has_tier(FAST_TIER), sticky_key is not None)
+    # Pick the agent target, a session stays on one target so the agent keeps its memory
+    target = agent_router.pick(sticky_key, tier_decision.tier)
+    if sticky_key is not None and target.key != sticky_key:
+        # the new target has no memory of this agent session
+        rotate_agent_session(session_attributes, 'target')
+    session_attributes['agentTarget'] = target.key
+
+    # admission control keeps free-text questions from starving Analyze/Compare
+    if not admission_controller.check_session_quota(session_attributes):
+        put_metric('SessionQuotaExceeded', 1, 'Count', dimensions={'Intent': intent_name})
+        turn_metrics['throttled'] = 'quota'
+        return followup(intent_request, create_message(QUOTA_MESSAGE))
+    if not admission_controller.acquire(intent_name, session_id):
+        turn_metrics['throttled'] = 'shed'
+        admission_controller.refund_session_quota(session_attributes)
+        return followup(intent_request, create_message(SHED_MESSAGE))
+    result = None
+    try:
+        # a single institution's Analyze question can be answered from its offline digest
+        if digest_query is not None and digests.is_enabled():
+            answer = answer_from_digest(digest_query, prompt)
+            if answer is not None:
+                turn_metrics['backend'] = 'digest'
+                result = AgentResult(answer, True)
+        # structured questions can skip the agent and search the knowledge base directly
+        if result is None and kb_query is not None and knowledgeBase.is_enabled():
+            answer = retrieve_and_generate(kb_query, prompt)
+            if answer is not None:
+                turn_metrics['backend'] = 'knowledgeBase'
+                result = AgentResult(answer, True)
+        if result is None and is_async_enabled() and intent_request.on_chunk is None:
+            # answer is produced in the background and served on the next turn
+            # (a streaming client gets it as it is generated instead)
+            turn_metrics['backend'] = 'async'
+            return submit_agent_job(intent_request, target, prompt, cacheable)
+        if result is None:
+            # long chats move to a fresh agent session to keep per-turn latency flat
+            agent_session_id, agent_prompt = prepare_agent_session(session_attributes, session_id, prompt)
+            result = call_target(target, agent_session_id, agent_prompt, intent_request.on_chunk, hedgeable=is_first_agent_turn(session_attributes))
+            if result.hedge_won:
+                # the other target holds the agent session now, the next turns follow it
+                session_attributes['agentTarget'] = result.answered_by.key
+            # without the time a slow streaming client took to read the answer
+            latency_ms = result.agent_ms
+            turn_metrics.update(backend='agent', agentMs=round(latency_ms, 1), agentError=result.error)
+            remember_turn(session_attributes, result.completion if result.success else "", latency_ms)
+            record_outcome(tier_decision, target, result.success, latency_ms, len(result.completion))
+    except AgentUnavailableError:
+        turn_metrics['backend'] = 'fallback'
+        return send_fallback_answer(intent_request, prompt)
+    finally:
+        admission_controller.release(intent_name, session_id)
+    # a truncated answer is not cached, the next user may get the whole one
+    if result.success and cacheable and not result.truncated:
+        put_answer(prompt, result.completion)
+    return send_answer(intent_request, result.completion, truncated=result.truncated)
+
+def submit_agent_job(intent_request, target, prompt, cacheable):
+    session_attributes = intent_request.session_attributes
+    # one job per session, a second one would orphan the first
+    if 'pendingJob' in session_attributes:
+        admission_controller.refund_session_quota(session_attributes)
+        return followup(intent_request, create_message("I'm still working on your previous question. Type 'check' in a moment to see the answer."))
+    agent_session_id, agent_prompt = prepare_agent_session(session_attributes, intent_request.session_id, prompt)
+    job_id = submit_job(target.key, agent_session_id, agent_prompt, cache_prompt=prompt if cacheable else None, hedgeable=is_first_agent_turn(session_attributes))
+    response = followup(intent_request, create_message("I'm working on it, this one takes a little longer. Type 'check' in a moment to see the answer."))
+    response['sessionState']['sessionAttributes']['pendingJob'] = job_id
+    return response
+
+def send_full_report(intent_request, step, slots):
+    # every section of the report is asked concurrently, see fullReport.py
+    session_id = intent_request.session_id
+    intent_name = intent_request.intent_name
+    session_attributes = intent_request.session_attributes
+    intent_request.turn_metrics['backend'] = 'fullReport'
+    report = step.report
+    # every section may call the agent, each one counts against the quota
+    if not admission_controller.check_session_quota(session_attributes, len(report.aspects)):
+        put_metric('SessionQuotaExceeded', 1, 'Count', dimensions={'Intent': intent_name})
+        intent_request.turn_metrics['throttled'] = 'quota'
+        return followup(intent_request, create_message(QUOTA_MESSAGE))
+    # every section that calls the agent is admitted on its own, see fullReport.py
+    sections = [
+        (aspect, step.callback({**slots, report.aspect_slot: aspect}))
+        for aspect in report.aspects
+    ]
+    text, without_agent = build_report(intent_name, session_id, f"Full report for {slots[report.name_slot]}", sections)
+    admission_controller.refund_session_quota(session_attributes, without_agent)
+    return send_answer(intent_request, text)
+
+def send_still_working(intent_request):
+    # a retry of a turn that is still being answered
+    return followup(intent_request, create_message("I'm still working on your question. Please ask again in a moment."))
+
+def send_fallback_answer(intent_request, prompt):
+    # the agent is unavailable, answer with an older answer if there is one
+    answer, source = get_fallback_answer(prompt)
+    if answer is None:
+        source = 'apology'
+        answer = "Sorry, I'm having trouble answering right now. Please try again in a few minutes."
+    put_metric('FallbackAnswers', 1, 'Count', dimensions={'Source': source})
+    return send_answer(intent_request, answer)
+
+def serve_pending_job(intent_request):
+    # returns a response if the pending job should be answered this turn, else None
+    session_attributes = intent_request.session_attributes
+    job_id = session_attributes['pendingJob']
+    result = get_job_result(job_id)
+    if result is None or result['status'] != 'pending':
+        session_attributes.pop('pendingJob')
+        delete_job_result(job_id)
+        if result is not None and result['status'] == 'done':
+            if result.get('target'):
+                # a hedge may have answered, the session follows the target that holds it
+                session_attributes['agentTarget'] = result['target']
+            remember_turn(session_attributes, result['answer'], result.get('agentMs', 0))
+            return send_answer(intent_request, result['answer'])
+        return followup(intent_request, create_message("Sorry, I couldn't finish that answer. Please try asking again."))
+    if is_check_request(intent_request.input_transcript):
+        return followup(intent_request, create_message("Still working on it. Type 'check' again in a moment."))
+    # the user asked something else, the job stays pending
+    return None
+
+def send_answer(intent_request, text, truncated=False):
+    # long answers are split into several messages, the rest is kept for "more"
+    start = time.perf_counter()
+    if truncated:
+        text = text.rstrip() + "\n\n" + TRUNCATED_HINT
+    pages, has_more = paginate(intent_request.session_id, text)
+    response = followup(intent_request, [create_message(page) for page in pages])
+    response['sessionState']['sessionAttributes']['moreAvailable'] = 'true' if has_more else 'false'
+    build_time = (time.perf_counter() - start) * 1000
+    put_metric('ResponseBuildTime', build_time, 'Milliseconds')
+    put_metric('ResponseSize', len(json.dumps(response)), 'Bytes', properties={'messages': len(pages)})
+    return response
 
-    message = invoke_agent(agent_id, agent_alias_id, session_id, prompt)
-    response = create_message(message)
-    return followup(intent_request, response)
+def send_more(intent_request):
+    pages, has_more = next_page(intent_request.session_id)
+    if pages is None:
+        response = followup(intent_request, create_message("There is nothing more to show. What else would you like to know?"))
+    else:
+        response = followup(intent_request, [create_message(page) for page in pages])
+    response['sessionState']['sessionAttributes']['moreAvailable'] = 'true' if has_more else 'false'
+    return response
 
 class Step:
-    def __init__(self, name: str="", options_slot: str="", options=(), required_slots=(), callback=None) -> None:
+    def __init__(self, name: str="", options_slot: str="", options=(), required_slots=(), callback=None, cacheable: bool=True, kb_query=None, report=None, standard_slot=None) -> None:
         self.name = name
         self.options_slot = options_slot
         for option in options:
@@ -211,17 +337,31 @@ class Step:
         self.options = options
         self.required_slots = required_slots
         self.callback = callback
-
-    def process_step(self, intent_request):
+        # answers that depend on the conversation (follow-up questions) are not cached
+        self.cacheable = cacheable
+        # optional, returns a KnowledgeBaseQuery so the step can be answered by the knowledge base
+        self.kb_query = kb_query
+        # optional, the slot with the standard/aspect, so an Analyze step can be answered from a digest
+        self.standard_slot = standard_slot
+        # optional FullReport, the callback is then run for every aspect at once
+        self.report = report
+
+    def process_step(self, intent_request, parent_path="", utterance=None):
+        # e.g. "Analyze/University/Program Review"
+        path = f"{parent_path}/{self.name}" if parent_path else self.name
         # collect required slots for the callback later
         slots = {}
         for slot_name in self.required_slots:
-            slot_value = get_slot(intent_request, slot_name)
+            slot_value = intent_request.get_slot(slot_name)
+            # a typed first question may already answer it
+            if not slot_value and utterance is not None:
+                slot_value = fill_slot(intent_request, slot_name, utterance)
             if not slot_value:
+                self.prefetch(intent_request, slot_name)
                 return elicit_slot(
                     intent_request,
                     slot_name,
-                    slots=get_slots(intent_request),
+                    slots=intent_request.slots,
                 )
             slots[slot_name] = slot_value
         print("Required slots: ", slots)
@@ -229,46 +369,289 @@ class Step:
         # process the options if they exist
         if self.options_slot != "":
             print(f"Processing step for {self.options_slot} with name {self.name}")
-            slot_value = get_slot(intent_request, self.options_slot)
+            slot_value = intent_request.get_slot(self.options_slot)
+            if not slot_value and utterance is not None:
+                slot_value = fill_slot(intent_request, self.options_slot, utterance)
             if not slot_value:
                 print(f"Did not find slot {self.options_slot}, eliciting")
                 return elicit_slot(
                     intent_request,
                     self.options_slot,
-                    slots=get_slots(intent_request),
+                    slots=intent_request.slots,
                 )
 
             print("Checking options: ", self.options)
             for option in self.options:
                 if slot_value == option.name:
-                    return option.process_step(intent_request)
+                    return option.process_step(intent_request, path, utterance)
 
         # execute callback with required slots
         if self.callback is not None:
+            intent_request.turn_metrics['stepPath'] = path
+            if self.report is not None and self.report.is_requested(slots):
+                return send_full_report(intent_request, self, slots)
             print("No options, doing callback")
-            response = invoke_bedrock(intent_request, self.callback(slots))
+            kb_query = self.kb_query(slots) if self.kb_query is not None else None
+            digest_query = None
+            if self.standard_slot is not None and kb_query is not None:
+                digest_query = DigestQuery(kb_query.metadata, slots[self.standard_slot])
+            prompt = self.callback(slots)
+            if self.cacheable:
+                prefetcher.record_choices(slots)
+                prefetcher.record_outcome(intent_request.session_attributes, slots, prompt)
+            response = invoke_bedrock(intent_request, prompt, cacheable=self.cacheable, kb_query=kb_query, step_path=path, digest_query=digest_query)
             print("Callback response: ", response)
             return response
         # if no returns, failed
         print("Nothing :(")
         raise Exception("Fulfillment failed.")
 
+    def prefetch(self, intent_request, slot_name):
+        # while the last missing slot is a button, fetch the likely answers ahead
+        if not prefetcher.enabled or not self.cacheable or self.callback is None or slot_name not in SLOT_OPTIONS:
+            return
+        known = {}
+        for other in self.required_slots:
+            if other != slot_name:
+                known[other] = intent_request.get_slot(other)
+                if not known[other]:
+                    return
+        prompts = {value: self.callback({**known, slot_name: value}) for value in prefetcher.likely_values(slot_name)}
+        prefetcher.prefetch(slot_name, prompts, intent_request.session_attributes)
+
     def __repr__(self) -> str:
         return f"{self.name} for slot ({self.options_slot}) with options ({self.options}) and required slots ({self.required_slots})"
 
+# The Step trees do not depend on the request, they are built once per container
+def build_analyzing_step():
+    return Step(
+        'Analyze',
+        options_slot='InstituteTypeSlot',
+        options=(
+            Step(
+                'School',
+                required_slots=(
+                    'SchoolAspectSlot',
+                    'AnalyzeSchoolSlot',
+                ),
+                callback=lambda slots: create_school_analyze_prompt(slots['AnalyzeSchoolSlot'], slots['SchoolAspectSlot']),
+                kb_query=lambda slots: KnowledgeBaseQuery(
+                    f"How did {slots['AnalyzeSchoolSlot']} perform in terms of {slots['SchoolAspectSlot']}?",
+                    {SCHOOL_NAME: slots['AnalyzeSchoolSlot']},
+                ),
+                report=FullReport('SchoolAspectSlot', SCHOOL_ASPECTS, 'AnalyzeSchoolSlot'),
+                standard_slot='SchoolAspectSlot',
+            ),
+            Step(
+                'Vocational Training Center',
+                required_slots=(
+                    'VocationalAspectSlot',
+                    'AnalyzeVocationalSlot',
+                ),
+                callback=lambda slots: create_analyze_vocational_training_centre(slots['AnalyzeVocationalSlot'], slots['VocationalAspectSlot']),
+                kb_query=lambda slots: KnowledgeBaseQuery(
+                    f"How did {slots['AnalyzeVocationalSlot']} perform in terms of {slots['VocationalAspectSlot']}?",
+                    {VOCATIONAL_NAME: slots['AnalyzeVocationalSlot']},
+                ),
+                report=FullReport('VocationalAspectSlot', VOCATIONAL_ASPECTS, 'AnalyzeVocationalSlot'),
+                standard_slot='VocationalAspectSlot',
+            ),
+            Step(
+                'University',
+                options_slot='AnalyzeUniversitySlot',
+                options=(
+                    Step(
+                        'Program Review',
+                        required_slots=(
+                            'ProgramNameSlot',
+                            'StandardProgSlot',
+                            'UniNameSlot',
+                        ),
+                        callback=lambda slots: create_program_uni_analyze_prompt(slots['StandardProgSlot'], slots['ProgramNameSlot'], slots['UniNameSlot']),
+                        kb_query=lambda slots: KnowledgeBaseQuery(
+                            f"How did the {slots['ProgramNameSlot']} programme at {slots['UniNameSlot']} perform in terms of {slots['StandardProgSlot']}?",
+                            {UNIVERSITY_NAME: slots['UniNameSlot'], PROGRAMME_NAME: slots['ProgramNameSlot']},
+                        ),
+                        standard_slot='StandardProgSlot',
+                    ),
+                    Step(
+                        'Institutional Review',
+                        required_slots=(
+                            'StandardSlot',
+                            'AnalyzeUniversityNameSlot',
+                        ),
+                        callback=lambda slots: create_uni_analyze_prompt(slots['StandardSlot'], slots['AnalyzeUniversityNameSlot']),
+                        kb_query=lambda slots: KnowledgeBaseQuery(
+                            f"How did {slots['AnalyzeUniversityNameSlot']} perform in terms of {slots['StandardSlot']}?",
+                            {UNIVERSITY_NAME: slots['AnalyzeUniversityNameSlot']},
+                        ),
+                        standard_slot='StandardSlot',
+                    ),
+                    Step(
+                        'Full Report',
+                        required_slots=(
+                            'AnalyzeUniversityNameSlot',
+                        ),
+                        # every institutional standard of the university
+                        callback=lambda slots: create_uni_analyze_prompt(slots['StandardSlot'], slots['AnalyzeUniversityNameSlot']),
+                        report=FullReport('StandardSlot', UNIVERSITY_STANDARDS, 'AnalyzeUniversityNameSlot'),
+                    ),
+                )
+            ),
+        )
+    )
+
+def build_comparing_step():
+    return Step(
+        'Compare',
+        options_slot='InstituteCompareTypeSlot',
+        options=(
+            Step(
+                'University',
+                options_slot='CompareUniversitySlot',
+                options=(
+                    Step(
+                        'Institutes',
+                        required_slots=(
+                            'CompareUniStandardSlot',
+                            'CompareUniversityUniSlot',
+                        ),
+                        callback=lambda slots: create_compare_uni_prompt(slots['CompareUniversityUniSlot'], slots['CompareUniStandardSlot']),
+                        kb_query=lambda slots: KnowledgeBaseQuery(
+                            f"How did {slots['CompareUniversityUniSlot']} do in terms of {slots['CompareUniStandardSlot']}?",
+                            {UNIVERSITY_NAME: split_names(slots['CompareUniversityUniSlot'])},
+                        ),
+                    ),
+                    Step(
+                        'Programs',
+                        required_slots=(
+                            'CompareUniversityWProgramsSlot',
+                            'CompareUniversityWprogSlot',
+                            'CompareUniversityWprogUniversityNameSlot',
+                        ),
+                        callback=lambda slots: create_compare_programme(slots['CompareUniversityWProgramsSlot'], slots['CompareUniversityWprogSlot'], slots['CompareUniversityWprogUniversityNameSlot']),
+                        kb_query=lambda slots: KnowledgeBaseQuery(
+                            f"How did {slots['CompareUniversityWprogSlot']} at {slots['CompareUniversityWprogUniversityNameSlot']} do in terms of {slots['CompareUniversityWProgramsSlot']}?",
+                            {
+                                PROGRAMME_NAME: split_names(slots['CompareUniversityWprogSlot']),
+                                UNIVERSITY_NAME: split_names(slots['CompareUniversityWprogUniversityNameSlot']),
+                            },
+                        ),
+                    ),
+                )
+            ),
+            Step(
+                'School',
+                required_slots=(
+                    'CompareSchoolAspectlSlot',
+                ),
+                options_slot='CompareSchoolSlot',
+                options=(
+                    Step(
+                        'Governorate',
+                        required_slots=(
+                            'CompareSchoolAspectlSlot',
+                            'GovernorateSlot',
+                        ),
+                        callback=lambda slots: create_compare_schools_prompt(slots['GovernorateSlot'], slots['CompareSchoolAspectlSlot'], governorate=True)
+                    ),
+                    Step(
+                        'Specific Institutes',
+                        required_slots=(
+                            'CompareSchoolAspectlSlot',
+                            'CompareSpecificInstitutesSlot',
+                        ),
+                        callback=lambda slots: create_compare_schools_prompt(slots['CompareSpecificInstitutesSlot'], slots['CompareSchoolAspectlSlot']),
+                        kb_query=lambda slots: KnowledgeBaseQuery(
+                            f"How did {slots['CompareSpecificInstitutesSlot']} do in terms of {slots['CompareSchoolAspectlSlot']}?",
+                            {SCHOOL_NAME: split_names(slots['CompareSpecificInstitutesSlot'])},
+                        ),
+                    ),
+                    Step(
+                        'All Government Schools',
+                        required_slots=(
+                            'CompareSchoolAspectlSlot',
+                        ),
+                        callback=lambda slots: create_compare_schools_prompt("", slots['CompareSchoolAspectlSlot'], all_government=True)
+                    ),
+                    Step(
+                        'All Private Schools',
+                        required_slots=(
+                            'CompareSchoolAspectlSlot',
+                        ),
+                        callback=lambda slots: create_compare_schools_prompt("", slots['CompareSchoolAspectlSlot'], all_private=True)
+                    ),
+                )
+            ),
+            Step(
+                'Vocational Training Center',
+                required_slots=(
+                    'CompareVocationalaspectSlot',
+                    'CompareVocationalSlot',
+                ),
+                callback=lambda slots: create_compare_vocational_training_centres(slots['CompareVocationalSlot'], slots['CompareVocationalaspectSlot']),
+                kb_query=lambda slots: KnowledgeBaseQuery(
+                    f"How did {slots['CompareVocationalSlot']} do in terms of {slots['CompareVocationalaspectSlot']}?",
+                    {VOCATIONAL_NAME: split_names(slots['CompareVocationalSlot'])},
+                ),
+            ),
+        )
+    )
+
+def build_other_step():
+    return Step(
+        'Other',
+        required_slots=(
+            'OtherQuestionsSlot',
+        ),
+        callback=lambda slots: slots['OtherQuestionsSlot'],
+        cacheable=False,
+    )
+
+_step_trees = None
+
+def get_step_tree(intent_name):
+    global _step_trees
+    if _step_trees is None:
+        _step_trees = {
+            'AnalyzingIntent': build_analyzing_step(),
+            'ComparingIntent': build_comparing_step(),
+            'OtherIntent': build_other_step(),
+        }
+    return _step_trees[intent_name]
+
+def process_intent(intent_request):
+    # Lex sends the question itself when it matched the intent's own sample utterances
+    if not any(intent_request.slots.values()):
+        utterance = parse_utterance(intent_request.input_transcript)
+        if utterance is not None:
+            return start_from_utterance(intent_request, utterance)
+    return get_step_tree(intent_request.intent_name).process_step(intent_request)
+
+def start_from_utterance(intent_request, utterance):
+    # jumps to the first slot the typed question does not answer, or to the answer
+    intent_name = 'AnalyzingIntent' if utterance.intent == 'Analyze' else 'ComparingIntent'
+    intent_request.intent_name = intent_name
+    intent_request.set_slots({})
+    response = get_step_tree(intent_name).process_step(intent_request, utterance=utterance)
+    put_metric('UtteranceSlotsFilled', len(utterance.filled), 'Count', dimensions={'Intent': intent_name},
+               properties={'slots': utterance.filled})
+    return response
+
+
 def dispatch(intent_request):
 
     response = None
-    intent_name = intent_request['sessionState']['intent']['name']
-    returnToMenu = get_session_attributes(intent_request).get('return')
-    retrySlots = get_session_attributes(intent_request).get('retry')
+    intent_name = intent_request.intent_name
+    returnToMenu = intent_request.session_attributes.get('return')
+    retrySlots = intent_request.session_attributes.get('retry')
 
     # If user wants to go back to the main menu, elicit BQAIntent
     if returnToMenu and returnToMenu == 'true':
-        intent_request['sessionState']['sessionAttributes']['return'] = 'false'
-        set_slot_history([],intent_request['sessionState']['sessionAttributes'])
-        if 'slots' in get_session_attributes(intent_request):
-            intent_request['sessionState']['sessionAttributes'].pop('slots')
+        intent_request.session_attributes['return'] = 'false'
+        set_slot_history([],intent_request.session_attributes)
+        if 'slots' in intent_request.session_attributes:
+            intent_request.session_attributes.pop('slots')
         return elicit_intent(
             intent_request,
             "BQASlot",
@@ -278,9 +661,20 @@ def dispatch(intent_request):
     if retrySlots and retrySlots == 'true':
         return retry_last_slot(intent_request)
 
+    # Serve the answer of an asynchronous job once it is ready
+    if 'pendingJob' in intent_request.session_attributes:
+        response = serve_pending_job(intent_request)
+        if response is not None:
+            return response
+
+    # Serve the rest of a long answer
+    moreAvailable = intent_request.session_attributes.get('moreAvailable')
+    if moreAvailable == 'true' and is_more_request(intent_request.input_transcript):
+        return send_more(intent_request)
+
     # Handle BQAIntent
     if intent_name == 'BQAIntent':
-        bqa_slot = get_slot(intent_request, 'BQASlot')
+        bqa_slot = intent_request.get_slot('BQASlot')
         if bqa_slot == 'Analyze':
             response = elicit_intent(
                 intent_request,
@@ -301,6 +695,10 @@ def dispatch(intent_request):
                 "OtherIntent"
             )
         else:
+            # a typed question instead of a button, e.g. "compare Bahrain Polytechnic and AOU on quality of teaching"
+            utterance = parse_utterance(intent_request.input_transcript)
+            if utterance is not None:
+                return start_from_utterance(intent_request, utterance)
             response = {
                 "sessionState": {
                     "dialogAction": {
@@ -319,143 +717,13 @@ def dispatch(intent_request):
 
     # Handle AnalyzingIntent
     elif intent_name == 'AnalyzingIntent':
-        step = Step(
-            'Analyze',
-            options_slot='InstituteTypeSlot',
-            options=(
-                Step(
-                    'School',
-                    required_slots=(
-                        'SchoolAspectSlot',
-                        'AnalyzeSchoolSlot',
-                    ),
-                    callback=lambda slots: create_school_analyze_prompt(slots['AnalyzeSchoolSlot'], slots['SchoolAspectSlot'])
-                ),
-                Step(
-                    'Vocational Training Center',
-                    required_slots=(
-                        'VocationalAspectSlot',
-                        'AnalyzeVocationalSlot',
-                    ),
-                    callback=lambda slots: create_analyze_vocational_training_centre(slots['AnalyzeVocationalSlot'], slots['VocationalAspectSlot'])
-                ),
-                Step(
-                    'University',
-                    options_slot='AnalyzeUniversitySlot',
-                    options=(
-                        Step(
-                            'Program Review',
-                            required_slots=(
-                                'ProgramNameSlot',
-                                'StandardProgSlot',
-                                'UniNameSlot',
-                            ),
-                            callback=lambda slots: create_program_uni_analyze_prompt(slots['StandardProgSlot'], slots['ProgramNameSlot'], slots['UniNameSlot'])
-                        ),
-                        Step(
-                            'Institutional Review',
-                            required_slots=(
-                                'StandardSlot',
-                                'AnalyzeUniversityNameSlot',
-                            ),
-                            callback=lambda slots: create_uni_analyze_prompt(slots['StandardSlot'], slots['AnalyzeUniversityNameSlot'])
-                        ),
-                    )
-                ),
-            )
-        )
-        return step.process_step(intent_request)
+        return process_intent(intent_request)
     # Handle ComparingIntent
     elif intent_name == 'ComparingIntent':
-        step =  Step(
-            'Compare',
-            options_slot='InstituteCompareTypeSlot',
-            options=(
-                Step(
-                    'University',
-                    options_slot='CompareUniversitySlot',
-                    options=(
-                        Step(
-                            'Institutes',
-                            required_slots=(
-                                'CompareUniStandardSlot',
-                                'CompareUniversityUniSlot',
-                            ),
-                            callback=lambda slots: create_compare_uni_prompt(slots['CompareUniversityUniSlot'], slots['CompareUniStandardSlot'])
-                        ),
-                        Step(
-                            'Programs',
-                            required_slots=(
-                                'CompareUniversityWProgramsSlot',
-                                'CompareUniversityWprogSlot',
-                                'CompareUniversityWprogUniversityNameSlot',
-                            ),
-                            callback=lambda slots: create_compare_programme(slots['CompareUniversityWProgramsSlot'], slots['CompareUniversityWprogSlot'], slots['CompareUniversityWprogUniversityNameSlot'])
-                        ),
-                    )
-                ),
-                Step(
-                    'School',
-                    required_slots=(
-                        'CompareSchoolAspectlSlot',
-                    ),
-                    options_slot='CompareSchoolSlot',
-                    options=(
-                        Step(
-                            'Governorate',
-                            required_slots=(
-                                'CompareSchoolAspectlSlot',
-                                'GovernorateSlot',
-                            ),
-                            callback=lambda slots: create_compare_schools_prompt(slots['GovernorateSlot'], slots['CompareSchoolAspectlSlot'], governorate=True)
-                        ),
-                        Step(
-                            'Specific Institutes',
-                            required_slots=(
-                                'CompareSchoolAspectlSlot',
-                                'CompareSpecificInstitutesSlot',
-                            ),
-                            callback=lambda slots: create_compare_schools_prompt(slots['CompareSpecificInstitutesSlot'], slots['CompareSchoolAspectlSlot'])
-                        ),
-                        Step(
-                            'All Government Schools',
-                            required_slots=(
-                                'CompareSchoolAspectlSlot',
-                            ),
-                            callback=lambda slots: create_compare_schools_prompt("", slots['CompareSchoolAspectlSlot'], all_government=True)
-                        ),
-                        Step(
-                            'All Private Schools',
-                            required_slots=(
-                                'CompareSchoolAspectlSlot',
-                            ),
-                            callback=lambda slots: create_compare_schools_prompt("", slots['CompareSchoolAspectlSlot'], all_private=True)
-                        ),
-                    )
-                ),
-                Step(
-                    'Vocational Training Center',
-                    required_slots=(
-                        'CompareVocationalaspectSlot',
-                        'CompareVocationalSlot',
-                    ),
-                    callback=lambda slots: create_compare_vocational_training_centres(slots['CompareVocationalSlot'], slots['CompareVocationalaspectSlot'])
-                ),
-            )
-        )
-
-        return step.process_step(intent_request)
+        return process_intent(intent_request)
     # Handle OtherIntent
     elif intent_name == 'OtherIntent':
-        step = Step(
-            'Other',
-            required_slots=(
-                'OtherQuestionsSlot',
-            ),
-            callback=lambda slots: slots['OtherQuestionsSlot'],
-        )
-
-        return step.process_step(intent_request)
+        return get_step_tree(intent_name).process_step(intent_request)
 
     else:
         # General fallback for undefined intents
@@ -468,6 +736,59 @@ def dispatch(intent_request):
     return response
 
 
+def handle_event(event, on_chunk=None):
+    # the event is parsed once, the handlers work on the LexRequest
+    intent_request = LexRequest(event)
+    intent_request.on_chunk = on_chunk
+    intent_name = intent_request.intent_name
+    start = time.perf_counter()
+    if idempotency.is_enabled():
+        # a retried turn gets the first invocation's response
+        response = idempotency.run_once(intent_request, dispatch, send_still_working)
+    else:
+        response = dispatch(intent_request)
+    # one record per turn, the input of tools/analyzeLogs.py
+    put_metric('TurnLatency', (time.perf_counter() - start) * 1000, 'Milliseconds', dimensions={'Intent': intent_name},
+               properties=intent_request.turn_metrics)
+    return response
+
+def warm_agent_clients():
+    # one pooled client per region the agent targets and the knowledge base use
+    regions = {target.region for target in agent_router.targets}
+    if knowledgeBase.is_enabled():
+        regions.add(knowledgeBase.KB_REGION)
+    for region in regions:
+        get_client(region)
+    if digests.is_enabled():
+        get_client(digests.DIGEST_REGION, "bedrock-runtime")
+
+def warm_up():
+    return run_warmup((
+        ('agentClients', warm_agent_clients),
+        ('stateStore', get_store),
+        ('promptCatalog', prompt_catalog.load),
+        ('stepTrees', lambda: [get_step_tree(name) for name in ('AnalyzingIntent', 'ComparingIntent', 'OtherIntent')]),
+        ('precomputedAnswers', load_precomputed_answers),
+        ('digests', get_digest_store),
+    ))
+
+# wrapped only when PROFILE_MODE is set
+@profiled
 def lambda_handler(event, context):
-    return dispatch(event)
+    # scheduled warmup pings only initialize this container
+    if is_warmup_event(event):
+        return warm_up()
+    # capture real conversations for offline replay when recording is enabled
+    if recorder.is_enabled():
+        return recorder.record_invocation(handle_event, event)
+    return handle_event(event)
+
+# Worker for asynchronous fulfillment and cache fill jobs delivered by SQS
+def job_worker_handler(event, context):
+    for record in event['Records']:
+        job = json.loads(record['body'])
+        if job.get('kind') in ('prefetch', 'refresh'):
+            run_cache_fill(job)
+        else:
+            run_job(job)
 
@@ -0,0 +1,180 @@
+# --- Streaming HTTP entry point, next to the Lex lambda_handler ---
+#
+# Serves the same turns (dispatch, the Step trees and the prompts) over HTTP
+# and sends the agent's answer to the web frontend while it is generated.
+# POST /turn takes a Lex V2 style event:
+#   {"sessionId": "...", "inputTranscript": "...", "sessionState": {"intent": {...}, "sessionAttributes": {...}}}
+# and answers with newline-delimited JSON, sent with chunked transfer encoding:
+#   {"type": "chunk", "text": "..."}         every agent chunk, as it arrives
+#   {"type": "response", "response": {...}}  the Lex-shaped response, with the next sessionState
+#   {"type": "error", "message": "..."}      instead of the response when the turn failed
+# Turns that do not call the agent (slot elicitation, cached answers) only
+# send the response line.
+#
+# The turn runs in a worker thread that hands the chunks to the HTTP thread
+# through a queue of STREAM_BUFFER_CHUNKS. When the client reads slower than
+# the agent writes, the socket and then the queue fill up, and the worker
+# blocks, so the agent stream is read no faster than the client
+# (backpressure). A client that stops reading for STREAM_CLIENT_TIMEOUT_SECONDS,
+# or disconnects, stops the agent stream.
+#
+#   AGENT_STUB=true python streamingHandler.py      (tools/streamingCheck.py compares it with lambda_handler)
+#
+# On Lambda it runs behind the Lambda Web Adapter with response streaming
+# (AWS_LWA_INVOKE_MODE=response_stream, PORT, readiness check on GET /health).
+import json
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import intentAmazonLexFulfillment
+from Bedrock_Lex.metrics import put_metric
+
+STREAM_PORT = int(os.getenv("PORT", "8080"))
+BUFFER_CHUNKS = int(os.getenv("STREAM_BUFFER_CHUNKS", "8"))
+CLIENT_TIMEOUT_SECONDS = float(os.getenv("STREAM_CLIENT_TIMEOUT_SECONDS", "30"))
+MAX_BODY_BYTES = 64 * 1024
+
+class TurnStream:
+    # the chunks and the response of one turn, from the worker to the HTTP thread
+    def __init__(self, buffer_chunks=BUFFER_CHUNKS, client_timeout=CLIENT_TIMEOUT_SECONDS):
+        self.queue = queue.Queue(maxsize=buffer_chunks)
+        self.client_timeout = client_timeout
+        # set when the client disconnected or stopped reading
+        self.client_gone = False
+
+    def on_chunk(self, text):
+        # called by call_agent for every chunk, False stops the agent stream
+        if self.client_gone:
+            return False
+        try:
+            self.queue.put(('chunk', text), timeout=self.client_timeout)
+        except queue.Full:
+            print("Streaming client stopped reading, stopping the agent stream")
+            self.client_gone = True
+            return False
+        return True
+
+    def finish(self, kind, value):
+        try:
+            self.queue.put((kind, value), timeout=self.client_timeout)
+        except queue.Full:
+            self.client_gone = True
+
+    def __iter__(self):
+        while True:
+            kind, value = self.queue.get()
+            yield kind, value
+            if kind != 'chunk':
+                return
+
+
+def run_turn(event, stream):
+    try:
+        response = intentAmazonLexFulfillment.handle_event(event, on_chunk=stream.on_chunk)
+        stream.finish('response', response)
+    except Exception as e:
+        print("Streaming turn failed: ", e)
+        stream.finish('error', "Sorry, something went wrong. Please try again.")
+
+def stream_line(kind, value):
+    if kind == 'chunk':
+        line = {'type': 'chunk', 'text': value}
+    elif kind == 'response':
+        line = {'type': 'response', 'response': value}
+    else:
+        line = {'type': 'error', 'message': value}
+    return (json.dumps(line) + "\n").encode()
+
+
+class TurnRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path != '/health':
+            return self.send_error(404)
+        self.send_json(200, {'status': 'ok'})
+
+    def do_POST(self):
+        if self.path != '/turn':
+            return self.send_error(404)
+        start = time.perf_counter()
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0 or length > MAX_BODY_BYTES:
+            return self.send_json(400, {'message': 'expected a JSON event'})
+        try:
+            event = json.loads(self.rfile.read(length))
+            if not isinstance(event, dict) or not event.get('sessionId'):
+                raise ValueError("sessionId is missing")
+        except ValueError as e:
+            return self.send_json(400, {'message': f'bad event: {e}'})
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        stream = TurnStream()
+        threading.Thread(target=run_turn, args=(event, stream), daemon=True).start()
+        first_byte_ms = None
+        chunks = 0
+        for kind, value in stream:
+            if stream.client_gone:
+                # keep draining until the worker finishes, nothing is written anymore
+                continue
+            try:
+                self.write_chunk(stream_line(kind, value))
+            except OSError:
+                print("Streaming client disconnected")
+                stream.client_gone = True
+                continue
+            if first_byte_ms is None:
+                first_byte_ms = (time.perf_counter() - start) * 1000
+                put_metric('StreamTimeToFirstByte', first_byte_ms, 'Milliseconds', dimensions={'First': kind})
+            chunks += kind == 'chunk'
+        if not stream.client_gone:
+            try:
+                self.write_chunk(b"")
+            except OSError:
+                stream.client_gone = True
+        if stream.client_gone:
+            # the response is incomplete, the connection cannot be reused
+            self.close_connection = True
+        put_metric('StreamTurnTime', (time.perf_counter() - start) * 1000, 'Milliseconds',
+                   properties={'chunks': chunks, 'firstByteMs': first_byte_ms, 'clientGone': stream.client_gone})
+
+    def write_chunk(self, data):
+        # one HTTP chunk, flushed right away; blocks while the client is not reading
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # the turn itself is logged by the handler
+        pass
+
+
+def create_server(port=STREAM_PORT):
+    server = ThreadingHTTPServer(('', port), TurnRequestHandler)
+    server.daemon_threads = True
+    return server
+
+def main():
+    # the first turn should not pay for the clients, stores and Step trees
+    intentAmazonLexFulfillment.warm_up()
+    server = create_server()
+    print(f"Streaming fulfillment listening on port {server.server_address[1]}")
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
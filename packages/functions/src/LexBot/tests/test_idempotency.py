@@ -0,0 +1,79 @@
+# python -m unittest discover -s tests   (from packages/functions/src/LexBot)
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ['AGENT_STUB'] = 'true'
+os.environ['ASYNC_FULFILLMENT'] = 'false'
+os.environ.setdefault('METRICS_ENABLED', 'false')
+
+import intentAmazonLexFulfillment
+from Bedrock_Lex import idempotency
+from Bedrock_Lex.lexModel import LexRequest
+from Bedrock_Lex.stores import MemoryStore, set_store
+
+def typed_event(text, session_id='idempotency-test', attributes=None):
+    return {
+        'sessionId': session_id,
+        'inputTranscript': text,
+        'sessionState': {
+            'intent': {'name': 'BQAIntent', 'slots': {}, 'state': 'InProgress', 'confirmationState': 'None'},
+            'sessionAttributes': dict(attributes or {}),
+            'originatingRequestId': 'request-1',
+        },
+    }
+
+
+class RunOnceTest(unittest.TestCase):
+    def setUp(self):
+        self.store = MemoryStore()
+        set_store(self.store)
+        idempotency.set_result_store(self.store)
+        self.enabled, self.wait_seconds = idempotency.ENABLED, idempotency.WAIT_SECONDS
+        idempotency.ENABLED = True
+
+    def tearDown(self):
+        idempotency.set_result_store(None)
+        idempotency.ENABLED, idempotency.WAIT_SECONDS = self.enabled, self.wait_seconds
+
+    def test_fallback_response_gets_the_turn_number(self):
+        # the "didn't understand" response has no session attributes of its own
+        response = intentAmazonLexFulfillment.handle_event(typed_event("hello there"))
+        self.assertEqual(response['sessionState']['dialogAction']['slotToElicit'], 'BQASlot')
+        self.assertEqual(response['sessionState']['sessionAttributes'][idempotency.TURN_ATTRIBUTE], '1')
+
+    def test_retry_gets_the_stored_response(self):
+        calls = []
+        def handler(request):
+            calls.append(request)
+            return intentAmazonLexFulfillment.dispatch(request)
+        still_working = intentAmazonLexFulfillment.send_still_working
+        first = idempotency.run_once(LexRequest(typed_event("hello there")), handler, still_working)
+        retry = idempotency.run_once(LexRequest(typed_event("hello there")), handler, still_working)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(retry, first)
+
+    def test_retry_of_a_running_turn_gets_still_working(self):
+        idempotency.WAIT_SECONDS = 0.05
+        request = LexRequest(typed_event("hello there"))
+        # the first invocation is still running
+        self.store.add(idempotency.request_key(request, 0), {'status': 'pending'}, ttl=60)
+        response = idempotency.run_once(request, intentAmazonLexFulfillment.dispatch, intentAmazonLexFulfillment.send_still_working)
+        self.assertIn("still working", response['messages'][0]['content'])
+
+    def test_failed_turn_releases_its_claim(self):
+        def failing(request):
+            raise RuntimeError("agent failed")
+        def no_session_state(request):
+            return {'messages': []}
+        for handler in (failing, no_session_state):
+            request = LexRequest(typed_event("hello there"))
+            with self.assertRaises(Exception):
+                idempotency.run_once(request, handler, intentAmazonLexFulfillment.send_still_working)
+            # a retry runs the turn right away instead of waiting for the claim
+            self.assertIsNone(self.store.get(idempotency.request_key(request, 0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+# python -m unittest discover -s tests   (from packages/functions/src/LexBot)
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Bedrock_Lex.slotExtractor import parse_utterance
+
+def slot_values(text, slot_names):
+    utterance = parse_utterance(text)
+    return {name: utterance.slot_value(name) for name in slot_names}
+
+
+class GenericQuestionTest(unittest.TestCase):
+    def test_questions_without_an_institution_are_not_analyze_questions(self):
+        for text in (
+            "How does BQA review schools?",
+            "how did universities do in 2023",
+            "how do I reset my password at the training centre",
+        ):
+            self.assertIsNone(parse_utterance(text), text)
+
+    def test_unknown_names_are_asked_for(self):
+        values = slot_values("analyze the best school in town", ('AnalyzeSchoolSlot',))
+        self.assertEqual(values, {'AnalyzeSchoolSlot': None})
+
+    def test_review_kind_is_not_guessed(self):
+        values = slot_values("analyze University of Bahrain", ('AnalyzeUniversitySlot', 'AnalyzeUniversityNameSlot'))
+        self.assertEqual(values, {'AnalyzeUniversitySlot': None, 'AnalyzeUniversityNameSlot': 'University of Bahrain'})
+        values = slot_values("compare University of Bahrain and Bahrain Polytechnic", ('CompareUniversitySlot',))
+        self.assertEqual(values, {'CompareUniversitySlot': None})
+
+
+class NamedQuestionTest(unittest.TestCase):
+    def test_of_x_and_y_names_two_institutions(self):
+        values = slot_values("compare University of Bahrain and Bahrain Polytechnic",
+                             ('InstituteCompareTypeSlot', 'CompareUniversityUniSlot'))
+        self.assertEqual(values, {
+            'InstituteCompareTypeSlot': 'University',
+            'CompareUniversityUniSlot': 'University of Bahrain, Bahrain Polytechnic',
+        })
+
+    def test_of_x_and_y_inside_one_name(self):
+        utterance = parse_utterance("compare Bahrain Institute of Banking and Finance and Bahrain Training Institute")
+        self.assertEqual(utterance.names, ['Bahrain Institute of Banking and Finance', 'Bahrain Training Institute'])
+
+    def test_aliases_and_standard(self):
+        values = slot_values("compare Bahrain Polytechnic and AOU on quality of teaching",
+                             ('CompareUniversitySlot', 'CompareUniversityUniSlot', 'CompareUniStandardSlot'))
+        self.assertEqual(values, {
+            'CompareUniversitySlot': 'Institutes',
+            'CompareUniversityUniSlot': 'Bahrain Polytechnic, Arab Open University',
+            'CompareUniStandardSlot': 'The Quality of Teaching and Learning',
+        })
+
+    def test_school_name_without_a_cue(self):
+        values = slot_values("How did Ibn Khuldoon National School do in terms of teaching, learning and assessment?",
+                             ('InstituteTypeSlot', 'AnalyzeSchoolSlot', 'SchoolAspectSlot'))
+        self.assertEqual(values, {
+            'InstituteTypeSlot': 'School',
+            'AnalyzeSchoolSlot': 'Ibn Khuldoon National School',
+            'SchoolAspectSlot': 'Teaching, Learning and Assessment',
+        })
+
+    def test_programmes(self):
+        utterance = parse_utterance("compare Bachelor of Business Administration and Bachelor of Accounting at UoB and ASU on efficiency of the programme")
+        self.assertEqual(utterance.programmes, ['Bachelor of Business Administration', 'Bachelor of Accounting'])
+        self.assertEqual(utterance.names, ['University of Bahrain', 'Applied Science University'])
+        self.assertEqual(utterance.slot_value('CompareUniversitySlot'), 'Programs')
+
+
+if __name__ == '__main__':
+    unittest.main()
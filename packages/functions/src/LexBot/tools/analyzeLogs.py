@@ -0,0 +1,368 @@
+# Turns exported handler logs into per-intent and per-Step-path latency and
+# cost numbers, fully offline. It reads the TurnLatency records the handler
+# logs once per turn (EMF, see handle_event and Bedrock_Lex/metrics.py).
+#
+#   aws logs filter-log-events --log-group-name /aws/lambda/<fulfillment function> \
+#       --filter-pattern TurnLatency --start-time ... > turns.json
+#   python tools/analyzeLogs.py turns.json exports/ --window 60 --output report.json
+#
+# Inputs are files or directories (.gz files are read as they are):
+#   - JSON lines: one EMF record, or one {"timestamp", "message"} log event, per line
+#   - CloudWatch Logs exports to S3: "<timestamp> <message>" per line
+#   - one JSON document with an "events" array (filter-log-events output)
+# Files are read in chunks of lines, big JSON lines files are split in byte
+# ranges, and the pieces are parsed by a pool of --jobs processes. Latencies
+# go into log-scale histograms, so memory does not grow with the number of
+# turns and the percentiles are within ~2%.
+import argparse
+import gzip
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+
+RECORD_NAME = 'TurnLatency'
+RECORD_MARKER = '"TurnLatency"'
+# relative width of a histogram bucket
+BUCKET_GROWTH = 1.04
+SPLIT_BYTES = 64 * 1024 * 1024
+READ_BYTES = 1024 * 1024
+PERCENTILES = (50, 90, 99)
+THROTTLE_ERRORS = ('throttlingException', 'ThrottlingException')
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        bucket = int(math.log1p(max(value, 0.0)) / math.log(BUCKET_GROWTH))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                # the middle of the bucket
+                return min(self.max, math.expm1((bucket + 0.5) * math.log(BUCKET_GROWTH)))
+        return self.max
+
+
+class GroupStats:
+    # the turns of one intent or Step path in one time window
+    def __init__(self):
+        self.latency = Histogram()
+        self.agent_latency = Histogram()
+        self.prompt_chars = Histogram()
+        self.agent_ms = 0.0
+        self.backends = {}
+        self.cache = {}
+        self.throttled = {}
+
+    def add(self, latency_ms, properties):
+        self.latency.add(latency_ms)
+        if properties.get('agentMs') is not None:
+            self.agent_ms += properties['agentMs']
+            self.agent_latency.add(properties['agentMs'])
+        if properties.get('promptChars') is not None:
+            self.prompt_chars.add(properties['promptChars'])
+        backend = properties.get('backend')
+        if backend:
+            self.backends[backend] = self.backends.get(backend, 0) + 1
+        if properties.get('cache'):
+            self.cache[properties['cache']] = self.cache.get(properties['cache'], 0) + 1
+        throttled = properties.get('throttled')
+        if not throttled and properties.get('agentError') in THROTTLE_ERRORS:
+            throttled = 'agent'
+        if throttled:
+            self.throttled[throttled] = self.throttled.get(throttled, 0) + 1
+
+    def merge(self, other):
+        self.latency.merge(other.latency)
+        self.agent_latency.merge(other.agent_latency)
+        self.prompt_chars.merge(other.prompt_chars)
+        self.agent_ms += other.agent_ms
+        for mine, theirs in ((self.backends, other.backends), (self.cache, other.cache), (self.throttled, other.throttled)):
+            for key, count in theirs.items():
+                mine[key] = mine.get(key, 0) + count
+
+    def summary(self):
+        turns = self.latency.count
+        lookups = sum(self.cache.values())
+        return {
+            'turns': turns,
+            'latencyMs': {f"p{p}": round(self.latency.percentile(p), 1) for p in PERCENTILES},
+            'meanLatencyMs': round(self.latency.total / turns, 1) if turns else 0.0,
+            # share of the handler's time spent waiting for the agent
+            'agentTimeShare': round(self.agent_ms / self.latency.total, 3) if self.latency.total else 0.0,
+            'agentCalls': self.agent_latency.count,
+            'agentLatencyMs': {f"p{p}": round(self.agent_latency.percentile(p), 1) for p in PERCENTILES},
+            'cacheHitRate': round((self.cache.get('fresh', 0) + self.cache.get('stale', 0)) / lookups, 3) if lookups else None,
+            'cacheLookups': lookups,
+            'throttleRate': round(sum(self.throttled.values()) / turns, 4) if turns else 0.0,
+            'throttled': dict(self.throttled),
+            'promptChars': {
+                'mean': round(self.prompt_chars.total / self.prompt_chars.count) if self.prompt_chars.count else 0,
+                'p90': round(self.prompt_chars.percentile(90)),
+                'max': round(self.prompt_chars.max),
+            },
+            'backends': dict(self.backends),
+        }
+
+
+class Aggregate:
+    def __init__(self, window_seconds):
+        self.window_seconds = window_seconds
+        # (window start, 'intent' or 'stepPath', name) -> GroupStats
+        self.groups = {}
+        self.records = 0
+        self.skipped = 0
+        self.first = None
+        self.last = None
+
+    def add(self, record):
+        timestamp = record['_aws']['Timestamp'] / 1000
+        window = int(timestamp // self.window_seconds * self.window_seconds)
+        self.first = timestamp if self.first is None else min(self.first, timestamp)
+        self.last = timestamp if self.last is None else max(self.last, timestamp)
+        self.records += 1
+        latency_ms = float(record[RECORD_NAME])
+        self._group(window, 'intent', record.get('Intent') or 'unknown').add(latency_ms, record)
+        if record.get('stepPath'):
+            self._group(window, 'stepPath', record['stepPath']).add(latency_ms, record)
+
+    def _group(self, window, kind, name):
+        key = (window, kind, name)
+        if key not in self.groups:
+            self.groups[key] = GroupStats()
+        return self.groups[key]
+
+    def merge(self, other):
+        for key, stats in other.groups.items():
+            if key in self.groups:
+                self.groups[key].merge(stats)
+            else:
+                self.groups[key] = stats
+        self.records += other.records
+        self.skipped += other.skipped
+        for timestamp in (other.first, other.last):
+            if timestamp is not None:
+                self.first = timestamp if self.first is None else min(self.first, timestamp)
+                self.last = timestamp if self.last is None else max(self.last, timestamp)
+
+    def totals(self):
+        # every window merged, {kind: {name: GroupStats}}
+        totals = {'intent': {}, 'stepPath': {}}
+        for (_, kind, name), stats in self.groups.items():
+            totals[kind].setdefault(name, GroupStats()).merge(stats)
+        return totals
+
+    def report(self):
+        windows = {}
+        for (window, kind, name), stats in sorted(self.groups.items()):
+            entry = windows.setdefault(window, {'start': iso(window), 'intents': {}, 'stepPaths': {}})
+            entry['intents' if kind == 'intent' else 'stepPaths'][name] = stats.summary()
+        totals = self.totals()
+        return {
+            'records': self.records,
+            'skippedLines': self.skipped,
+            'from': iso(self.first) if self.first is not None else None,
+            'to': iso(self.last) if self.last is not None else None,
+            'windowSeconds': self.window_seconds,
+            'total': {
+                'intents': {name: stats.summary() for name, stats in sorted(totals['intent'].items())},
+                'stepPaths': {name: stats.summary() for name, stats in sorted(totals['stepPath'].items())},
+            },
+            'windows': [windows[window] for window in sorted(windows)],
+        }
+
+
+def iso(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+def parse_record(line):
+    # the TurnLatency record of a log line, None for any other line
+    if RECORD_MARKER not in line:
+        return None
+    start = line.find('{')
+    if start < 0:
+        return None
+    record = json.loads(line[start:])
+    if 'message' in record and '_aws' not in record:
+        message = record['message']
+        record = json.loads(message[message.find('{'):])
+    if RECORD_NAME not in record or '_aws' not in record:
+        return None
+    return record
+
+def add_line(aggregate, line):
+    try:
+        record = parse_record(line)
+    except (ValueError, KeyError, TypeError):
+        aggregate.skipped += 1
+        return
+    if record is not None:
+        aggregate.add(record)
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, encoding='utf-8', errors='replace')
+
+def is_document(path):
+    # one JSON document (e.g. {"events": [...]}) rather than one record per line
+    with open_text(path) as f:
+        first = f.readline().strip()
+    if not first.startswith(('{', '[')):
+        return False
+    try:
+        json.loads(first)
+        return False
+    except ValueError:
+        return True
+
+def iter_document_events(f):
+    # the objects of the "events" array (or of a top-level array), one at a time
+    decoder = json.JSONDecoder()
+    buffer = f.read(READ_BYTES)
+    marker = buffer.find('"events"')
+    position = buffer.find('[', marker if marker >= 0 else 0) + 1
+    if position == 0:
+        return
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position >= len(buffer) - 1:
+            more = f.read(READ_BYTES)
+            if not more:
+                return
+            buffer = buffer[position:] + more
+            position = 0
+            continue
+        if buffer[position] == ']':
+            return
+        try:
+            event, end = decoder.raw_decode(buffer, position)
+        except ValueError:
+            # the object continues in the next chunk
+            more = f.read(READ_BYTES)
+            if not more:
+                return
+            buffer = buffer[position:] + more
+            position = 0
+            continue
+        yield event
+        position = end
+        # keep the buffer small
+        if position > READ_BYTES:
+            buffer = buffer[position:]
+            position = 0
+
+def process_task(task):
+    # task: (path, start, end, window_seconds), end is None for the whole file
+    path, start, end, window_seconds = task
+    aggregate = Aggregate(window_seconds)
+    if end is None and is_document(path):
+        with open_text(path) as f:
+            for event in iter_document_events(f):
+                message = event.get('message', '') if isinstance(event, dict) else ''
+                add_line(aggregate, message if message else json.dumps(event))
+        return aggregate
+    if end is None:
+        with open_text(path) as f:
+            for line in f:
+                add_line(aggregate, line)
+        return aggregate
+    with open(path, 'rb') as f:
+        if start > 0:
+            # the line that crosses the start belongs to the previous range
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            add_line(aggregate, line.decode('utf-8', errors='replace'))
+    return aggregate
+
+def list_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names) if not name.startswith('.'))
+        else:
+            files.append(path)
+    return files
+
+def build_tasks(files, window_seconds):
+    tasks = []
+    for path in files:
+        size = os.path.getsize(path)
+        if path.endswith('.gz') or size <= SPLIT_BYTES or is_document(path):
+            tasks.append((path, 0, None, window_seconds))
+            continue
+        for start in range(0, size, SPLIT_BYTES):
+            tasks.append((path, start, min(size, start + SPLIT_BYTES), window_seconds))
+    return tasks
+
+def print_table(title, summaries):
+    print(title)
+    print(f"  {'name':<45} {'turns':>7} {'p50':>8} {'p90':>8} {'p99':>8} {'agent':>6} {'cache':>6} {'thrott':>7} {'prompt':>7}")
+    for name, summary in summaries.items():
+        latency = summary['latencyMs']
+        cache = f"{summary['cacheHitRate']:.0%}" if summary['cacheHitRate'] is not None else '-'
+        print(f"  {name[:45]:<45} {summary['turns']:>7} {latency['p50']:>8.0f} {latency['p90']:>8.0f} {latency['p99']:>8.0f} "
+              f"{summary['agentTimeShare']:>6.0%} {cache:>6} {summary['throttleRate']:>7.2%} {summary['promptChars']['mean']:>7}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-intent and per-Step-path latency and cost report from exported handler logs")
+    parser.add_argument('paths', nargs='+', help="log export files or directories")
+    parser.add_argument('--window', type=float, default=60, help="minutes per time window")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help="parser processes")
+    parser.add_argument('--output', default='log-report.json', help="where the JSON report is written")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    window_seconds = int(args.window * 60)
+    tasks = build_tasks(list_files(args.paths), window_seconds)
+    aggregate = Aggregate(window_seconds)
+    if args.jobs > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(min(args.jobs, len(tasks))) as pool:
+            for partial in pool.imap_unordered(process_task, tasks):
+                aggregate.merge(partial)
+    else:
+        for task in tasks:
+            aggregate.merge(process_task(task))
+    report = aggregate.report()
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+
+    print(f"{aggregate.records} turns from {report['from']} to {report['to']}, {aggregate.skipped} unreadable lines, "
+          f"{len(tasks)} pieces in {time.perf_counter() - start:.1f} s")
+    print("latency ms p50/p90/p99, agent time share, answer cache hit rate, throttle rate, mean prompt chars")
+    print_table("by intent:", report['total']['intents'])
+    print_table("by Step path:", report['total']['stepPaths'])
+    print(f"{len(report['windows'])} windows of {args.window:g} min in {args.output}")
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+# Micro-benchmark of the per-turn overhead of lambda_handler.
+# Runs a fixed set of turns that never wait on the agent (slot elicitation,
+# retry, return to the menu and cached answers) many times and
+# reports the time per turn. The agent is stubbed with no delay.
+#
+#   python tools/benchmarkTurns.py --iterations 2000
+#   python tools/benchmarkTurns.py --compare /path/to/other/LexBot
+#
+# --compare runs the same benchmark against another copy of the LexBot
+# directory (e.g. `git worktree add /tmp/base <commit>`) in a subprocess,
+# so the overhead of two versions can be compared side by side.
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+SOURCE_DIR = os.environ.get('BENCHMARK_SOURCE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, SOURCE_DIR)
+for name in ('STATE_TABLE_NAME', 'JOB_QUEUE_URL', 'PREFETCH_QUEUE_URL', 'RECORD_CASSETTES_URI', 'PROFILE_MODE'):
+    os.environ.pop(name, None)
+os.environ['AGENT_STUB'] = 'true'
+os.environ['STUB_TTFC_MS'] = '0'
+os.environ['STUB_CHUNK_INTERVAL_MS'] = '0'
+os.environ['METRICS_ENABLED'] = 'false'
+# repeated turns must run the handler, not return the stored response
+os.environ['IDEMPOTENCY_ENABLED'] = 'false'
+
+def lex_slot(value):
+    return {'shape': 'Scalar', 'value': {'originalValue': value, 'interpretedValue': value, 'resolvedValues': [value]}}
+
+def lex_event(intent, slots, attributes=None, text=''):
+    return {
+        'sessionId': 'benchmark',
+        'inputTranscript': text,
+        'sessionState': {
+            'intent': {'name': intent, 'slots': {k: lex_slot(v) for k, v in slots.items()}, 'state': 'InProgress', 'confirmationState': 'None'},
+            'sessionAttributes': dict(attributes or {}),
+            'originatingRequestId': 'benchmark',
+        },
+    }
+
+SCHOOL = {'InstituteTypeSlot': 'School', 'AnalyzeSchoolSlot': 'Bayan School', 'SchoolAspectSlot': 'Teaching, Learning and Assessment'}
+HISTORY = 'BQAIntent:BQASlot,AnalyzingIntent:InstituteTypeSlot,AnalyzingIntent:AnalyzeSchoolSlot'
+TURNS = {
+    'menu': lex_event('BQAIntent', {'BQASlot': 'Analyze'}),
+    'elicit': lex_event('AnalyzingIntent', {'InstituteTypeSlot': 'University', 'AnalyzeUniversitySlot': 'Program Review'}),
+    'compare': lex_event('ComparingIntent', {'InstituteCompareTypeSlot': 'School', 'CompareSchoolAspectlSlot': 'Teaching, Learning and Assessment'}),
+    'retry': lex_event('AnalyzingIntent', {'InstituteTypeSlot': 'School', 'AnalyzeSchoolSlot': 'back'}, {'retry': 'true', 'slotHistory': HISTORY}, 'back'),
+    'return': lex_event('OtherIntent', {'OtherQuestionsSlot': 'back'}, {'return': 'true', 'slotHistory': HISTORY}, 'back'),
+    'cached': lex_event('AnalyzingIntent', SCHOOL),
+}
+
+def run(iterations):
+    import intentAmazonLexFulfillment
+    handler = intentAmazonLexFulfillment.lambda_handler
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        # the first call fills the answer cache for the 'cached' turn
+        for event in TURNS.values():
+            handler(copy.deepcopy(event), None)
+        for kind, event in TURNS.items():
+            events = [copy.deepcopy(event) for _ in range(iterations)]
+            start = time.perf_counter()
+            for e in events:
+                handler(e, None)
+            results[kind] = (time.perf_counter() - start) / iterations * 1e6
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-turn overhead of lambda_handler")
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--compare', help="another LexBot directory to benchmark side by side")
+    parser.add_argument('--json', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    results = {'this': run(args.iterations)}
+    if args.compare:
+        env = dict(os.environ, BENCHMARK_SOURCE_DIR=os.path.abspath(args.compare))
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--iterations', str(args.iterations), '--json'],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        results['other'] = json.loads(output.strip().splitlines()[-1])['this']
+    if args.json:
+        print(json.dumps(results))
+        return
+
+    print("microseconds per turn")
+    print(f"  {'turn':<8} " + "  ".join(f"{name:>10}" for name in results))
+    for kind in TURNS:
+        print(f"  {kind:<8} " + "  ".join(f"{results[name][kind]:10.1f}" for name in results))
+
+if __name__ == '__main__':
+    main()
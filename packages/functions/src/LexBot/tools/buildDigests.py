@@ -0,0 +1,212 @@
+# Builds the per-institution, per-standard digests of the review reports
+# into the SQLite file read by Bedrock_Lex/digests.py.
+# The input is a local copy of the report text files and their metadata, as
+# written by the textract and metadata lambdas:
+#
+#   aws s3 sync s3://<report bucket>/TextFiles ./corpus
+#   python tools/buildDigests.py ./corpus --version 2024-06-01 --output digests.db
+#
+# Each report is split into the sections of its standards, and every section
+# is reduced to its judgement, strengths and recommendations. Digests of
+# the same institution and standard from several reports are merged, newest
+# reports first. Build time and digest sizes are printed at the end.
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Bedrock_Lex.digests import SCHEMA, institution_key, normalize
+from Bedrock_Lex.knowledgeBase import PROGRAMME_NAME, SCHOOL_NAME, UNIVERSITY_NAME, VOCATIONAL_NAME
+from Bedrock_Lex.slotValues import PROGRAMME_STANDARDS, SCHOOL_ASPECTS, UNIVERSITY_STANDARDS, VOCATIONAL_ASPECTS
+
+JUDGEMENTS = re.compile(
+    r"\b(Outstanding|Good|Satisfactory|Inadequate|Limited Confidence|No Confidence|Confidence"
+    r"|Does not Satisfy|Partially Satisfies|Satisfies|Not Addressed|Partially Addressed|Addressed)\b",
+    re.IGNORECASE,
+)
+STRENGTH_CUES = re.compile(r"\b(strength|strong|effective|commend|well[- ]|good practice|high|positive|successful)", re.IGNORECASE)
+RECOMMENDATION_CUES = re.compile(r"\b(recommend|should|need(s)? to|improve\b|develop\b|ensure|area(s)? for improvement|weak)", re.IGNORECASE)
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+STOP_WORDS = {'and', 'of', 'the', 'students', 'student'}
+MAX_ITEMS = 5
+MAX_SENTENCE_CHARS = 300
+
+def standards_for(metadata):
+    if metadata.get(SCHOOL_NAME):
+        return SCHOOL_ASPECTS
+    if metadata.get(VOCATIONAL_NAME):
+        return VOCATIONAL_ASPECTS
+    if metadata.get(PROGRAMME_NAME):
+        return PROGRAMME_STANDARDS
+    if metadata.get(UNIVERSITY_NAME):
+        return UNIVERSITY_STANDARDS
+    return ()
+
+def display_name(metadata):
+    if metadata.get(PROGRAMME_NAME):
+        return f"{metadata[PROGRAMME_NAME]} at {metadata.get(UNIVERSITY_NAME, '')}".strip()
+    for key in (SCHOOL_NAME, VOCATIONAL_NAME, UNIVERSITY_NAME):
+        if metadata.get(key):
+            return metadata[key]
+    return ""
+
+def heading_standard(line, standards):
+    # the standard whose words make up most of a short line, e.g. "Standard 2: Efficiency of the Programme"
+    # a sentence that mentions a standard is not a heading
+    if line.strip().endswith('.'):
+        return None
+    words = set(normalize(line).split())
+    best, best_score = None, 0.0
+    for standard in standards:
+        standard_words = normalize(standard).split()
+        if not words or len(words) > len(standard_words) + 4:
+            continue
+        wanted = set(standard_words) - STOP_WORDS
+        score = len(wanted & words) / len(wanted) if wanted else 0.0
+        if score > best_score:
+            best, best_score = standard, score
+    return best if best_score >= 0.75 else None
+
+def split_sections(text, standards):
+    sections = {}
+    current = None
+    for line in text.splitlines():
+        standard = heading_standard(line, standards)
+        if standard is not None:
+            current = standard
+            sections.setdefault(current, [])
+            continue
+        if current is not None and line.strip():
+            sections[current].append(line.strip())
+    return {standard: " ".join(lines) for standard, lines in sections.items()}
+
+def digest_section(text):
+    judgement = None
+    strengths, recommendations = [], []
+    for sentence in SENTENCE_END.split(text):
+        sentence = sentence.strip()[:MAX_SENTENCE_CHARS]
+        if not sentence:
+            continue
+        if judgement is None:
+            match = JUDGEMENTS.search(sentence)
+            if match:
+                # the judgement sentence itself is neither a strength nor a recommendation
+                judgement = match.group(1).title()
+                continue
+        if RECOMMENDATION_CUES.search(sentence):
+            recommendations.append(sentence)
+        elif STRENGTH_CUES.search(sentence):
+            strengths.append(sentence)
+    return judgement, strengths, recommendations
+
+def read_metadata(text_path):
+    base = text_path[:-len('.txt')]
+    for path in (text_path + '.metadata.json', base + '.metadata.json'):
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f).get('metadata', {})
+    return None
+
+def merge(items, new_items):
+    seen = {normalize(item) for item in items}
+    for item in new_items:
+        if len(items) >= MAX_ITEMS:
+            break
+        if normalize(item) not in seen:
+            seen.add(normalize(item))
+            items.append(item)
+
+def render(judgement, strengths, recommendations):
+    lines = [f"Judgement: {judgement or 'not stated'}"]
+    if strengths:
+        lines += ["Strengths:"] + [f"- {item}" for item in strengths]
+    if recommendations:
+        lines += ["Recommendations:"] + [f"- {item}" for item in recommendations]
+    return "\n".join(lines)
+
+def build(corpus_dir):
+    # returns ({(institution, standard): digest}, skipped report count)
+    reports = []
+    skipped = 0
+    for text_path in sorted(glob.glob(os.path.join(corpus_dir, '**', '*.txt'), recursive=True)):
+        metadata = read_metadata(text_path)
+        if not metadata or not standards_for(metadata):
+            skipped += 1
+            continue
+        reports.append((metadata.get('dateOfReview') or '', text_path, metadata))
+    # newest reports first, their judgement is the one kept
+    reports.sort(key=lambda report: parse_year(report[0]), reverse=True)
+
+    digests = {}
+    for _, text_path, metadata in reports:
+        with open(text_path, encoding='utf-8', errors='replace') as f:
+            sections = split_sections(f.read(), standards_for(metadata))
+        for standard, text in sections.items():
+            judgement, strengths, recommendations = digest_section(text)
+            key = (institution_key(metadata), normalize(standard))
+            digest = digests.setdefault(key, {
+                'name': display_name(metadata), 'judgement': None, 'strengths': [], 'recommendations': [], 'sources': [],
+            })
+            digest['judgement'] = digest['judgement'] or judgement
+            merge(digest['strengths'], strengths)
+            merge(digest['recommendations'], recommendations)
+            digest['sources'].append(os.path.relpath(text_path, corpus_dir))
+    return digests, skipped
+
+def parse_year(date_text):
+    years = re.findall(r"\b(?:19|20)\d\d\b", date_text)
+    return max(years) if years else ''
+
+def write(path, digests, version, build_seconds):
+    if os.path.exists(path):
+        os.remove(path)
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    total_chars = 0
+    for (institution, standard), digest in digests.items():
+        text = render(digest['judgement'], digest['strengths'], digest['recommendations'])
+        total_chars += len(text)
+        connection.execute(
+            "INSERT INTO digests (institution, standard, name, judgement, text, sources) VALUES (?, ?, ?, ?, ?, ?)",
+            (institution, standard, digest['name'], digest['judgement'], text, json.dumps(digest['sources'])),
+        )
+    meta = {
+        'version': version,
+        'builtAt': str(time.time()),
+        'buildSeconds': f"{build_seconds:.3f}",
+        'digests': str(len(digests)),
+        'textChars': str(total_chars),
+    }
+    connection.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", meta.items())
+    connection.commit()
+    connection.execute("VACUUM")
+    connection.close()
+    return total_chars
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the review report digests")
+    parser.add_argument('corpus', help="directory with the report .txt files and their .metadata.json files")
+    parser.add_argument('--version', required=True)
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'digests.db'))
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    digests, skipped = build(args.corpus)
+    build_seconds = time.perf_counter() - start
+    total_chars = write(args.output, digests, args.version, build_seconds)
+    institutions = {institution for institution, _ in digests}
+
+    print(f"digests {args.version}: {len(digests)} digests of {len(institutions)} institutions, {skipped} reports skipped (no metadata)")
+    print(f"  build time: {build_seconds:.2f} s (+ {time.perf_counter() - start - build_seconds:.2f} s to write)")
+    if digests:
+        print(f"  digest text: {total_chars / 1024:.1f} KiB, {total_chars / len(digests):.0f} characters per digest")
+    print(f"  file: {args.output} ({os.path.getsize(args.output) / 1024:.1f} KiB)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# Writes the bundled prompts as a prompt catalog, the starting point for
+# editing the templates without a redeploy (see Bedrock_Lex/promptCatalog.py).
+#
+#   python tools/exportPromptCatalog.py catalog.json --version 2024-06-01
+#   aws s3 cp catalog.json s3://<prompt catalog bucket>/prompts/catalog.json
+#
+# Every argument without a default becomes a {field}; derived fields (the
+# question of the school comparison) are put back as their own {field}.
+import argparse
+import inspect
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# export what is bundled, not what a catalog currently overrides
+os.environ.pop('PROMPT_CATALOG_URI', None)
+
+from Bedrock_Lex import prompts
+
+def export_template(render):
+    arguments = {}
+    for name, parameter in inspect.signature(render.bundled).parameters.items():
+        arguments[name] = "{" + name + "}" if parameter.default is inspect.Parameter.empty else parameter.default
+    text = render.bundled(**arguments)
+    for field, derive in render.derived.items():
+        text = text.replace(derive(**arguments), "{" + field + "}")
+    return text
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the bundled prompts as a prompt catalog")
+    parser.add_argument('output')
+    parser.add_argument('--version', required=True)
+    args = parser.parse_args()
+
+    templates = {}
+    for name, value in vars(prompts).items():
+        if callable(value) and hasattr(value, 'bundled'):
+            templates[name] = export_template(value)
+    with open(args.output, 'w') as f:
+        json.dump({'version': args.version, 'templates': templates}, f, indent=2)
+    print(f"Wrote {len(templates)} templates to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+# Multi-turn load driver for the fulfillment handler.
+# Simulates many concurrent chat sessions against lambda_handler with the
+# stubbed agent. Each session plays the Lex side of the conversation: it keeps
+# the intent, slots and sessionAttributes between turns, answers every slot
+# the handler elicits and, after an answer, picks a follow-up question,
+# 'more', 'retry', 'return' or ends the conversation.
+#
+#   python tools/loadDriver.py --sessions 2000 --think-ms 500 \
+#       --mix other=0.35,more=0.1,retry=0.1,return=0.2,end=0.25
+#
+# Agent timing comes from STUB_TTFC_MS / STUB_CHUNK_INTERVAL_MS / STUB_CHUNKS,
+# KB_FULFILLMENT=true sends the steps that support it to the stubbed knowledge base,
+# DIGEST_FULFILLMENT=true (with a DIGEST_DB_PATH) to the stubbed digest model.
+# --typed-share is the share of conversations that type their first question
+# instead of clicking through the buttons; turns and time to the first answer
+# are reported for both.
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+for name in ('STATE_TABLE_NAME', 'JOB_QUEUE_URL', 'RECORD_CASSETTES_URI'):
+    os.environ.pop(name, None)
+os.environ['AGENT_STUB'] = 'true'
+os.environ['KB_STUB'] = 'true'
+os.environ['DIGEST_STUB'] = 'true'
+os.environ.setdefault('METRICS_ENABLED', 'false')
+
+import intentAmazonLexFulfillment
+from Bedrock_Lex.admission import QUOTA_MESSAGE, SHED_MESSAGE
+from Bedrock_Lex.slotValues import SLOT_OPTIONS
+from Bedrock_Lex.stores import MemoryStore, set_store
+
+SAMPLE_VALUES = {
+    'AnalyzeSchoolSlot': ('Ibn Khuldoon National School', 'Al Noor International School', 'Bayan School', 'Riffa Views International School'),
+    'AnalyzeVocationalSlot': ('Bahrain Institute of Banking and Finance', 'Gulf Academy', 'Bahrain Training Institute'),
+    'AnalyzeUniversityNameSlot': ('University of Bahrain', 'Bahrain Polytechnic', 'Arab Open University', 'Royal University for Women'),
+    'UniNameSlot': ('University of Bahrain', 'Applied Science University', 'AMA International University'),
+    'ProgramNameSlot': ('Bachelor of Business Administration', 'Bachelor in Information Technology', 'Bachelor of Law'),
+    'CompareUniversityUniSlot': ('University of Bahrain, Bahrain Polytechnic', 'Arab Open University, Royal University for Women, Applied Science University'),
+    'CompareUniversityWprogSlot': ('Bachelor of Business Administration, Bachelor of Accounting',),
+    'CompareUniversityWprogUniversityNameSlot': ('University of Bahrain, Applied Science University',),
+    'CompareSpecificInstitutesSlot': ('Ibn Khuldoon National School, Bayan School', 'Al Noor International School, Riffa Views International School, Bayan School'),
+    'CompareVocationalSlot': ('Gulf Academy, Bahrain Training Institute',),
+}
+FOLLOWUP_QUESTIONS = (
+    "What should they focus on next year?",
+    "How does that compare with last year?",
+    "Which of these areas improved the most?",
+    "Can you summarise the key recommendations?",
+)
+# first questions typed at the main menu
+TYPED_QUESTIONS = (
+    "compare Bahrain Polytechnic and AOU on quality of teaching",
+    "How did Ibn Khuldoon National School do in terms of teaching, learning and assessment?",
+    "analyze Bahrain Training Institute on learners engagement",
+    "compare Gulf Academy and Bahrain Training Institute on leadership and management",
+    "compare Ibn Khuldoon National School and Bayan School on academic achievement",
+    "how is University of Bahrain on student support",
+    "compare all government schools on governance",
+    "compare University of Bahrain and Bahrain Polytechnic",
+    "analyze the Bachelor of Law at University of Bahrain on the learning programme",
+    "compare Bachelor of Business Administration and Bachelor of Accounting at UoB and ASU on efficiency of the programme",
+)
+DEFAULT_MIX = "other=0.35,more=0.1,retry=0.1,return=0.2,end=0.25"
+
+def lex_slot(value):
+    return {'shape': 'Scalar', 'value': {'originalValue': value, 'interpretedValue': value, 'resolvedValues': [value]}}
+
+
+class LexSession:
+    # the Lex side of one conversation
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.intent = 'BQAIntent'
+        self.slots = {}
+        self.attributes = {}
+        self.slot_to_elicit = None
+
+    def event(self, text, extra_attributes=None):
+        slots = copy.deepcopy(self.slots)
+        # like Lex, the text fills the elicited slot (also "back" on retry/return turns)
+        if self.slot_to_elicit is not None:
+            slots[self.slot_to_elicit] = lex_slot(text)
+        attributes = dict(self.attributes)
+        attributes.update(extra_attributes or {})
+        return {
+            'sessionId': self.session_id,
+            'inputTranscript': text,
+            'sessionState': {
+                'intent': {'name': self.intent, 'slots': slots, 'state': 'InProgress', 'confirmationState': 'None'},
+                'sessionAttributes': attributes,
+                'originatingRequestId': str(uuid.uuid4()),
+            },
+        }
+
+    def apply(self, response):
+        state = response['sessionState']
+        self.attributes = dict(state.get('sessionAttributes') or self.attributes)
+        self.intent = state['intent']['name']
+        self.slots = copy.deepcopy(state['intent'].get('slots') or {})
+        dialog_action = state['dialogAction']
+        self.slot_to_elicit = dialog_action.get('slotToElicit') if dialog_action['type'] == 'ElicitSlot' else None
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.latencies_by_kind = {}
+        self.attribute_sizes = {}
+        self.latencies_by_turn = {}
+        self.errors = 0
+        self.shed = 0
+        self.conversations = 0
+        # opening ('buttons' or 'typed') -> [(turns, ms)] until the first answer
+        self.first_answers = {}
+
+    def add_turn(self, kind, turn_index, latency_ms, attribute_size, shed):
+        with self.lock:
+            self.latencies.append(latency_ms)
+            self.latencies_by_kind.setdefault(kind, []).append(latency_ms)
+            self.attribute_sizes.setdefault(turn_index, []).append(attribute_size)
+            self.latencies_by_turn.setdefault(turn_index, []).append(latency_ms)
+            if shed:
+                self.shed += 1
+
+    def add_first_answer(self, opening, turns, elapsed_ms):
+        with self.lock:
+            self.first_answers.setdefault(opening, []).append((turns, elapsed_ms))
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, weight = part.split('=')
+        mix[name.strip()] = float(weight)
+    return mix
+
+def choose_next_turn(session, rng, mix, answered):
+    # returns (kind, text, extra session attributes) or None to end the conversation
+    slot = session.slot_to_elicit
+    if slot is None:
+        return None
+    if slot == 'OtherQuestionsSlot':
+        if not answered:
+            return 'other', rng.choice(FOLLOWUP_QUESTIONS), None
+        kinds = list(mix)
+        kind = rng.choices(kinds, weights=[mix[k] for k in kinds])[0]
+        if kind == 'more' and session.attributes.get('moreAvailable') != 'true':
+            kind = 'other'
+        if kind == 'end':
+            return None
+        if kind == 'other':
+            return 'other', rng.choice(FOLLOWUP_QUESTIONS), None
+        if kind == 'more':
+            return 'more', 'more', None
+        # the chat frontend sends "back" with the retry/return session attribute
+        return kind, 'back', {kind: 'true'}
+    if slot in SLOT_OPTIONS:
+        return 'elicit', rng.choice(SLOT_OPTIONS[slot]), None
+    return 'elicit', rng.choice(SAMPLE_VALUES.get(slot, ('Test Institute',))), None
+
+def run_conversation(session_index, args, mix, results, deadline):
+    rng = random.Random(args.seed + session_index)
+    while time.monotonic() < deadline:
+        session = LexSession(f"load-{session_index}-{uuid.uuid4().hex[:8]}")
+        # like the chat frontend, a conversation opens by returning to the menu
+        turn = ('start', 'back', {'return': 'true'})
+        answered = False
+        typed = args.typed_share > 0 and rng.random() < args.typed_share
+        conversation_start = time.perf_counter()
+        for turn_index in range(args.max_turns):
+            kind, text, extra = turn
+            event = session.event(text, extra)
+            start = time.perf_counter()
+            try:
+                response = intentAmazonLexFulfillment.lambda_handler(event, None)
+            except Exception:
+                with results.lock:
+                    results.errors += 1
+                break
+            latency_ms = (time.perf_counter() - start) * 1000
+            session.apply(response)
+            contents = [m.get('content') for m in response.get('messages') or []]
+            results.add_turn(kind, turn_index, latency_ms, len(json.dumps(session.attributes)),
+                             SHED_MESSAGE in contents or QUOTA_MESSAGE in contents)
+            # an answer is a follow-up prompt that carries messages
+            if session.slot_to_elicit == 'OtherQuestionsSlot' and contents and kind != 'start':
+                if not answered:
+                    # the user's turns, without the frontend's opening one
+                    results.add_first_answer('typed' if typed else 'buttons', turn_index,
+                                             (time.perf_counter() - conversation_start) * 1000)
+                answered = True
+            turn = choose_next_turn(session, rng, mix, answered)
+            if typed and kind == 'start' and session.slot_to_elicit == 'BQASlot':
+                turn = ('typed', rng.choice(TYPED_QUESTIONS), None)
+            if turn is None:
+                break
+            time.sleep(rng.expovariate(1000 / args.think_ms) if args.think_ms > 0 else 0)
+        with results.lock:
+            results.conversations += 1
+        if not args.repeat:
+            break
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] if ordered else 0
+
+def report(results, wall_seconds):
+    turns = len(results.latencies)
+    print(f"{results.conversations} conversations, {turns} turns in {wall_seconds:.1f} s: {turns / wall_seconds:.1f} turns/s")
+    print(f"errors {results.errors}, shed or over quota {results.shed}")
+    print(f"turn latency ms: p50 {percentile(results.latencies, 50):.1f}  p90 {percentile(results.latencies, 90):.1f}  "
+          f"p99 {percentile(results.latencies, 99):.1f}  max {max(results.latencies, default=0):.1f}")
+    for kind, values in sorted(results.latencies_by_kind.items()):
+        print(f"  {kind:<8} n={len(values):<7} p50 {percentile(values, 50):8.1f}  p95 {percentile(values, 95):8.1f}")
+    print("by turn number:  turn  attributes mean/max (bytes)  latency p50/p95 (ms)")
+    for turn_index, sizes in sorted(results.attribute_sizes.items()):
+        latencies = results.latencies_by_turn[turn_index]
+        print(f"  {turn_index + 1:>4}  {sum(sizes) / len(sizes):8.0f} {max(sizes):6d}  "
+              f"{percentile(latencies, 50):10.1f} {percentile(latencies, 95):8.1f}")
+    print("to the first answer:  opening  conversations  turns mean  time p50/p95 (ms, with think time)")
+    for opening, answers in sorted(results.first_answers.items()):
+        turns = [t for t, _ in answers]
+        times = [ms for _, ms in answers]
+        print(f"  {opening:<8} {len(answers):>8}  {sum(turns) / len(turns):10.2f}  "
+              f"{percentile(times, 50):10.1f} {percentile(times, 95):8.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-turn load driver for lambda_handler with the stubbed agent")
+    parser.add_argument('--sessions', type=int, default=1000, help="concurrent sessions")
+    parser.add_argument('--duration', type=float, default=60, help="seconds to run for")
+    parser.add_argument('--think-ms', type=float, default=500, help="mean think time between turns")
+    parser.add_argument('--max-turns', type=int, default=15, help="turns per conversation at most")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="weights of what happens after an answer")
+    parser.add_argument('--repeat', action='store_true', help="start a new conversation when one ends")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--typed-share', type=float, default=0, help="share of conversations that type their first question")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    set_store(MemoryStore())
+    results = Results()
+    # thousands of mostly sleeping threads, keep their stacks small
+    threading.stack_size(512 * 1024)
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    start = time.monotonic()
+    deadline = start + args.duration
+    threads = [
+        threading.Thread(target=run_conversation, args=(i, args, mix, results, deadline), daemon=True)
+        for i in range(args.sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.monotonic() - start
+    sys.stdout = real_stdout
+    report(results, wall_seconds)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+# Replays cassettes recorded by Bedrock_Lex/recorder.py through lambda_handler,
+# fully offline: the agent is replaced by the recorded completion streams.
+#
+#   python tools/replay.py /path/to/cassettes [more cassettes or dirs] [--timing] [--speed 2]
+#
+# Cassettes recorded on Lambda are in S3 (RECORD_CASSETTES_URI), fetch them first:
+#   aws s3 sync s3://<cassette bucket>/cassettes ./cassettes
+#
+# --timing keeps the original chunk timing (divided by --speed), so latency
+# regressions can be reproduced against real traffic shapes.
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# a replay must never reach AWS or write new cassettes
+for name in ('STATE_TABLE_NAME', 'JOB_QUEUE_URL', 'RECORD_CASSETTES_URI'):
+    os.environ.pop(name, None)
+os.environ['ASYNC_FULFILLMENT'] = 'false'
+os.environ['HEDGING_ENABLED'] = 'false'
+# cassettes hold the completion chunks only
+os.environ['AGENT_TRACE_SAMPLE_RATE'] = '0'
+os.environ.setdefault('METRICS_ENABLED', 'false')
+
+import intentAmazonLexFulfillment
+from Bedrock_Lex.answerCache import cache_key
+from Bedrock_Lex.invokeBedrockAgent import set_transport
+from Bedrock_Lex.recorder import scrub_text
+from Bedrock_Lex.stores import MemoryStore, get_store, set_store
+
+
+class CassetteAgent:
+    def __init__(self, agent_calls, timing=False, speed=1.0):
+        self.agent_calls = list(agent_calls)
+        self.timing = timing
+        self.speed = speed
+        # calls the cassette has no recording for, the turn is reported as different
+        self.missing = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, agent_id, agent_alias_id, session_id, prompt, region):
+        call = self.take(prompt)
+        if call is None:
+            self.missing += 1
+            return iter(())
+        return self.events(call['chunks'])
+
+    def take(self, prompt):
+        # the recorded call with the same prompt (full report sections run
+        # concurrently, in any order), otherwise the next one
+        with self.lock:
+            if not self.agent_calls:
+                return None
+            prompt = scrub_text(prompt)
+            for i, call in enumerate(self.agent_calls):
+                if call['prompt'] == prompt:
+                    return self.agent_calls.pop(i)
+            return self.agent_calls.pop(0)
+
+    def events(self, chunks):
+        start = time.perf_counter()
+        for offset_ms, text in chunks:
+            if self.timing:
+                wait = offset_ms / 1000 / self.speed - (time.perf_counter() - start)
+                if wait > 0:
+                    time.sleep(wait)
+            yield {'chunk': {'bytes': text.encode()}}
+
+
+def find_cassettes(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, '*.json')))
+        else:
+            files.append(path)
+    # file names start with the recording time, so turns replay in order
+    return sorted(files, key=os.path.basename)
+
+def messages_of(response):
+    # recorded responses are scrubbed, so is the replayed one before comparing
+    return [scrub_text(m.get('content')) for m in (response or {}).get('messages') or []]
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+def seed_answer_cache(cached_answers):
+    # the answers the recorded turn read from the answer cache, as old as they were then
+    now = time.time()
+    for cached in cached_answers:
+        get_store().put(f"answer:{cache_key(cached['prompt'])}", {'answer': cached['answer'], 'storedAt': now - cached['ageSeconds']})
+
+def replay(files, timing=False, speed=1.0, quiet=False):
+    set_store(MemoryStore())
+    durations = []
+    mismatches = 0
+    for path in files:
+        with open(path) as f:
+            cassette = json.load(f)
+        seed_answer_cache(cassette.get('cachedAnswers', []))
+        agent = CassetteAgent(cassette['agentCalls'], timing, speed)
+        set_transport(agent)
+        start = time.perf_counter()
+        response = intentAmazonLexFulfillment.lambda_handler(cassette['event'], None)
+        duration = (time.perf_counter() - start) * 1000
+        durations.append(duration)
+        matches = agent.missing == 0 and messages_of(response) == messages_of(cassette.get('response'))
+        if not matches:
+            mismatches += 1
+        if not quiet:
+            outcome = 'ok' if matches else 'NO RECORDED AGENT CALL' if agent.missing else 'DIFFERENT RESPONSE'
+            print(f"{os.path.basename(path)}: {duration:.1f} ms (recorded {cassette.get('durationMs', 0):.1f} ms) {outcome}")
+    set_transport(None)
+    return durations, mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Lex conversations offline")
+    parser.add_argument('paths', nargs='+', help="cassette files or directories")
+    parser.add_argument('--timing', action='store_true', help="keep the recorded chunk timing")
+    parser.add_argument('--speed', type=float, default=1.0, help="speed up recorded timing by this factor")
+    parser.add_argument('--quiet', action='store_true', help="only print the summary")
+    args = parser.parse_args()
+
+    files = find_cassettes(args.paths)
+    if not files:
+        sys.exit("No cassettes found")
+    # the handler prints a lot, keep the report readable
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w') if args.quiet else real_stdout
+    durations, mismatches = replay(files, args.timing, args.speed, args.quiet)
+    sys.stdout = real_stdout
+    print(f"Replayed {len(files)} turns, {mismatches} with a different response")
+    print(f"latency p50 {percentile(durations, 50):.1f} ms, p95 {percentile(durations, 95):.1f} ms, max {max(durations):.1f} ms")
+
+if __name__ == '__main__':
+    main()
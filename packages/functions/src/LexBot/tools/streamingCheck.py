@@ -0,0 +1,115 @@
+# Compares the streaming HTTP entry point (streamingHandler.py) with the Lex
+# lambda_handler against the stubbed agent, fully offline.
+# Every turn is an Analyze question typed at the main menu, with a new
+# institution each time so no answer comes from the answer cache. It reports
+# the time to the first byte the user sees: the whole answer for
+# lambda_handler, the first agent chunk for the streaming handler.
+#
+#   python tools/streamingCheck.py --turns 5 --read-delay-ms 200
+#
+# --read-delay-ms makes the client read slowly, the agent stream then takes
+# as long as the client needs to read it (backpressure) instead of finishing
+# into an unbounded buffer.
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+for name in ('STATE_TABLE_NAME', 'JOB_QUEUE_URL', 'RECORD_CASSETTES_URI'):
+    os.environ.pop(name, None)
+os.environ['AGENT_STUB'] = 'true'
+os.environ['ASYNC_FULFILLMENT'] = 'false'
+os.environ['HEDGING_ENABLED'] = 'false'
+os.environ.setdefault('METRICS_ENABLED', 'false')
+
+import intentAmazonLexFulfillment
+import streamingHandler
+from Bedrock_Lex.stores import MemoryStore, set_store
+
+def typed_question_event(index):
+    question = f"how did Test School {index} do on teaching, learning and assessment"
+    return {
+        'sessionId': f"streaming-check-{uuid.uuid4().hex[:8]}",
+        'inputTranscript': question,
+        'sessionState': {
+            'intent': {'name': 'BQAIntent', 'slots': {}, 'state': 'InProgress', 'confirmationState': 'None'},
+            'sessionAttributes': {},
+            'originatingRequestId': str(uuid.uuid4()),
+        },
+    }
+
+def run_lambda_turn(event):
+    start = time.perf_counter()
+    response = intentAmazonLexFulfillment.lambda_handler(event, None)
+    total_ms = (time.perf_counter() - start) * 1000
+    # nothing reaches the user before the whole response
+    return {'firstByteMs': total_ms, 'totalMs': total_ms, 'chunks': 0, 'answered': bool(response.get('messages'))}
+
+def run_streaming_turn(port, event, read_delay_ms):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    body = json.dumps(event)
+    start = time.perf_counter()
+    connection.request('POST', '/turn', body, {'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    first_byte_ms = None
+    chunks = 0
+    answered = False
+    while True:
+        line = response.readline()
+        if not line:
+            break
+        if first_byte_ms is None:
+            first_byte_ms = (time.perf_counter() - start) * 1000
+        message = json.loads(line)
+        if message['type'] == 'chunk':
+            chunks += 1
+            if read_delay_ms > 0:
+                time.sleep(read_delay_ms / 1000)
+        elif message['type'] == 'response':
+            answered = bool(message['response'].get('messages'))
+    total_ms = (time.perf_counter() - start) * 1000
+    connection.close()
+    return {'firstByteMs': first_byte_ms, 'totalMs': total_ms, 'chunks': chunks, 'answered': answered}
+
+def summarize(name, results):
+    first = sorted(r['firstByteMs'] for r in results)
+    total = sorted(r['totalMs'] for r in results)
+    answered = sum(r['answered'] for r in results)
+    chunks = sum(r['chunks'] for r in results) / len(results)
+    print(f"  {name:<10} first byte p50 {first[len(first) // 2]:8.1f} ms  max {first[-1]:8.1f}  "
+          f"whole answer p50 {total[len(total) // 2]:8.1f} ms  max {total[-1]:8.1f}  "
+          f"chunks {chunks:4.1f}  answered {answered}/{len(results)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Time to first byte of the streaming handler against lambda_handler, stubbed agent")
+    parser.add_argument('--turns', type=int, default=5)
+    parser.add_argument('--read-delay-ms', type=float, default=0, help="client pause after every chunk")
+    args = parser.parse_args()
+
+    set_store(MemoryStore())
+    server = streamingHandler.create_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        lambda_results = [run_lambda_turn(typed_question_event(i)) for i in range(args.turns)]
+        streaming_results = [run_streaming_turn(port, typed_question_event(args.turns + i), args.read_delay_ms) for i in range(args.turns)]
+    finally:
+        sys.stdout = real_stdout
+        server.shutdown()
+
+    print(f"{args.turns} answered turns each, stub time to first chunk {os.getenv('STUB_TTFC_MS', '800')} ms, "
+          f"{os.getenv('STUB_CHUNKS', '12')} chunks {os.getenv('STUB_CHUNK_INTERVAL_MS', '40')} ms apart, "
+          f"client read delay {args.read_delay_ms:g} ms")
+    summarize('lambda', lambda_results)
+    summarize('streaming', streaming_results)
+
+if __name__ == '__main__':
+    main()
@@ -55,10 +55,11 @@ export function BedrockStack({ stack, app }: StackContext) {
       ]
     }));
 
-    // allow the invokeModel operation for the role
+    // allow the invokeModel operation for the role, streamed for the agent's streamed final response
     amazonBedrockExecutionRoleForAgents.addToPolicy(new iam.PolicyStatement({
       actions: [
-        "bedrock:InvokeModel"
+        "bedrock:InvokeModel",
+        "bedrock:InvokeModelWithResponseStream"
       ],
       resources: ["arn:aws:bedrock:us-east-1::foundation-model/anthropic.claude-3-sonnet-20240229-v1:0"]
     }));
@@ -1,9 +1,10 @@
 // Import necessary AWS CDK and SST constructs
-import { Function, Bucket, Queue, StackContext, use } from "sst/constructs";
+import { Function, Bucket, Queue, StackContext, Table, use } from "sst/constructs";
 import * as cdk from "aws-cdk-lib";
 import { aws_lambda as lambda } from 'aws-cdk-lib';
 import { ServicePrincipal } from 'aws-cdk-lib/aws-iam';
-import { Duration, aws_iam as iam } from "aws-cdk-lib";
+import { Duration, aws_events as events, aws_events_targets as targets, aws_iam as iam, aws_sqs as sqs } from "aws-cdk-lib";
+import { SqsEventSource } from 'aws-cdk-lib/aws-lambda-event-sources';
 import {
     LexCustomResource,
     LexBotDefinition,
@@ -189,6 +190,10 @@ export function BotStack({stack}: StackContext) {
                                     {
                                         text: "Program Review",
                                         value: "Program Review"
+                                    },
+                                    {
+                                        text: "Full Report",
+                                        value: "Full Report"
                                     }
                                 ]
                             }
@@ -402,6 +407,10 @@ export function BotStack({stack}: StackContext) {
                                         text: "Leadership, Management and Governance",
                                         value: "Leadership, Management and Governance"
                                     },
+                                    {
+                                        text: "Full Report",
+                                        value: "Full Report"
+                                    },
                                 ]
                             }
                         }
@@ -459,6 +468,10 @@ export function BotStack({stack}: StackContext) {
                                     {
                                         text: "Leadership and Management",
                                         value: "Leadership and Management"
+                                    },
+                                    {
+                                        text: "Full Report",
+                                        value: "Full Report"
                                     }
                                 ]
                             }
@@ -945,6 +958,72 @@ export function BotStack({stack}: StackContext) {
     }
     const fulfillmentPrincipal = new ServicePrincipal('lex.amazonaws.com')
 
+    // Table for fulfillment state that outlives a single turn (e.g. the rest of long answers)
+    const fulfillmentStateTable = new Table(stack, 'FulfillmentState', {
+        fields: {
+            pk: "string",
+        },
+        primaryIndex: { partitionKey: "pk" },
+        timeToLiveAttribute: "expiresAt",
+    });
+
+    // Queue for asynchronous fulfillment jobs (used when ASYNC_FULFILLMENT is "true")
+    const fulfillmentJobQueue = new sqs.Queue(stack, 'Fulfillment-Job-Queue', {
+        visibilityTimeout: Duration.seconds(360),
+    });
+
+    // Queue for background answer cache fills: prefetches (PREFETCH_ENABLED) and stale answer refreshes
+    const fulfillmentPrefetchQueue = new sqs.Queue(stack, 'Fulfillment-Prefetch-Queue', {
+        visibilityTimeout: Duration.seconds(360),
+        retentionPeriod: Duration.minutes(5),
+    });
+
+    // Worker that runs queued prompts against the agent and stores the answers
+    const fulfillmentWorker = new lambda.Function(stack, 'Fulfillment-Worker-Lambda', {
+        functionName: stack.stage + '-fulfillment-worker-for-lex-bot',
+        runtime: lambda.Runtime.PYTHON_3_11,
+        handler: 'intentAmazonLexFulfillment.job_worker_handler',
+        memorySize: 512,
+        timeout: Duration.seconds(300),
+        code: lambda.Code.fromAsset('packages/functions/src/LexBot/'),
+        environment: {
+            agentId: cfnAgent.attrAgentId,
+            agentAliasId: cfnAgentAlias.attrAgentAliasId,
+            STATE_TABLE_NAME: fulfillmentStateTable.tableName,
+        },
+    });
+    fulfillmentWorker.addEventSource(new SqsEventSource(fulfillmentJobQueue, { batchSize: 1 }));
+    // cache fills are optional work, a few at a time is enough
+    fulfillmentWorker.addEventSource(new SqsEventSource(fulfillmentPrefetchQueue, { batchSize: 1, maxConcurrency: 2 }));
+    fulfillmentStateTable.cdk.table.grantReadWriteData(fulfillmentWorker);
+    fulfillmentWorker.addToRolePolicy(new iam.PolicyStatement(
+        {
+            effect: iam.Effect.ALLOW,
+            actions: [
+                "bedrock:InvokeAgent",
+            ],
+            resources: ["*"]
+        }
+    ))
+
+    // Versioned bucket for the prompt catalog, prompts can be changed there without a redeploy
+    const promptCatalogBucket = new Bucket(stack, 'PromptCatalog', {
+        cdk: {
+            bucket: {
+                versioned: true,
+            },
+        },
+    });
+
+    // Recorded conversations for tools/replay.py, already scrubbed, kept for a month
+    const cassetteBucket = new Bucket(stack, 'Cassettes', {
+        cdk: {
+            bucket: {
+                lifecycleRules: [{ expiration: Duration.days(30) }],
+            },
+        },
+    });
+
     // Create and configure the Lambda function for bot fulfillment
     const fulfillmentFunction = new lambda.Function(stack, 'Fulfillment-Lambda', {
         functionName: stack.stage + '-fulfillment-lambda-for-lex-bot',
@@ -958,9 +1037,39 @@ export function BotStack({stack}: StackContext) {
             agentId: cfnAgent.attrAgentId,
             agentAliasId: cfnAgentAlias.attrAgentAliasId,
             KNOWLEDGEBASE_ID: cfnKnowledgeBase.attrKnowledgeBaseId,
+            STATE_TABLE_NAME: fulfillmentStateTable.tableName,
+            ASYNC_FULFILLMENT: "false",
+            KB_FULFILLMENT: "false",
+            // answer single-institution Analyze questions from digests.db (tools/buildDigests.py) when it is bundled
+            DIGEST_FULFILLMENT: "false",
+            JOB_QUEUE_URL: fulfillmentJobQueue.queueUrl,
+            PREFETCH_ENABLED: "false",
+            PREFETCH_QUEUE_URL: fulfillmentPrefetchQueue.queueUrl,
+            // stop reading the agent stream before the 60 second Lambda timeout
+            AGENT_STREAM_MAX_MS: "50000",
+            // share of agent calls that request a trace for the latency breakdown
+            AGENT_TRACE_SAMPLE_RATE: "0",
+            // the bundled prompts are used until a catalog is uploaded (tools/exportPromptCatalog.py)
+            PROMPT_CATALOG_URI: `s3://${promptCatalogBucket.bucketName}/prompts/catalog.json`,
+            // raise the sample rate to record a share of turns for replay
+            RECORD_CASSETTES_URI: `s3://${cassetteBucket.bucketName}/cassettes`,
+            RECORD_SAMPLE_RATE: "0",
         },
         
     }); 
+    fulfillmentStateTable.cdk.table.grantReadWriteData(fulfillmentFunction);
+    fulfillmentJobQueue.grantSendMessages(fulfillmentFunction);
+    fulfillmentPrefetchQueue.grantSendMessages(fulfillmentFunction);
+    promptCatalogBucket.cdk.bucket.grantRead(fulfillmentFunction);
+    cassetteBucket.cdk.bucket.grantPut(fulfillmentFunction);
+
+    // Warmup pings keep a container initialized, they never reach the agent
+    new events.Rule(stack, 'Fulfillment-Warmup-Rule', {
+        schedule: events.Schedule.rate(Duration.minutes(5)),
+        targets: [new targets.LambdaFunction(fulfillmentFunction, {
+            event: events.RuleTargetInput.fromObject({ warmup: true }),
+        })],
+    });
 
     // Add IAM permissions for Bedrock model invocation
     fulfillmentFunction.addToRolePolicy(new iam.PolicyStatement(